@@ -22,6 +22,22 @@ class KeyDataset(BaseDataset):
         annoLst = os.path.join(opt.dataroot, opt.dataset, opt.annoLst)
         self.init_categories(pairLst, annoLst)
         self.transform = get_transform(opt)
+        self.init_pose_store()
+
+    def init_pose_store(self):
+        # keypoint maps packed by tool/generate_pose_map.py --packed, used when there is no per image folder
+        self.K_index, self.K_store = None, None
+        if not os.path.isdir(self.dir_K) and os.path.exists(self.dir_K + '.npy'):
+            with open(self.dir_K + '_names.txt') as f:
+                self.K_index = {name: i for i, name in enumerate(f.read().splitlines())}
+
+    def load_BP(self, name):
+        if self.K_index is not None:
+            # opened lazily so that every dataloader worker maps the store itself
+            if self.K_store is None:
+                self.K_store = np.load(self.dir_K + '.npy', mmap_mode='r')
+            return np.array(self.K_store[self.K_index[name]])
+        return np.load(os.path.join(self.dir_K, name + '.npy'))
 
     def init_categories(self, pairLst, annoLst):
         pairs_file_train = pd.read_csv(pairLst)
@@ -53,17 +69,15 @@ class KeyDataset(BaseDataset):
 
         P1_name, P2_name = self.pairs[index]
         P1_path = os.path.join(self.dir_P, P1_name) # person 1
-        BP1_path = os.path.join(self.dir_K, P1_name + '.npy') # bone of person 1
 
         # person 2 and its bone
         P2_path = os.path.join(self.dir_P, P2_name) # person 2
-        BP2_path = os.path.join(self.dir_K, P2_name + '.npy') # bone of person 2
 
         P1_img = Image.open(P1_path).convert('RGB')
         P2_img = Image.open(P2_path).convert('RGB')
 
-        BP1_img = np.load(BP1_path) # h, w, c
-        BP2_img = np.load(BP2_path)
+        BP1_img = self.load_BP(P1_name) # h, w, c, bone of person 1
+        BP2_img = self.load_BP(P2_name) # bone of person 2
 
         img_size = [P1_img.size[1], P1_img.size[0]]
         BP2_mask = self.get_gaussian_mask(P2_name, img_size)
@@ -3,13 +3,14 @@ import pandas as pd
 import json
 import os
 
-from skimage.draw import circle, line_aa, polygon
 from skimage.io import imread
 from skimage.transform import warp_coords
 import skimage.measure
 import skimage.transform
 import pylab as plt
 
+from util.rasterize import draw_poses, polygon_masks
+
 LABELS = ['nose', 'neck', 'Rsho', 'Relb', 'Rwri', 'Lsho', 'Lelb', 'Lwri',
                'Rhip', 'Rkne', 'Rank', 'Lhip', 'Lkne', 'Lank', 'Leye', 'Reye', 'Lear', 'Rear']
 
@@ -88,9 +89,194 @@ def estimate_polygon(fr, to, st, inc_to, inc_from, p_to, p_from):
 
     return vetexes
 
+BODY_POLY = [LABELS.index(name) for name in ['Rhip', 'Lhip', 'Lsho', 'Rsho']]
+HEAD_CANDIDATES = [LABELS.index(name) for name in ['Leye', 'Reye', 'Lear', 'Rear', 'nose']]
+SHOULDERS = [LABELS.index(name) for name in ['Lsho', 'Rsho']]
+# (from, to, inc_to) of the 8 limb polygons, in the order of the transforms after body and head
+LIMB_JOINS = [('Rhip', 'Rkne', 0.1), ('Lhip', 'Lkne', 0.1),
+              ('Rkne', 'Rank', 0.3), ('Lkne', 'Lank', 0.3),
+              ('Rsho', 'Relb', 0.1), ('Lsho', 'Lelb', 0.1),
+              ('Relb', 'Rwri', 0.3), ('Lelb', 'Lwri', 0.3)]
+MAX_POLY_POINTS = len(HEAD_CANDIDATES) + len(SHOULDERS)
+
+NO_POINT_TR = np.array([[1, 0, 1000], [0, 1, 1000], [0, 0, 1]], dtype=np.float64)
+
+
+def mirror_name(name):
+    return name.replace('R', 'L') if name[0] == 'R' else name.replace('L', 'R')
+
+
+def estimate_polygons(fr, to, st, inc_to, inc_from, p_to, p_from):
+    r""" estimate_polygon of N limbs at once.
+    Args:
+        fr, to (np.ndarray): (N,2) end points in (x, y)
+        st (np.ndarray): (N,) torso sizes
+    Returns:
+        np.ndarray: (N,4,2) vertexes
+    """
+    fr = fr + (fr - to) * inc_from
+    to = to + (to - fr) * inc_to
+
+    norm_vec = fr - to
+    norm_vec = np.stack([-norm_vec[:, 1], norm_vec[:, 0]], -1)
+    norm = np.linalg.norm(norm_vec, axis=-1, keepdims=True)
+    degenerate = norm[:, 0] == 0
+    norm_vec = norm_vec / np.where(norm == 0, 1, norm)
+    st = np.asarray(st, dtype=np.float64)[:, np.newaxis]
+    vetexes = np.stack([
+        fr + st * p_from * norm_vec,
+        fr - st * p_from * norm_vec,
+        to - st * p_to * norm_vec,
+        to + st * p_to * norm_vec
+    ], 1)
+    vetexes[degenerate] = np.stack([fr + 1, fr - 1, to - 1, to + 1], 1)[degenerate]
+    return vetexes
+
+
+def affine_point_sets(kp_arrays1, kp_arrays2):
+    r""" Point sets of the 10 limb transforms of N pairs, built as in affine_transforms_reference.
+    Args:
+        kp_arrays1, kp_arrays2 (np.ndarray): (N,18,2) keypoints in (y, x) of the source and target poses
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray): (N,10,P,2) target (src) and source (dst) points in (x, y),
+        (N,10,P) mask of the used points, P = MAX_POLY_POINTS. A limb without points has an empty mask.
+    """
+    kp1 = np.asarray(kp_arrays1, dtype=np.float64)[..., ::-1]
+    kp2 = np.asarray(kp_arrays2, dtype=np.float64)[..., ::-1]
+    present1 = np.all(kp1 != MISSING_VALUE, -1)
+    present2 = np.all(kp2 != MISSING_VALUE, -1)
+    n = len(kp1)
+
+    def st_distance(kp):
+        rhip, lhip, lsho, rsho = [kp[:, i] for i in BODY_POLY]
+        return np.sqrt((np.sum((rhip - rsho) ** 2, -1) + np.sum((lhip - lsho) ** 2, -1)) / 2.0)
+    st1, st2 = st_distance(kp1), st_distance(kp2)
+
+    src = np.zeros((n, 10, MAX_POLY_POINTS, 2))
+    dst = np.zeros((n, 10, MAX_POLY_POINTS, 2))
+    used = np.zeros((n, 10, MAX_POLY_POINTS), dtype=bool)
+
+    src[:, 0, :4] = kp2[:, BODY_POLY]
+    dst[:, 0, :4] = kp1[:, BODY_POLY]
+    used[:, 0, :4] = True
+
+    head = HEAD_CANDIDATES + SHOULDERS
+    src[:, 1] = kp2[:, head]
+    dst[:, 1] = kp1[:, head]
+    used[:, 1, :len(HEAD_CANDIDATES)] = present1[:, HEAD_CANDIDATES] & present2[:, HEAD_CANDIDATES]
+    used[:, 1, len(HEAD_CANDIDATES):] = used[:, 1, :len(HEAD_CANDIDATES)].any(1, keepdims=True)
+
+    for j, (fr, to, inc_to) in enumerate(LIMB_JOINS):
+        fr2, to2 = LABELS.index(fr), LABELS.index(to)
+        fr1, to1 = LABELS.index(mirror_name(fr)), LABELS.index(mirror_name(to))
+        same = present1[:, fr2] & present1[:, to2]
+        # the opposite limb of the source pose stands in for a missing one
+        fr1 = np.where(same, fr2, fr1)
+        to1 = np.where(same, to2, to1)
+        rows = np.arange(n)
+        found = present2[:, fr2] & present2[:, to2] & present1[rows, fr1] & present1[rows, to1]
+        src[:, j + 2, :4] = estimate_polygons(kp2[:, fr2], kp2[:, to2], st2, inc_to, 0.1, 0.2, 0.2)
+        dst[:, j + 2, :4] = estimate_polygons(kp1[rows, fr1], kp1[rows, to1], st1, inc_to, 0.1, 0.2, 0.2)
+        used[:, j + 2, :4] = found[:, np.newaxis]
+
+    return src, dst, used
+
+
+def _normalize_points(points, used):
+    # masked version of skimage's rms centering and scaling, failed sets get a nan matrix
+    count = used.sum(-1)[..., np.newaxis]
+    centroid = np.where(used[..., np.newaxis], points, 0).sum(-2) / np.maximum(count, 1)
+    centered = np.where(used[..., np.newaxis], points - centroid[..., np.newaxis, :], 0)
+    divisor = np.sqrt((centered ** 2).sum((-2, -1)) / np.maximum(2 * count[..., 0], 1))
+    failed = divisor == 0
+    divisor = np.where(failed, np.nan, divisor)
+
+    matrix = np.zeros(points.shape[:-2] + (3, 3))
+    matrix[..., 0, 0] = matrix[..., 1, 1] = 1 / divisor
+    matrix[..., :2, 2] = -centroid / divisor[..., np.newaxis]
+    matrix[..., 2, 2] = 1
+    inv_matrix = np.zeros_like(matrix)
+    inv_matrix[..., 0, 0] = inv_matrix[..., 1, 1] = divisor
+    inv_matrix[..., :2, 2] = centroid
+    inv_matrix[..., 2, 2] = 1
+    return matrix, inv_matrix, np.where(failed[..., np.newaxis, np.newaxis], 0, centered / divisor[..., np.newaxis, np.newaxis])
+
+
+def estimate_affines(src, dst, used):
+    r""" Least-squares affine transforms from src to dst of many point sets, solved together.
+    This is the normalized DLT of skimage.transform.estimate_transform('affine', ...), with the
+    unused points of a set masked out of its system.
+    Args:
+        src, dst (np.ndarray): (..., P, 2) points in (x, y)
+        used (np.ndarray): (..., P) mask of the points of each set
+    Returns:
+        (np.ndarray, np.ndarray): (..., 3, 3) transforms, (...) mask of the sets that could not be estimated
+    """
+    src_matrix, _, src_n = _normalize_points(src, used)
+    _, dst_inv_matrix, dst_n = _normalize_points(dst, used)
+    failed = np.isnan(src_matrix[..., 0, 0]) | np.isnan(dst_inv_matrix[..., 0, 0])
+
+    p = src.shape[-2]
+    A = np.zeros(src.shape[:-2] + (2 * p, 7))
+    A[..., :p, 0:2] = src_n
+    A[..., :p, 2] = used
+    A[..., :p, 6] = dst_n[..., 0]
+    A[..., p:, 3:5] = src_n
+    A[..., p:, 5] = used
+    A[..., p:, 6] = dst_n[..., 1]
+
+    _, _, V = np.linalg.svd(A)
+    h = V[..., -1, :]
+    failed |= np.isclose(h[..., -1], 0)
+    h = h[..., :-1] / np.where(failed, 1, -h[..., -1])[..., np.newaxis]
+
+    H = np.zeros(src.shape[:-2] + (3, 3))
+    H[..., :2, :] = h.reshape(h.shape[:-1] + (2, 3))
+    H[..., 2, 2] = 1
+    H = dst_inv_matrix @ H @ src_matrix
+    H /= H[..., 2:, 2:]
+    return H, failed
+
+
+def singular_transforms(transforms):
+    r""" Mask of the (..., 3, 3) transforms that np.linalg.inv rejects, the test of affine_transforms_reference.
+    A vanishing determinant alone is not enough: inv only fails on an exactly zero LU pivot, so the few
+    candidates are inverted one by one.
+    """
+    det = transforms[..., 0, 0] * transforms[..., 1, 1] - transforms[..., 0, 1] * transforms[..., 1, 0]
+    scale = np.abs(transforms[..., :2, :2]).max((-2, -1)) ** 2
+    singular = np.zeros(det.shape, dtype=bool)
+    for index in zip(*np.nonzero(np.abs(det) <= 1e-8 * scale)):
+        try:
+            np.linalg.inv(transforms[index])
+        except np.linalg.LinAlgError:
+            singular[index] = True
+    return singular
+
+
+def batched_affine_transforms(kp_arrays1, kp_arrays2):
+    r""" affine_transforms of N pairs in one solve.
+    Limbs without points, failed estimations and singular transforms get the no point transform.
+    Args:
+        kp_arrays1, kp_arrays2 (np.ndarray): (N,18,2) keypoints in (y, x) of the source and target poses
+    Returns:
+        np.ndarray: (N,10,8) inverse transforms, from the target to the source image
+    """
+    src, dst, used = affine_point_sets(kp_arrays1, kp_arrays2)
+    transforms, failed = estimate_affines(src, dst, used)
+    no_point = failed | singular_transforms(transforms) | ~used.any(-1)
+    transforms[no_point] = NO_POINT_TR
+    return transforms.reshape(transforms.shape[:-2] + (9,))[..., :-1]
+
+
 # note that the transforms are the inverse transforms, from output to input
 # this is how tf and pytorch apis expect the affine warp matrices
 def affine_transforms(array1, array2):
+    return batched_affine_transforms(np.asarray(array1)[np.newaxis], np.asarray(array2)[np.newaxis])[0]
+
+
+def affine_transforms_reference(array1, array2):
+    # per pair skimage version, kept for check_affine_parity
     kp1 = give_name_to_keypoints(array1)
     kp2 = give_name_to_keypoints(array2)
 
@@ -191,22 +377,18 @@ def make_rectangle_limb_masks(array2, img_size):
     else:
         masks.append(empty_mask)
 
-    def mask_joint(fr, to, inc_to):
-        if not check_keypoints_present(kp2, [fr, to]):
-            return empty_mask
-        return skimage.measure.grid_points_in_poly(img_size, estimate_polygon(kp2[fr], kp2[to], st2, inc_to, 0.1, 0.2, 0.2)[:, ::-1])
-
-    masks.append(mask_joint('Rhip', 'Rkne', 0.1))
-    masks.append(mask_joint('Lhip', 'Lkne', 0.1))
-
-    masks.append(mask_joint('Rkne', 'Rank', 0.5))
-    masks.append(mask_joint('Lkne', 'Lank', 0.5))
-
-    masks.append(mask_joint('Rsho', 'Relb', 0.1))
-    masks.append(mask_joint('Lsho', 'Lelb', 0.1))
-
-    masks.append(mask_joint('Relb', 'Rwri', 0.5))
-    masks.append(mask_joint('Lelb', 'Lwri', 0.5))
+    joints = [('Rhip', 'Rkne', 0.1), ('Lhip', 'Lkne', 0.1),
+              ('Rkne', 'Rank', 0.5), ('Lkne', 'Lank', 0.5),
+              ('Rsho', 'Relb', 0.1), ('Lsho', 'Lelb', 0.1),
+              ('Relb', 'Rwri', 0.5), ('Lelb', 'Lwri', 0.5)]
+    joint_masks = np.zeros((len(joints),) + tuple(img_size))
+    present = [i for i, (fr, to, _) in enumerate(joints) if check_keypoints_present(kp2, [fr, to])]
+    if present:
+        vetexes = np.stack([estimate_polygon(kp2[joints[i][0]], kp2[joints[i][1]], st2, joints[i][2], 0.1, 0.2, 0.2)
+                            for i in present])
+        # all the limbs in one pass, with the pixels on the edges as in grid_points_in_poly
+        joint_masks[present] = polygon_masks(vetexes[..., ::-1], img_size, edges=True)
+    masks.extend(joint_masks)
 
     masks = np.array(masks)
     # return np.array(masks)
@@ -260,60 +442,104 @@ def draw_pose_from_cords(pose_joints, img_size, radius=2, draw_joints=True):
               [0, 255, 85], [0, 255, 170], [0, 255, 255], [0, 170, 255], [0, 85, 255], [0, 0, 255], [85, 0, 255],
               [170, 0, 255], [255, 0, 255], [255, 0, 170], [255, 0, 85]]
 
-    colors = np.zeros(shape=img_size + (3, ), dtype=np.uint8)
-    mask = np.zeros(shape=img_size, dtype=bool)
-
-    if draw_joints:
-        for f, t in LIMB_SEQ:
-            from_missing = pose_joints[f][0] == MISSING_VALUE or pose_joints[f][1] == MISSING_VALUE
-            to_missing = pose_joints[t][0] == MISSING_VALUE or pose_joints[t][1] == MISSING_VALUE
-            if from_missing or to_missing:
-                continue
-            yy, xx, val = line_aa(pose_joints[f][0], pose_joints[f][1], pose_joints[t][0], pose_joints[t][1])
-            colors[yy, xx] = np.expand_dims(val, 1) * 255
-            mask[yy, xx] = True
-
-    for i, joint in enumerate(pose_joints):
-        if pose_joints[i][0] == MISSING_VALUE or pose_joints[i][1] == MISSING_VALUE:
-            continue
-        yy, xx = circle(joint[0], joint[1], radius=radius, shape=img_size)
-        colors[yy, xx] = COLORS[i]
-        mask[yy, xx] = True
-
-    return colors, mask
+    return draw_poses(pose_joints, img_size, LIMB_SEQ, COLORS, radius, draw_joints, MISSING_VALUE)
+
+def pose_masks(array2, img_size):
+    # the 10 limb masks of make_rectangle_limb_masks, in the order of the affine transforms
+    return make_rectangle_limb_masks(array2, img_size)[1:]
+
+def af_store_paths(save_path):
+    return (os.path.join(save_path, 'AFtrans_param.npy'), os.path.join(save_path, 'AFtrans_mask.npy'),
+            os.path.join(save_path, 'AFtrans_pairs.txt'))
+
+def _write_af_rows(job):
+    rows, kp_arrays1, kp_arrays2, img_size, save_path = job
+    param_file, mask_file, _ = af_store_paths(save_path)
+    params = np.load(param_file, mmap_mode='r+')
+    masks = np.load(mask_file, mmap_mode='r+')
+    params[rows] = batched_affine_transforms(kp_arrays1, kp_arrays2)
+    for row, kp_array2 in zip(rows, kp_arrays2):
+        masks[row] = pose_masks(kp_array2, img_size)
+    params.flush()
+    masks.flush()
+    return len(rows)
+
+def compute_AFtrans_param(pairs_dir, anno_dir, img_size, save_path, warp_type='mask', mask_dtype='uint8',
+                          workers=4, chunk_size=512):
+    r""" Affine transformation parameters and target limb masks of every pair, written row by row to
+    memory mapped stores in save_path:
+        AFtrans_param.npy (pairs_len,10,8): 10 body limbs, 8 parameters of each limb transform
+        AFtrans_mask.npy (pairs_len,10,h,w): the masks of the 10 body limbs
+        AFtrans_pairs.txt: 'from___to' name of every row
+    Chunks of pairs are processed in a pool of workers processes, 0 to run in the main process.
+    """
+    if warp_type != 'mask':
+        raise NotImplementedError('warp_type [%s] is not implemented' % warp_type)
+    from multiprocessing import Pool
 
-def compute_AFtrans_param(pairs_dir, anno_dir, img_size, save_path, warp_type='mask'):
     pairs_file = pd.read_csv(pairs_dir)
     pairs_len = len(pairs_file)
+    img_size = tuple(img_size)
 
-    annotations_file = pd.read_csv(anno_dir, sep=':')
-    annotations_file = annotations_file.set_index('name')
-
-    if warp_type == 'mask':
-        AFtrans_param = [np.empty([pairs_len, 10, 8]),   # Affine transformation parameters. 10: the len of body limbs, 8: the param for each limbs
-                         np.empty([pairs_len, 10] + img_size)]  # The mask of 10 body limbs.
+    annotations_file = pd.read_csv(anno_dir, sep=':').drop_duplicates('name')
+    names = pd.Index(annotations_file['name'])
+    kp_arrays = np.stack([load_pose_cords_from_strings(y, x) for y, x in
+                          zip(annotations_file['keypoints_y'], annotations_file['keypoints_x'])])
+    index_fr = names.get_indexer(pairs_file['from'])
+    index_to = names.get_indexer(pairs_file['to'])
+    if (index_fr < 0).any() or (index_to < 0).any():
+        raise KeyError('pairs without annotation in %s' % anno_dir)
 
     if not os.path.exists(save_path):
-        os.mkdir(save_path)
-
-    for i in range(pairs_len):
-        print('processing %d / %d ...' % (i, pairs_len))
-        pair_name = [pairs_file.iloc[i]['from'], pairs_file.iloc[i]['to']]
-        save_name = pair_name[0] + '___' + pair_name[1]
-        file_name = os.path.join(save_path, save_name+'.npy')
-        fr = annotations_file.loc[pair_name[0]]
-        to = annotations_file.loc[pair_name[1]]
-        kp_array1 = load_pose_cords_from_strings(fr['keypoints_y'],
-                                                 fr['keypoints_x'])
-        kp_array2 = load_pose_cords_from_strings(to['keypoints_y'],
-                                                 to['keypoints_x'])
-        if warp_type == 'mask':
-            AFtrans_param[0][i] = affine_transforms(kp_array1, kp_array2)
-            AFtrans_param[1][i] = pose_masks(kp_array2, img_size)
-
-        np.save(file_name, AFtrans_param)
+        os.makedirs(save_path)
+    param_file, mask_file, pairs_names_file = af_store_paths(save_path)
+    np.lib.format.open_memmap(param_file, mode='w+', dtype=np.float64, shape=(pairs_len, 10, 8)).flush()
+    np.lib.format.open_memmap(mask_file, mode='w+', dtype=mask_dtype, shape=(pairs_len, 10) + img_size).flush()
+    with open(pairs_names_file, 'w') as f:
+        f.writelines('%s___%s\n' % (fr, to) for fr, to in zip(pairs_file['from'], pairs_file['to']))
+
+    jobs = [(np.arange(i, min(i + chunk_size, pairs_len)), kp_arrays[index_fr[i:i + chunk_size]],
+             kp_arrays[index_to[i:i + chunk_size]], img_size, save_path) for i in range(0, pairs_len, chunk_size)]
+    pool = Pool(workers) if workers > 0 else None
+    results = pool.imap_unordered(_write_af_rows, jobs) if pool is not None else map(_write_af_rows, jobs)
+    done = 0
+    for n in results:
+        done += n
+        print('processing %d / %d ...' % (done, pairs_len))
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+def check_affine_parity(n_pairs=500, p_missing=(0.0, 0.2, 0.5), seeds=(0, 3)):
+    r""" Compare batched_affine_transforms with the per pair skimage version on random poses, for every rate of
+    missing keypoints and seed. High rates leave collinear or tiny head sets, whose (near) singular transforms
+    have to get the same fallback as the reference.
+    Pairs on which skimage fails to estimate a transform are skipped.
+    Returns:
+        (float, int): max absolute difference of the transforms, number of compared pairs
+    """
+    if np.ndim(p_missing) > 0 or np.ndim(seeds) > 0:
+        results = [check_affine_parity(n_pairs, p, seed) for p in np.atleast_1d(p_missing) for seed in np.atleast_1d(seeds)]
+        return max(r[0] for r in results), sum(r[1] for r in results)
+    rng = np.random.RandomState(seeds)
+    kp_arrays = np.stack([rng.randint(0, 128, (2 * n_pairs, 18)), rng.randint(0, 64, (2 * n_pairs, 18))], -1)
+    missing = rng.rand(2 * n_pairs, 18) < p_missing
+    missing[:, BODY_POLY] = False
+    kp_arrays[missing] = MISSING_VALUE
+    kp_arrays1, kp_arrays2 = kp_arrays[:n_pairs], kp_arrays[n_pairs:]
+
+    transforms = batched_affine_transforms(kp_arrays1, kp_arrays2)
+    diff, compared = 0, 0
+    for kp_array1, kp_array2, tr in zip(kp_arrays1, kp_arrays2, transforms):
+        try:
+            expected = affine_transforms_reference(kp_array1, kp_array2)
+        except AttributeError:
+            continue
+        diff = max(diff, np.abs(tr - expected).max())
+        compared += 1
+    return diff, compared
 
-def draw_line(fr, to, thickness, shape):
+def line_polygon(fr, to, thickness):
     norm_vec = fr - to
     norm_vec = np.array([-norm_vec[1], norm_vec[0]])
     norm_vec = thickness * norm_vec / np.linalg.norm(norm_vec)
@@ -324,8 +550,15 @@ def draw_line(fr, to, thickness, shape):
         to - norm_vec,
         to + norm_vec
     ])
+    return vetexes
 
-    return skimage.draw.polygon(vetexes[:, 1], vetexes[:, 0], shape=shape)
+def draw_lines_mask(kp, lines, thickness, shape):
+    # union of the thick lines between named keypoints, rasterized together
+    vetexes = np.stack([line_polygon(kp[fr], kp[to], thickness) for fr, to in lines])
+    return polygon_masks(vetexes[..., ::-1], shape[:2]).any(0)
+
+def draw_line(fr, to, thickness, shape):
+    return np.nonzero(polygon_masks(line_polygon(fr, to, thickness)[:, ::-1], shape[:2]))
 
 def make_stickman(kp_array, img_shape):
     kp = give_name_to_keypoints(kp_array)
@@ -341,8 +574,7 @@ def make_stickman(kp_array, img_shape):
     body_pts = get_array_of_points(kp, body)
     if np.min(body_pts) >= 0:
         body_pts = np.int_(body_pts)
-        rr,cc = skimage.draw.polygon(body_pts[:,1], body_pts[:, 0], shape=img_shape)
-        imgs[2][rr, cc] = 1
+        imgs[2][polygon_masks(body_pts[:, ::-1], img_shape[:2])] = 1
 
     right_lines = [
             ("Rank", "Rkne"),
@@ -350,11 +582,9 @@ def make_stickman(kp_array, img_shape):
             ("Rhip", "Rsho"),
             ("Rsho", "Relb"),
             ("Relb", "Rwri")]
-    for line in right_lines:
-        if check_keypoints_present(kp, line):
-            line_pts = get_array_of_points(kp, line)
-            rr,cc = draw_line(line_pts[0], line_pts[1], thickness=thickness, shape=img_shape)
-            imgs[0][rr,cc] = 1
+    right_lines = [line for line in right_lines if check_keypoints_present(kp, line)]
+    if right_lines:
+        imgs[0][draw_lines_mask(kp, right_lines, thickness, img_shape)] = 1
 
     left_lines = [
             ("Lank", "Lkne"),
@@ -362,11 +592,9 @@ def make_stickman(kp_array, img_shape):
             ("Lhip", "Lsho"),
             ("Lsho", "Lelb"),
             ("Lelb", "Lwri")]
-    for line in left_lines:
-        if check_keypoints_present(kp, line):
-            line_pts = get_array_of_points(kp, line)
-            rr,cc = draw_line(line_pts[0], line_pts[1], thickness=thickness, shape=img_shape)
-            imgs[1][rr, cc] = 1
+    left_lines = [line for line in left_lines if check_keypoints_present(kp, line)]
+    if left_lines:
+        imgs[1][draw_lines_mask(kp, left_lines, thickness, img_shape)] = 1
 
     if check_keypoints_present(kp, ['Rsho', 'Lsho', 'nose']):
         rs = kp["Rsho"]
@@ -1,15 +1,13 @@
 import torch
-from .ssim import _fspecial_gauss_1d, ssim
+from .ssim import _fspecial_gauss_1d, ssim, fp32_forward
 
 # part ssim calculation using 2D Gaussian masks + mean & std calculation using weight average method
 def part_ssim(X, Y, part_mask, mask_t=0.4, data_range=255, size_average=True, K=(0.01,0.03)):
-    batch_size, img_channel, H, W = X.shape[0], X.shape[1], X.shape[2], X.shape[3]
-    mask_channel = part_mask.shape[1]
-    new_shape = (batch_size, img_channel*mask_channel, H, W)
-
-    X_repeat = torch.unsqueeze(X, 1).repeat(1, mask_channel, 1, 1, 1).reshape(new_shape)
-    Y_repeat = torch.unsqueeze(Y, 1).repeat(1, mask_channel, 1, 1, 1).reshape(new_shape)
-    part_mask_repeat = torch.unsqueeze(part_mask, 2).repeat(1,1,img_channel,1,1).reshape(new_shape)
+    # (batch, part, channel, H, W) products by broadcasting, instead of repeating the images for every part
+    batch_size = X.shape[0]
+    X_part = torch.unsqueeze(X, 1)
+    Y_part = torch.unsqueeze(Y, 1)
+    part_mask = torch.unsqueeze(part_mask, 2)
 
     K1, K2 = K
     compensation = 1.0
@@ -18,18 +16,18 @@ def part_ssim(X, Y, part_mask, mask_t=0.4, data_range=255, size_average=True, K=
     C2 = (K2 * data_range) ** 2
 
     # calculate mean of X and Y (method 1)
-    part_mask_sum = torch.unsqueeze(torch.unsqueeze(part_mask_repeat.sum((-2,-1)),-1),-1).repeat(1,1,H,W)
-    part_mask_avg = part_mask_repeat/(part_mask_sum + 1e-6) # sum(part_mask[0,0,:,:]) = 1
-    mu1 = torch.mul(X_repeat, part_mask_avg).sum((-2,-1))
-    mu2 = torch.mul(Y_repeat, part_mask_avg).sum((-2,-1))
+    part_mask_sum = part_mask.sum((-2,-1), keepdim=True)
+    part_mask_avg = part_mask/(part_mask_sum + 1e-6) # sum(part_mask[0,0,:,:]) = 1
+    mu1 = torch.mul(X_part, part_mask_avg).sum((-2,-1)).reshape(batch_size, -1)
+    mu2 = torch.mul(Y_part, part_mask_avg).sum((-2,-1)).reshape(batch_size, -1)
 
     mu1_sq = mu1.pow(2)
     mu2_sq = mu2.pow(2)
     mu1_mu2 = mu1 * mu2
 
-    mu11 = torch.mul(X_repeat*X_repeat, part_mask_avg).sum((-2,-1))
-    mu22 = torch.mul(Y_repeat*Y_repeat, part_mask_avg).sum((-2,-1))
-    mu12 = torch.mul(X_repeat*Y_repeat, part_mask_avg).sum((-2,-1))
+    mu11 = torch.mul(X_part*X_part, part_mask_avg).sum((-2,-1)).reshape(batch_size, -1)
+    mu22 = torch.mul(Y_part*Y_part, part_mask_avg).sum((-2,-1)).reshape(batch_size, -1)
+    mu12 = torch.mul(X_part*Y_part, part_mask_avg).sum((-2,-1)).reshape(batch_size, -1)
     sigma1_sq = compensation * (mu11 - mu1_sq)
     sigma2_sq = compensation * (mu22 - mu2_sq)
     sigma12   = compensation * (mu12 - mu1_mu2)
@@ -70,6 +68,7 @@ class FPart_BSSIM(torch.nn.Module):  #  foreground part-SSIM + background SSIM
         self.nonnegative_ssim = nonnegative_ssim
         self.channel = channel
 
+    @fp32_forward
     def forward(self, X, Y, part_mask):
         # from [-1,1] to [0,1]
         X = (X + 1) / 2.0
@@ -78,7 +77,7 @@ class FPart_BSSIM(torch.nn.Module):  #  foreground part-SSIM + background SSIM
 
         f_ssim = part_ssim(X, Y, f_mask, data_range=self.data_range, size_average=self.size_average)
 
-        b_mask = torch.unsqueeze(part_mask[:,0,:,:], 1).repeat(1, self.channel, 1, 1)
+        b_mask = part_mask[:,0:1,:,:]
         bX = torch.mul(b_mask, X)
         bY = torch.mul(b_mask, Y)
         b_ssim = ssim(bX, bY, win_size=self.win_size, win_sigma=self.win_sigma, win=self.win, data_range=self.data_range,
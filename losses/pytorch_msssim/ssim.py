@@ -1,6 +1,19 @@
+import functools
 import torch
 import torch.nn.functional as F
 
+
+def fp32_forward(forward):
+    r""" Run a forward in fp32 with autocast disabled. The SSIM statistics are differences of means of
+    squares, which half precision cannot resolve.
+    """
+    @functools.wraps(forward)
+    def wrapper(self, X, *inputs):
+        with torch.autocast(X.device.type, enabled=False):
+            return forward(self, X.float(), *[x.float() for x in inputs])
+    return wrapper
+
+
 def _fspecial_gauss_1d(size, sigma):
     r"""Create 1-D gauss kernel
     Args:
@@ -178,6 +191,7 @@ class SSIM(torch.nn.Module):
         self.K = K
         self.nonnegative_ssim = nonnegative_ssim
 
+    @fp32_forward
     def forward(self, X, Y):
         B, channel, H, W = X.shape
         if channel == 3:
@@ -7,6 +7,7 @@ import util.util as util
 from util.image_pool import ImagePool
 from .base_model import BaseModel
 from . import networks
+from .inference import ExportedGenerator
 # losses
 from losses.L1_plus_perceptualLoss import L1_plus_perceptualLoss
 from losses.pytorch_msssim import SSIM, FPart_BSSIM
@@ -30,9 +31,11 @@ class TransferModel(BaseModel):
         input_nc = [opt.P_input_nc, opt.BP_input_nc+opt.BP_input_nc]
         self.netG = networks.define_G(input_nc, opt.P_input_nc,
                                         opt.ngf, opt.which_model_netG, opt.norm, not opt.no_dropout, opt.init_type, self.gpu_ids,
-                                        n_downsampling=opt.G_n_downsampling)
+                                        n_downsampling=opt.G_n_downsampling,
+                                        checkpoint_blocks=opt.checkpoint_blocks, checkpoint_stems=opt.checkpoint_stems)
 
         if self.isTrain:
+            assert not opt.teacher_checkpoint, 'distillation trains a PATN generator, use --model PATN'
             use_sigmoid = opt.no_lsgan
             if opt.with_D_PB:
                 self.netD_PB = networks.define_D(opt.P_input_nc+opt.BP_input_nc, opt.ndf,
@@ -48,7 +51,10 @@ class TransferModel(BaseModel):
                                             not opt.no_dropout_D,
                                             n_downsampling = opt.D_n_downsampling)
 
-        if not self.isTrain or opt.continue_train:
+        if not self.isTrain and opt.backend != 'torch':
+            # generation through an exported artifact, nothing to load
+            self.netG = ExportedGenerator(opt.exported_G, opt.backend, self.device)
+        elif not self.isTrain or opt.continue_train:
             which_epoch = opt.which_epoch
             self.load_network(self.netG, 'netG', which_epoch)
             if self.isTrain:
@@ -60,8 +66,11 @@ class TransferModel(BaseModel):
 
         if self.isTrain:
             self.old_lr = opt.lr
-            self.fake_PP_pool = ImagePool(opt.pool_size)
-            self.fake_PB_pool = ImagePool(opt.pool_size)
+            self.fake_PP_pool = ImagePool(opt.pool_size, opt.pool_pin_memory)
+            self.fake_PB_pool = ImagePool(opt.pool_size, opt.pool_pin_memory)
+            # real and fake through the discriminators as one batch, with BatchNorm only when asked for
+            # since the batch statistics are then shared by real and fake
+            self.fuse_D = opt.fuse_D_batches and (opt.norm != 'batch' or opt.fuse_D_batchnorm)
             # define loss functions
             self.criterionGAN = networks.GANLoss(use_lsgan=not opt.no_lsgan, tensor=self.Tensor)
 
@@ -93,6 +102,31 @@ class TransferModel(BaseModel):
                 self.optimizers.append(self.optimizer_D_PP)
             for optimizer in self.optimizers:
                 self.schedulers.append(networks.get_scheduler(optimizer, opt))
+            self.scaler_G = self.grad_scaler()
+            self.scaler_D_PB = self.grad_scaler()
+            self.scaler_D_PP = self.grad_scaler()
+
+            assert opt.accum_steps == 1 or opt.DG_ratio == 1, '--accum_steps needs --DG_ratio 1'
+            self.netDs = []
+            if opt.with_D_PB:
+                self.netDs.append(self.netD_PB)
+            if opt.with_D_PP:
+                self.netDs.append(self.netD_PP)
+            if opt.accum_steps > 1:
+                for net in [self.netG] + self.netDs:
+                    self.accumulate_batchnorm(net)
+
+        # networks and loss networks in the layout of the input batches
+        self.to(memory_format=self.memory_format)
+
+        if opt.compile and not isinstance(self.netG, ExportedGenerator):
+            # the compiled forward is bound to one module, data_parallel replicas cannot run it
+            assert len(self.gpu_ids) <= 1, '--compile runs on a single gpu'
+            networks.compile_network(self.netG, opt.compile_mode)
+            if self.isTrain:
+                for name in ['netD_PB', 'netD_PP', 'criterionL1', 'criterionSSIM', 'criterionStyle', 'criterionPerSSIM']:
+                    if getattr(self, name, None) is not None:
+                        networks.compile_network(getattr(self, name), opt.compile_mode)
 
         # print('---------- Networks initialized -------------')
         # networks.print_network(self.netG)
@@ -109,24 +143,25 @@ class TransferModel(BaseModel):
         self.input_BP2_mask = input['BP2_mask']
         self.image_paths = input['P1_path'][0] + '___' + input['P2_path'][0]
 
-        if len(self.gpu_ids) > 0:
-            self.input_P1 = self.input_P1.cuda()
-            self.input_BP1 = self.input_BP1.cuda()
-            self.input_P2 = self.input_P2.cuda()
-            self.input_BP2 = self.input_BP2.cuda()
-            self.input_BP2_mask_set = self.input_BP2_mask.cuda()
+        self.input_P1 = self.input_P1.to(self.device, memory_format=self.memory_format)
+        self.input_BP1 = self.input_BP1.to(self.device, memory_format=self.memory_format)
+        self.input_P2 = self.input_P2.to(self.device, memory_format=self.memory_format)
+        self.input_BP2 = self.input_BP2.to(self.device, memory_format=self.memory_format)
+        self.input_BP2_mask_set = self.input_BP2_mask.to(self.device, memory_format=self.memory_format)
 
     def forward(self):
         G_input = [self.input_P1,
                    torch.cat((self.input_BP1, self.input_BP2), 1)]
-        self.fake_p2 = self.netG(G_input)
+        with self.autocast(), self.check_layout():
+            self.fake_p2 = self.netG(G_input)
 
 
     def test(self):
         with torch.no_grad():
             G_input = [self.input_P1,
                        torch.cat((self.input_BP1, self.input_BP2), 1)]
-            self.fake_p2 = self.netG(G_input)
+            with self.autocast(), self.check_layout():
+                self.fake_p2 = self.netG(G_input)
 
 
     # get image paths
@@ -134,106 +169,135 @@ class TransferModel(BaseModel):
         return self.image_paths
 
 
-    def backward_G(self):
+    # discriminator inputs of the step, built once for the G and the D updates
+    def build_D_inputs(self):
         if self.opt.with_D_PB:
-            pred_fake_PB = self.netD_PB(torch.cat((self.fake_p2, self.input_BP2), 1))
-            self.loss_G_GAN_PB = self.criterionGAN(pred_fake_PB, True)
-
+            self.real_PB = torch.cat((self.input_P2, self.input_BP2), 1)
+            self.fake_PB = torch.cat((self.fake_p2, self.input_BP2), 1)
         if self.opt.with_D_PP:
-            pred_fake_PP = self.netD_PP(torch.cat((self.fake_p2, self.input_P1), 1))
-            self.loss_G_GAN_PP = self.criterionGAN(pred_fake_PP, True)
+            self.real_PP = torch.cat((self.input_P2, self.input_P1), 1)
+            self.fake_PP = torch.cat((self.fake_p2, self.input_P1), 1)
+
+    def backward_G(self):
+        with self.autocast(), self.check_layout():
+            if self.opt.with_D_PB:
+                pred_fake_PB = self.netD_PB(self.fake_PB)
+                self.loss_G_GAN_PB = self.criterionGAN(pred_fake_PB, True)
 
-        # L1 loss
-        if self.opt.L1_type == 'l1_plus_perL1':
-            losses = self.criterionL1(self.fake_p2, self.input_P2)
-            self.loss_G_L1 = losses[0]
-            self.loss_originL1 = losses[1].item()
-            self.loss_perceptual = losses[2].item()
-        elif self.opt.L1_type == 'FPart_BSSIM_plus_perL1_L1':
-            self.loss_ssim = (1 - self.criterionSSIM(self.fake_p2,
-                                                     self.input_P2, self.input_BP2_mask_set)) * self.opt.lambda_SSIM
-            losses = self.criterionL1(self.fake_p2, self.input_P2)
-            self.loss_G_L1 = losses[0] + self.loss_ssim  # perL1 + L1 loss + fpart_bssim loss
-            self.loss_originL1 = losses[1].item()  # L1 loss
-            self.loss_perceptual = losses[2].item()  # perL1 loss
-
-        else:
-            self.loss_G_L1 = self.criterionL1(self.fake_p2, self.input_P2) * self.opt.lambda_A
-
-
-        pair_L1loss = self.loss_G_L1
-        if self.opt.with_D_PB:
-            pair_GANloss = self.loss_G_GAN_PB * self.opt.lambda_GAN
-            if self.opt.with_D_PP:
-                pair_GANloss += self.loss_G_GAN_PP * self.opt.lambda_GAN
-                pair_GANloss = pair_GANloss / 2
-        else:
             if self.opt.with_D_PP:
-                pair_GANloss = self.loss_G_GAN_PP * self.opt.lambda_GAN
+                pred_fake_PP = self.netD_PP(self.fake_PP)
+                self.loss_G_GAN_PP = self.criterionGAN(pred_fake_PP, True)
+
+            # L1 loss
+            if self.opt.L1_type == 'l1_plus_perL1':
+                losses = self.criterionL1(self.fake_p2, self.input_P2)
+                self.loss_G_L1 = losses[0]
+                self.loss_originL1 = losses[1].item()
+                self.loss_perceptual = losses[2].item()
+            elif self.opt.L1_type == 'FPart_BSSIM_plus_perL1_L1':
+                self.loss_ssim = (1 - self.criterionSSIM(self.fake_p2,
+                                                         self.input_P2, self.input_BP2_mask_set)) * self.opt.lambda_SSIM
+                losses = self.criterionL1(self.fake_p2, self.input_P2)
+                self.loss_G_L1 = losses[0] + self.loss_ssim  # perL1 + L1 loss + fpart_bssim loss
+                self.loss_originL1 = losses[1].item()  # L1 loss
+                self.loss_perceptual = losses[2].item()  # perL1 loss
+
+            else:
+                self.loss_G_L1 = self.criterionL1(self.fake_p2, self.input_P2) * self.opt.lambda_A
 
-        if self.opt.with_D_PB or self.opt.with_D_PP:
-            pair_loss = pair_L1loss + pair_GANloss
-        else:
-            pair_loss = pair_L1loss
 
-        pair_loss.backward()
+            pair_L1loss = self.loss_G_L1
+            if self.opt.with_D_PB:
+                pair_GANloss = self.loss_G_GAN_PB * self.opt.lambda_GAN
+                if self.opt.with_D_PP:
+                    pair_GANloss += self.loss_G_GAN_PP * self.opt.lambda_GAN
+                    pair_GANloss = pair_GANloss / 2
+            else:
+                if self.opt.with_D_PP:
+                    pair_GANloss = self.loss_G_GAN_PP * self.opt.lambda_GAN
+
+            if self.opt.with_D_PB or self.opt.with_D_PP:
+                pair_loss = pair_L1loss + pair_GANloss
+            else:
+                pair_loss = pair_L1loss
+
+        self.scaler_G.scale(pair_loss * self.loss_weight).backward()
 
         self.pair_L1loss = pair_L1loss.item()
         if self.opt.with_D_PB or self.opt.with_D_PP:
             self.pair_GANloss = pair_GANloss.item()
 
 
-    def backward_D_basic(self, netD, real, fake):
-        # Real
-        pred_real = netD(real)
-        loss_D_real = self.criterionGAN(pred_real, True) * self.opt.lambda_GAN
-        # Fake
-        pred_fake = netD(fake.detach())
-        loss_D_fake = self.criterionGAN(pred_fake, False) * self.opt.lambda_GAN
-        # Combined loss
-        loss_D = (loss_D_real + loss_D_fake) * 0.5
+    def backward_D_basic(self, netD, real, fake, scaler):
+        with self.autocast(), self.check_layout():
+            if self.fuse_D:
+                # Real and Fake in one pass
+                pred = netD(torch.cat((real, fake.detach()), 0))
+                pred_real, pred_fake = torch.split(pred, [real.size(0), fake.size(0)])
+            else:
+                pred_real = netD(real)
+                pred_fake = netD(fake.detach())
+            # Real
+            loss_D_real = self.criterionGAN(pred_real, True) * self.opt.lambda_GAN
+            # Fake
+            loss_D_fake = self.criterionGAN(pred_fake, False) * self.opt.lambda_GAN
+            # Combined loss
+            loss_D = (loss_D_real + loss_D_fake) * 0.5
         # backward
-        loss_D.backward()
+        scaler.scale(loss_D * self.loss_weight).backward()
         return loss_D
 
     # D: take(P, B) as input
-    def backward_D_PB(self):
-        real_PB = torch.cat((self.input_P2, self.input_BP2), 1)
-        # fake_PB = self.fake_PB_pool.query(torch.cat((self.fake_p2, self.input_BP2), 1))
-        fake_PB = self.fake_PB_pool.query( torch.cat((self.fake_p2, self.input_BP2), 1).data )
-        loss_D_PB = self.backward_D_basic(self.netD_PB, real_PB, fake_PB)
+    # |query_pool|: draw the fake batch from the image pool, otherwise reuse the one of the previous call
+    def backward_D_PB(self, query_pool=True):
+        if query_pool:
+            self.pooled_fake_PB = self.fake_PB_pool.query(self.fake_PB.data)
+        loss_D_PB = self.backward_D_basic(self.netD_PB, self.real_PB, self.pooled_fake_PB, self.scaler_D_PB)
         self.loss_D_PB = loss_D_PB.item()
 
     # D: take(P, P') as input
-    def backward_D_PP(self):
-        real_PP = torch.cat((self.input_P2, self.input_P1), 1)
-        # fake_PP = self.fake_PP_pool.query(torch.cat((self.fake_p2, self.input_P1), 1))
-        fake_PP = self.fake_PP_pool.query( torch.cat((self.fake_p2, self.input_P1), 1).data )
-        loss_D_PP = self.backward_D_basic(self.netD_PP, real_PP, fake_PP)
+    def backward_D_PP(self, query_pool=True):
+        if query_pool:
+            self.pooled_fake_PP = self.fake_PP_pool.query(self.fake_PP.data)
+        loss_D_PP = self.backward_D_basic(self.netD_PP, self.real_PP, self.pooled_fake_PP, self.scaler_D_PP)
         self.loss_D_PP = loss_D_PP.item()
 
 
     def optimize_parameters(self):
         # forward
         self.forward()
+        self.build_D_inputs()
+        first, last = self.accumulate(self.input_P1.size(0))
 
-        self.optimizer_G.zero_grad()
+        # the discriminators get no gradient from the G loss
+        self.set_requires_grad(self.netDs, False)
+        if first:
+            self.optimizer_G.zero_grad()
         self.backward_G()
-        self.optimizer_G.step()
+        if last:
+            self.scaler_G.step(self.optimizer_G)
+            self.scaler_G.update()
+        self.set_requires_grad(self.netDs, True)
 
         # D_P
         if self.opt.with_D_PP:
             for i in range(self.opt.DG_ratio):
-                self.optimizer_D_PP.zero_grad()
-                self.backward_D_PP()
-                self.optimizer_D_PP.step()
+                if first:
+                    self.optimizer_D_PP.zero_grad()
+                self.backward_D_PP(query_pool=i == 0 or not self.opt.reuse_D_fake)
+                if last:
+                    self.scaler_D_PP.step(self.optimizer_D_PP)
+                    self.scaler_D_PP.update()
 
         # D_BP
         if self.opt.with_D_PB:
             for i in range(self.opt.DG_ratio):
-                self.optimizer_D_PB.zero_grad()
-                self.backward_D_PB()
-                self.optimizer_D_PB.step()
+                if first:
+                    self.optimizer_D_PB.zero_grad()
+                self.backward_D_PB(query_pool=i == 0 or not self.opt.reuse_D_fake)
+                if last:
+                    self.scaler_D_PB.step(self.optimizer_D_PB)
+                    self.scaler_D_PB.update()
 
 
     def get_current_errors(self):
@@ -255,26 +319,13 @@ class TransferModel(BaseModel):
 
         return ret_errors
 
-    def get_current_visuals(self):
-        height, width = self.input_P1.size(2), self.input_P1.size(3)
-        input_P1 = util.tensor2im(self.input_P1.data)
-        input_P2 = util.tensor2im(self.input_P2.data)
-
-        input_BP1 = util.draw_pose_from_map(self.input_BP1.data)[0]
-        input_BP2 = util.draw_pose_from_map(self.input_BP2.data)[0]
-
-        fake_p2 = util.tensor2im(self.fake_p2.data)
+    # detached cpu copies of the first sample, all that get_current_visuals needs
+    def get_current_snapshot(self):
+        return OrderedDict((name, getattr(self, name).data[:1].to('cpu', torch.float32, copy=True))
+                           for name in ['input_P1', 'input_BP1', 'input_P2', 'input_BP2', 'fake_p2'])
 
-        vis = np.zeros((height, width*5, 3)).astype(np.uint8) #h, w, c
-        vis[:, :width, :] = input_P1
-        vis[:, width:width*2, :] = input_BP1
-        vis[:, width*2:width*3, :] = input_P2
-        vis[:, width*3:width*4, :] = input_BP2
-        vis[:, width*4:, :] = fake_p2
-
-        ret_visuals = OrderedDict([('vis', vis)])
-
-        return ret_visuals
+    def get_current_visuals(self):
+        return util.pose_transfer_visuals(**self.get_current_snapshot())
 
     def save(self, label):
         self.save_network(self.netG,  'netG',  label, self.gpu_ids)
@@ -1,6 +1,9 @@
 import os
+import contextlib
+import functools
 import torch
 import torch.nn as nn
+from util.memory_format import MEMORY_FORMATS, ChannelsLastCheck
 
 
 class BaseModel(nn.Module):
@@ -15,12 +18,58 @@ class BaseModel(nn.Module):
         self.opt = opt
         self.gpu_ids = opt.gpu_ids
         self.isTrain = opt.isTrain
-        self.Tensor = torch.cuda.FloatTensor if self.gpu_ids else torch.Tensor
+        self.device = torch.device('cuda:%d' % self.gpu_ids[0]) if self.gpu_ids else torch.device('cpu')
+        # fp32 buffers on the device of the model, autocast casts them where it pays off
+        self.Tensor = functools.partial(torch.empty, dtype=torch.float32, device=self.device)
+        self.amp_dtype = {'off': None, 'fp16': torch.float16, 'bf16': torch.bfloat16}[opt.amp]
+        self.accum_samples = 0
+        self.memory_format = MEMORY_FORMATS[opt.memory_format]
         self.save_dir = os.path.join(opt.checkpoints_dir, opt.name)
 
     def set_input(self, input):
         self.input = input
 
+    # mixed precision region of --amp, a no-op when it is off
+    def autocast(self):
+        return torch.autocast(self.device.type, dtype=self.amp_dtype, enabled=self.amp_dtype is not None)
+
+    # layout assertion region of --check_memory_format, a no-op otherwise
+    def check_layout(self):
+        if self.opt.check_memory_format and self.memory_format == torch.channels_last:
+            return ChannelsLastCheck()
+        return contextlib.nullcontext()
+
+    # loss scaling of an optimizer, only needed by fp16 since bf16 has the exponent range of fp32
+    def grad_scaler(self):
+        return torch.amp.GradScaler(self.device.type, enabled=self.amp_dtype == torch.float16)
+
+    def set_requires_grad(self, nets, requires_grad):
+        for net in nets:
+            for param in net.parameters():
+                param.requires_grad = requires_grad
+
+    def accumulate(self, n_samples):
+        r""" Book a micro-batch of n_samples in the gradient accumulation of --accum_steps.
+        Sets self.loss_weight, the share of the micro-batch in the accumulated batch (the losses are batch means).
+        Returns:
+            (bool, bool): the micro-batch is the first one of an optimizer step, the last one
+        """
+        batch_size = self.opt.batchSize * self.opt.accum_steps
+        first = self.accum_samples == 0
+        self.loss_weight = 1.0 if self.opt.accum_steps == 1 else n_samples / float(batch_size)
+        self.accum_samples += n_samples
+        last = self.opt.accum_steps == 1 or self.accum_samples >= batch_size
+        if last:
+            self.accum_samples = 0
+        return first, last
+
+    # BatchNorm running statistics decay as much per optimizer step as without accumulation,
+    # the batch statistics themselves stay those of the micro-batch
+    def accumulate_batchnorm(self, net):
+        for m in net.modules():
+            if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.momentum is not None:
+                m.momentum = 1 - (1 - m.momentum) ** (1.0 / self.opt.accum_steps)
+
     def forward(self):
         pass
 
@@ -37,6 +86,9 @@ class BaseModel(nn.Module):
     def get_current_visuals(self):
         return self.input
 
+    def get_current_snapshot(self):
+        return self.get_current_visuals()
+
     def get_current_errors(self):
         return {}
 
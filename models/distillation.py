@@ -0,0 +1,85 @@
+import os
+
+import torch
+import torch.nn as nn
+
+from .inference import optimize_generator
+
+
+def trunk_channels(model):
+    r""" Channels of the trunk features of a PATNModel / XingModel, the input of its up sampling stream 1. """
+    conv = next(m for m in model.stream1_up.modules() if isinstance(m, (nn.Conv2d, nn.ConvTranspose2d)))
+    return conv.in_channels
+
+
+class TrunkFeatures(object):
+    r""" Keeps the trunk features (the stream 1 output of the last attention block) of the latest forward pass
+    of a PATNModel / XingModel, through a forward pre-hook on its stream1_up.
+    """
+    def __init__(self, model):
+        self.feature = None
+        self.hook = model.stream1_up.register_forward_pre_hook(self.capture)
+
+    def capture(self, module, input):
+        self.feature = input[0]
+
+    def remove(self):
+        self.hook.remove()
+
+
+class Teacher(nn.Module):
+    r""" Frozen generator distilled into a student: an eval-only copy (models.inference.optimize_generator) run
+    under no_grad, returning its output and optionally its trunk features.
+    Args:
+        netG: trained PATNetwork / XingNetwork
+        features (bool): also return the trunk features
+        cache_dir (str): if set, the results of every pair are saved there in fp16 on their first pass and loaded
+            afterwards. Only valid for deterministic pairs (no flips or random crops) and a fixed teacher.
+    """
+    def __init__(self, netG, features=False, cache_dir=''):
+        super(Teacher, self).__init__()
+        self.generator = optimize_generator(netG)
+        self.features = TrunkFeatures(self.generator.model) if features else None
+        self.cache_dir = cache_dir
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def channels(self):
+        return trunk_channels(self.generator.model)
+
+    def load(self, paths, device):
+        cached = [torch.load(path, map_location=device) for path in paths]
+        if self.features is not None and any('feature' not in c for c in cached):
+            return None
+        output = torch.stack([c['output'] for c in cached]).float()
+        feature = torch.stack([c['feature'] for c in cached]).float() if self.features is not None else None
+        return output, feature
+
+    def save(self, paths, output, feature):
+        for i, path in enumerate(paths):
+            # clones, a slice would save the storage of the whole batch
+            result = dict(output=output[i].detach().half().clone())
+            if feature is not None:
+                result['feature'] = feature[i].detach().half().clone()
+            torch.save(result, path)
+
+    def forward(self, image, pose, names=None):
+        r"""
+        Args:
+            names (list of str, optional): cache keys of the pairs of the batch
+        Returns:
+            (tensor, tensor or None): output of the teacher, its trunk features
+        """
+        paths = []
+        if self.cache_dir and names and len(names) == image.size(0):
+            paths = [os.path.join(self.cache_dir, name + '.pt') for name in names]
+        if paths and all(os.path.exists(path) for path in paths):
+            results = self.load(paths, image.device)
+            if results is not None:
+                return results
+        with torch.no_grad():
+            output = self.generator(image, pose)
+        feature = self.features.feature if self.features is not None else None
+        if paths:
+            self.save(paths, output, feature)
+        return output, feature
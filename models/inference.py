@@ -0,0 +1,188 @@
+import copy
+import json
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from .model_variants import PATBlock
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+EXPORT_FORMATS = {'torchscript': '.pt', 'onnx': '.onnx'}
+
+
+class InferenceGenerator(nn.Module):
+    r""" Eval-only generator taking two tensors instead of the [image, poses] list of PATNetwork / XingNetwork,
+    without their data_parallel dispatch.
+    Args:
+        image: (N, 3, h, w) source image
+        pose: (N, 2 * 18, h, w) pose maps of the source and the target pose, stacked along the channels
+    """
+    def __init__(self, model):
+        super(InferenceGenerator, self).__init__()
+        self.model = model
+
+    def forward(self, image, pose):
+        return self.model([image, pose])
+
+
+class FusedPATBlock(nn.Module):
+    r""" Eval-only PATBlock: the sigmoid gate and the residual connection in one addcmul, without the gated
+    stream 1 output of the training block.
+    """
+    def __init__(self, block):
+        super(FusedPATBlock, self).__init__()
+        self.conv_block_stream1 = block.conv_block_stream1
+        self.conv_block_stream2 = block.conv_block_stream2
+
+    def forward(self, x1, x2):
+        x2_out = self.conv_block_stream2(x2)
+        out = torch.addcmul(x1, self.conv_block_stream1(x1), torch.sigmoid(x2_out))
+        return out, torch.cat((x2_out, out), 1)
+
+
+def _foldable(conv, norm):
+    return (isinstance(conv, (nn.Conv2d, nn.ConvTranspose2d)) and isinstance(norm, nn.BatchNorm2d)
+            and norm.track_running_stats and not norm.training)
+
+
+def simplify(module):
+    r""" Folds every eval BatchNorm2d that follows a Conv2d / ConvTranspose2d in an nn.Sequential into the
+    convolution, and removes Dropout layers (a no-op in eval mode), in place.
+    Returns:
+        (int, int): number of folded norms, of removed dropouts
+    """
+    folded, removed = 0, 0
+    for name, child in module.named_children():
+        if isinstance(child, (nn.Dropout, nn.Dropout2d)):
+            setattr(module, name, nn.Identity())
+            removed += 1
+            continue
+        f, r = simplify(child)
+        folded, removed = folded + f, removed + r
+        if not isinstance(child, nn.Sequential):
+            continue
+        layers = []
+        for layer in child:
+            if isinstance(layer, nn.Identity):
+                continue
+            if layers and _foldable(layers[-1], layer):
+                layers[-1] = fuse_conv_bn_eval(layers[-1], layer, transpose=isinstance(layers[-1], nn.ConvTranspose2d))
+                folded += 1
+            else:
+                layers.append(layer)
+        setattr(module, name, nn.Sequential(*layers))
+    return folded, removed
+
+
+def optimize_generator(netG):
+    r""" Eval-only copy of a generator: BatchNorms folded, dropout removed, PATBlock gates fused, activation
+    checkpointing off and the parameters frozen. netG is left as it is.
+    Returns:
+        InferenceGenerator
+    """
+    model = copy.deepcopy(getattr(netG, 'model', netG)).eval()
+    if hasattr(model, 'checkpoint_blocks'):
+        model.checkpoint_blocks, model.checkpoint_stems = 0, False
+    simplify(model)
+    if hasattr(model, 'att'):
+        model.att = nn.ModuleList(FusedPATBlock(b) if isinstance(b, PATBlock) else b for b in model.att)
+    for p in model.parameters():
+        p.requires_grad_(False)
+    return InferenceGenerator(model)
+
+
+def freeze_generator(generator, example_inputs):
+    r""" TorchScript of an InferenceGenerator traced on example_inputs, with the parameters inlined as constants
+    by torch.jit.freeze (which also folds the conv / norm pairs outside of nn.Sequential containers).
+    """
+    with torch.no_grad():
+        traced = torch.jit.trace(generator.eval(), tuple(example_inputs))
+    return torch.jit.freeze(traced)
+
+
+# left in float by quantize_generator: the output Tanh and the attention gates
+FLOAT_OPS = [nn.Tanh, torch.tanh, torch.sigmoid, F.sigmoid, torch.addcmul]
+
+
+def quantize_generator(generator, calibration_inputs, backend='x86', float_ops=FLOAT_OPS):
+    r""" Post-training static int8 quantization of an InferenceGenerator with FX graph mode: observers are
+    calibrated on the (image, pose) batches of calibration_inputs, then the convolutions and their ReLUs run
+    in int8. float_ops stay in float, as well as the ops without a quantized kernel (reflection pads).
+    Not for Xing, whose attention reads tensor shapes that symbolic tracing cannot unpack.
+    Returns:
+        torch.fx.GraphModule: forward(image, pose)
+    """
+    calibration_inputs = iter(calibration_inputs)
+    example_inputs = tuple(next(calibration_inputs))
+    torch.backends.quantized.engine = backend
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    for op in float_ops:
+        qconfig_mapping.set_object_type(op, None)
+    prepared = prepare_fx(copy.deepcopy(generator).eval(), qconfig_mapping, example_inputs)
+    with torch.no_grad():
+        prepared(*example_inputs)
+        for inputs in calibration_inputs:
+            prepared(*inputs)
+    return convert_fx(prepared)
+
+
+def export_generator(generator, example_inputs, path, format='torchscript', opset_version=17, **config):
+    r""" Saves an InferenceGenerator as a frozen TorchScript module or an ONNX graph with inputs 'image' and 'pose'
+    and output 'output', all with a dynamic batch size. The resolution of example_inputs and config (the
+    generator options) are written next to it, to <path>.json.
+    """
+    image, pose = example_inputs
+    if format == 'torchscript':
+        torch.jit.save(freeze_generator(generator, example_inputs), path)
+    elif format == 'onnx':
+        batch = {0: 'batch'}
+        with torch.no_grad():
+            torch.onnx.export(generator.eval(), (image, pose), path, input_names=['image', 'pose'],
+                              output_names=['output'], dynamic_axes=dict(image=batch, pose=batch, output=batch),
+                              opset_version=opset_version, dynamo=False)
+    else:
+        raise NotImplementedError('export format [%s] is not implemented' % format)
+    config = dict(config, format=format, image_size=list(image.shape[2:]), image_nc=image.size(1),
+                  pose_nc=pose.size(1))
+    with open(path + '.json', 'w') as f:
+        json.dump(config, f, indent=2)
+    return config
+
+
+class ExportedGenerator(nn.Module):
+    r""" Generator run from an artifact of export_generator, called like netG with an [image, poses] list.
+    Args:
+        backend (str): 'torchscript', or 'onnxruntime' for an ONNX graph run on the cpu
+    """
+    def __init__(self, path, backend='torchscript', device='cpu'):
+        super(ExportedGenerator, self).__init__()
+        with open(path + '.json') as f:
+            self.config = json.load(f)
+        self.backend = backend
+        if backend == 'torchscript':
+            self.net = torch.jit.load(path, map_location=device)
+        elif backend == 'onnxruntime':
+            if onnxruntime is None:
+                raise ImportError('the onnxruntime backend needs the onnxruntime package')
+            self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        else:
+            raise NotImplementedError('backend [%s] is not implemented' % backend)
+
+    def forward(self, input):
+        image, pose = input
+        assert list(image.shape[2:]) == self.config['image_size'], \
+            'exported generator expects %s images, got %s' % (self.config['image_size'], list(image.shape[2:]))
+        if self.backend == 'onnxruntime':
+            feed = dict(image=image.detach().float().contiguous().cpu().numpy(),
+                        pose=pose.detach().float().contiguous().cpu().numpy())
+            return torch.from_numpy(self.session.run(['output'], feed)[0]).to(image.device)
+        with torch.no_grad():
+            return self.net(image, pose)
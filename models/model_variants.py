@@ -3,15 +3,100 @@ import functools
 import torch
 import functools
 import torch.nn.functional as F
+import contextlib
 from torch.autograd import Variable
+from torch.utils.checkpoint import checkpoint
+
+
+@contextlib.contextmanager
+def keep_running_stats(module):
+    # BatchNorm running statistics of module are left as they were before the block
+    norms = [m for m in module.modules()
+             if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.training and m.track_running_stats]
+    with torch.no_grad():
+        saved = [(m.running_mean.clone(), m.running_var.clone(), m.num_batches_tracked.clone()) for m in norms]
+    try:
+        yield
+    finally:
+        # also when the checkpoint stops the recomputation early
+        with torch.no_grad():
+            for m, (mean, var, n) in zip(norms, saved):
+                m.running_mean.copy_(mean)
+                m.running_var.copy_(var)
+                m.num_batches_tracked.copy_(n)
+
+
+def checkpointed(module, function, *inputs):
+    r""" function(*inputs), with the activations of module recomputed in the backward pass instead of stored.
+    The RNG state is restored for the recomputation, so dropout draws the same masks, and BatchNorm layers do
+    not update their running statistics a second time.
+    """
+    if not torch.is_grad_enabled():
+        return function(*inputs)
+    calls = []
+
+    def run(*inputs):
+        calls.append(None)
+        if len(calls) == 1:
+            return function(*inputs)
+        with keep_running_stats(module):
+            return function(*inputs)
+    return checkpoint(run, *inputs, use_reentrant=False, preserve_rng_state=True)
+
+
+def run_att_blocks(blocks, x1, x2, segment_size=0):
+    r""" Two streams through a sequence of attention blocks.
+    Args:
+        segment_size (int): checkpoint the blocks in groups of segment_size, only the stream tensors between
+            groups are kept for the backward pass; 0 keeps all activations
+    Returns:
+        (torch.Tensor, torch.Tensor): x1, x2 after the last block
+    """
+    if segment_size <= 0:
+        for model in blocks:
+            x1, x2 = model(x1, x2)[:2]
+        return x1, x2
+    for i in range(0, len(blocks), segment_size):
+        segment = blocks[i:i + segment_size]
+        x1, x2 = checkpointed(segment, functools.partial(run_att_blocks, segment), x1, x2)
+    return x1, x2
+
+
+def default_widths(ngf=64, n_blocks=9, n_downsampling=2):
+    r""" Channel widths of the full PATNModel, the format of a (pruned) width config:
+    stream1_down / stream2_down: outputs of the 7x7 and strided convs, the last stream 1 one being the trunk;
+    trunk: channels of the residual stream 1, of the gates and of each half of the concatenated stream 2;
+    blocks: inner widths of the two streams of every PATBlock;
+    stream1_up: outputs of the transposed convs.
+    """
+    dim = ngf * 2 ** n_downsampling
+    return dict(stream1_down=[ngf * 2 ** i for i in range(n_downsampling)],
+                stream2_down=[ngf * 2 ** i for i in range(n_downsampling + 1)],
+                trunk=dim,
+                blocks=[dict(stream1=dim, stream2=dim if i == 0 else dim * 2) for i in range(n_blocks)],
+                stream1_up=[ngf * 2 ** (n_downsampling - i - 1) for i in range(n_downsampling)])
+
 
 class PATBlock(nn.Module):
-    def __init__(self, dim, padding_type, norm_layer, use_dropout, use_bias, cated_stream2=False):
+    def __init__(self, dim, padding_type, norm_layer, use_dropout, use_bias, cated_stream2=False, widths=None,
+                 stream2_in=None):
+        r"""
+        Args:
+            widths (dict, optional): inner widths 'stream1' and 'stream2' of a pruned block
+            stream2_in (int, optional): input channels of a first block's stream 2, when the stream 2 stem is pruned
+        """
         super(PATBlock, self).__init__()
-        self.conv_block_stream1 = self.build_conv_block(dim, padding_type, norm_layer, use_dropout, use_bias, cal_att=False)
-        self.conv_block_stream2 = self.build_conv_block(dim, padding_type, norm_layer, use_dropout, use_bias, cal_att=True, cated_stream2=cated_stream2)
+        widths = widths or {}
+        self.conv_block_stream1 = self.build_conv_block(dim, padding_type, norm_layer, use_dropout, use_bias, cal_att=False,
+                                                        mid_dim=widths.get('stream1'))
+        self.conv_block_stream2 = self.build_conv_block(dim, padding_type, norm_layer, use_dropout, use_bias, cal_att=True, cated_stream2=cated_stream2,
+                                                        in_dim=stream2_in, mid_dim=widths.get('stream2'))
 
-    def build_conv_block(self, dim, padding_type, norm_layer, use_dropout, use_bias, cated_stream2=False, cal_att=False):
+    def build_conv_block(self, dim, padding_type, norm_layer, use_dropout, use_bias, cated_stream2=False, cal_att=False,
+                         in_dim=None, mid_dim=None):
+        # in_dim -> mid_dim -> dim channels, in_dim = mid_dim = dim (dim*2 on a concatenated stream 2) unless pruned
+        in_dim = in_dim or (dim*2 if cated_stream2 else dim)
+        mid_dim = mid_dim or in_dim
         conv_block = []
         p = 0
         if padding_type == 'reflect':
@@ -23,14 +108,9 @@ class PATBlock(nn.Module):
         else:
             raise NotImplementedError('padding [%s] is not implemented' % padding_type)
 
-        if cated_stream2:
-            conv_block += [nn.Conv2d(dim*2, dim*2, kernel_size=3, padding=p, bias=use_bias),
-                       norm_layer(dim*2),
+        conv_block += self.conv3x3(in_dim, mid_dim, p, use_bias) + \
+                      [norm_layer(mid_dim),
                        nn.ReLU(True)]
-        else:
-            conv_block += [nn.Conv2d(dim, dim, kernel_size=3, padding=p, bias=use_bias),
-                           norm_layer(dim),
-                           nn.ReLU(True)]
         if use_dropout:
             conv_block += [nn.Dropout(0.5)]
 
@@ -44,17 +124,15 @@ class PATBlock(nn.Module):
         else:
             raise NotImplementedError('padding [%s] is not implemented' % padding_type)
 
-        if cal_att:
-            if cated_stream2:
-                conv_block += [nn.Conv2d(dim*2, dim, kernel_size=3, padding=p, bias=use_bias)]
-            else:
-                conv_block += [nn.Conv2d(dim, dim, kernel_size=3, padding=p, bias=use_bias)]
-        else:
-            conv_block += [nn.Conv2d(dim, dim, kernel_size=3, padding=p, bias=use_bias),
-                       norm_layer(dim)]
+        conv_block += self.conv3x3(mid_dim, dim, p, use_bias)
+        if not cal_att:
+            conv_block += [norm_layer(dim)]
 
         return nn.Sequential(*conv_block)
 
+    def conv3x3(self, in_dim, out_dim, padding, use_bias):
+        return [nn.Conv2d(in_dim, out_dim, kernel_size=3, padding=padding, bias=use_bias)]
+
     def forward(self, x1, x2):
         x1_out = self.conv_block_stream1(x1)
         x2_out = self.conv_block_stream2(x2)
@@ -68,8 +146,19 @@ class PATBlock(nn.Module):
         return out, x2_out, x1_out
 
 
+class PATBlockLite(PATBlock):
+    r""" PATBlock with depthwise-separable convolutions: a 3x3 depthwise convolution followed by a 1x1 one in
+    place of every 3x3 convolution of both streams, about 9x fewer multiply-adds at the widths of the blocks.
+    The gating and the feedback to stream 2 are those of PATBlock.
+    """
+    def conv3x3(self, in_dim, out_dim, padding, use_bias):
+        return [nn.Conv2d(in_dim, in_dim, kernel_size=3, padding=padding, groups=in_dim, bias=False),
+                nn.Conv2d(in_dim, out_dim, kernel_size=1, bias=use_bias)]
+
+
 class PATNModel(nn.Module):
-    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, gpu_ids=[], padding_type='reflect', n_downsampling=2):
+    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, gpu_ids=[], padding_type='reflect', n_downsampling=2,
+                 checkpoint_blocks=0, checkpoint_stems=False, widths=None, block=PATBlock):
         assert(n_blocks >= 0 and type(input_nc) == list)
         super(PATNModel, self).__init__()
         self.input_nc_s1 = input_nc[0]
@@ -77,57 +166,67 @@ class PATNModel(nn.Module):
         self.output_nc = output_nc
         self.ngf = ngf
         self.gpu_ids = gpu_ids
+        # activation checkpointing: PATBlocks per checkpointed segment, and the down/up samplings
+        self.checkpoint_blocks = checkpoint_blocks
+        self.checkpoint_stems = checkpoint_stems
+        # channel widths, see default_widths; narrower ones for a pruned generator
+        self.widths = widths or default_widths(ngf, n_blocks, n_downsampling)
+        assert len(self.widths['blocks']) == n_blocks and len(self.widths['stream1_up']) == n_downsampling, \
+            'width config of %d blocks and %d up samplings' % (len(self.widths['blocks']), len(self.widths['stream1_up']))
         if type(norm_layer) == functools.partial:
-            use_bias = norm_layer.func == nn.InstanceNorm2d
+            use_bias = issubclass(norm_layer.func, nn.InstanceNorm2d)
         else:
-            use_bias = norm_layer == nn.InstanceNorm2d
+            use_bias = isinstance(norm_layer, type) and issubclass(norm_layer, nn.InstanceNorm2d)
+
+        dim = self.widths['trunk']
+        stream1 = self.widths['stream1_down'] + [dim]
+        stream2 = self.widths['stream2_down']
 
         # down_sample
         model_stream1_down = [nn.ReflectionPad2d(3),
-                    nn.Conv2d(self.input_nc_s1, ngf, kernel_size=7, padding=0,
+                    nn.Conv2d(self.input_nc_s1, stream1[0], kernel_size=7, padding=0,
                            bias=use_bias),
-                    norm_layer(ngf),
+                    norm_layer(stream1[0]),
                     nn.ReLU(True)]
 
         model_stream2_down = [nn.ReflectionPad2d(3),
-                    nn.Conv2d(self.input_nc_s2, ngf, kernel_size=7, padding=0,
+                    nn.Conv2d(self.input_nc_s2, stream2[0], kernel_size=7, padding=0,
                            bias=use_bias),
-                    norm_layer(ngf),
+                    norm_layer(stream2[0]),
                     nn.ReLU(True)]
 
         # n_downsampling = 2
         for i in range(n_downsampling):
-            mult = 2**i
-            model_stream1_down += [nn.Conv2d(ngf * mult, ngf * mult * 2, kernel_size=3,
+            model_stream1_down += [nn.Conv2d(stream1[i], stream1[i + 1], kernel_size=3,
                                 stride=2, padding=1, bias=use_bias),
-                            norm_layer(ngf * mult * 2),
+                            norm_layer(stream1[i + 1]),
                             nn.ReLU(True)]
-            model_stream2_down += [nn.Conv2d(ngf * mult, ngf * mult * 2, kernel_size=3,
+            model_stream2_down += [nn.Conv2d(stream2[i], stream2[i + 1], kernel_size=3,
                                 stride=2, padding=1, bias=use_bias),
-                            norm_layer(ngf * mult * 2),
+                            norm_layer(stream2[i + 1]),
                             nn.ReLU(True)]
 
         # att_block in place of res_block
-        mult = 2**n_downsampling
         cated_stream2 = [True for i in range(n_blocks)]
         cated_stream2[0] = False
         attBlock = nn.ModuleList()
         for i in range(n_blocks):
-            attBlock.append(PATBlock(ngf * mult, padding_type=padding_type, norm_layer=norm_layer, use_dropout=use_dropout, use_bias=use_bias, cated_stream2=cated_stream2[i]))
+            attBlock.append(block(dim, padding_type=padding_type, norm_layer=norm_layer, use_dropout=use_dropout, use_bias=use_bias, cated_stream2=cated_stream2[i],
+                                     widths=self.widths['blocks'][i], stream2_in=None if cated_stream2[i] else stream2[-1]))
 
         # up_sample
+        up = [dim] + self.widths['stream1_up']
         model_stream1_up = []
         for i in range(n_downsampling):
-            mult = 2**(n_downsampling - i)
-            model_stream1_up += [nn.ConvTranspose2d(ngf * mult, int(ngf * mult / 2),
+            model_stream1_up += [nn.ConvTranspose2d(up[i], up[i + 1],
                                          kernel_size=3, stride=2,
                                          padding=1, output_padding=1,
                                          bias=use_bias),
-                            norm_layer(int(ngf * mult / 2)),
+                            norm_layer(up[i + 1]),
                             nn.ReLU(True)]
 
         model_stream1_up += [nn.ReflectionPad2d(3)]
-        model_stream1_up += [nn.Conv2d(ngf, output_nc, kernel_size=7, padding=0)]
+        model_stream1_up += [nn.Conv2d(up[-1], output_nc, kernel_size=7, padding=0)]
         model_stream1_up += [nn.Tanh()]
 
         # self.model = nn.Sequential(*model)
@@ -141,24 +240,33 @@ class PATNModel(nn.Module):
         # here x should be a tuple
         x1, x2 = input
         # down_sample
-        x1 = self.stream1_down(x1)
-        x2 = self.stream2_down(x2)
+        if self.checkpoint_stems:
+            x1 = checkpointed(self.stream1_down, self.stream1_down, x1)
+            x2 = checkpointed(self.stream2_down, self.stream2_down, x2)
+        else:
+            x1 = self.stream1_down(x1)
+            x2 = self.stream2_down(x2)
         # att_block
-        for model in self.att:
-            x1, x2, _ = model(x1, x2)
+        x1, x2 = run_att_blocks(self.att, x1, x2, self.checkpoint_blocks)
 
         # up_sample
-        x1 = self.stream1_up(x1)
+        if self.checkpoint_stems:
+            x1 = checkpointed(self.stream1_up, self.stream1_up, x1)
+        else:
+            x1 = self.stream1_up(x1)
 
         return x1
 
 
 class PATNetwork(nn.Module):
-    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, gpu_ids=[], padding_type='reflect', n_downsampling=2):
+    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, gpu_ids=[], padding_type='reflect', n_downsampling=2,
+                 checkpoint_blocks=0, checkpoint_stems=False, widths=None, block=PATBlock):
         super(PATNetwork, self).__init__()
         assert type(input_nc) == list and len(input_nc) == 2, 'The AttModule take input_nc in format of list only!!'
         self.gpu_ids = gpu_ids
-        self.model = PATNModel(input_nc, output_nc, ngf, norm_layer, use_dropout, n_blocks, gpu_ids, padding_type, n_downsampling=n_downsampling)
+        self.model = PATNModel(input_nc, output_nc, ngf, norm_layer, use_dropout, n_blocks, gpu_ids, padding_type, n_downsampling=n_downsampling,
+                               checkpoint_blocks=checkpoint_blocks, checkpoint_stems=checkpoint_stems, widths=widths,
+                               block=block)
 
     def forward(self, input):
         if self.gpu_ids and isinstance(input[0].data, torch.cuda.FloatTensor):
@@ -3,6 +3,26 @@ import functools
 import torch
 import functools
 import torch.nn.functional as F
+from .model_variants import checkpointed, run_att_blocks
+
+
+def attend(value, attention, like):
+    r""" bmm(value, attention^T) of the (b, C, hw) values, as a (b, C, h, w) tensor in the memory format of like.
+    For channels_last the product is taken transposed, so that it comes out in that layout.
+    """
+    b, C, h, w = like.size()
+    if like.is_contiguous(memory_format=torch.channels_last) and not like.is_contiguous():
+        return torch.bmm(attention, value.permute(0, 2, 1)).permute(0, 2, 1).view(b, C, h, w)
+    return torch.bmm(value, attention.permute(0, 2, 1)).view(b, C, h, w)
+
+
+def channel_softmax(x):
+    r""" Softmax over the channels, taken over the innermost dimension of channels_last tensors so that the
+    result keeps their layout.
+    """
+    if x.is_contiguous(memory_format=torch.channels_last) and not x.is_contiguous():
+        return x.permute(0, 2, 3, 1).softmax(-1).permute(0, 3, 1, 2)
+    return F.softmax(x, dim=1)
 
 
 class XingBlock(nn.Module):
@@ -81,8 +101,7 @@ class XingBlock(nn.Module):
         proj_value = self.value_conv(x1_out).view(m_batchsize, -1, width * height)
         # print('proj_value', proj_value.size()) [32, 256, 512]
 
-        x1_out_1 = torch.bmm(proj_value, attention.permute(0, 2, 1))
-        x1_out_1 = x1_out_1.view(m_batchsize, C, height, width)
+        x1_out_1 = attend(proj_value, attention, x1_out)
         # print('x1_out', x1_out.size()) [32, 256, 32, 16]
         x1_out_update = x1_out + self.gamma*x1_out_1  # connection
 
@@ -99,8 +118,7 @@ class XingBlock(nn.Module):
         proj_value = self.value_conv(x2_out).view(m_batchsize, -1, width * height)
         # print('proj_value', proj_value.size()) [32, 256, 512]
 
-        x2_out_1 = torch.bmm(proj_value, attention.permute(0, 2, 1))
-        x2_out_1 = x2_out_1.view(m_batchsize, C, height, width)
+        x2_out_1 = attend(proj_value, attention, x2_out)
         # print('x1_out', x1_out.size()) [32, 256, 32, 16]
         x2_out_update = x2_out + self.gamma*x2_out_1  # connection
         # Update Image Branch
@@ -112,7 +130,8 @@ class XingBlock(nn.Module):
         return x1_out_update, x2_out_update
 
 class XingModel(nn.Module):
-    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, gpu_ids=[], padding_type='reflect', n_downsampling=2):
+    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, gpu_ids=[], padding_type='reflect', n_downsampling=2,
+                 checkpoint_blocks=0, checkpoint_stems=False):
         assert(n_blocks >= 0 and type(input_nc) == list)
         super(XingModel, self).__init__()
         self.input_nc_s1 = input_nc[0]
@@ -120,10 +139,13 @@ class XingModel(nn.Module):
         self.output_nc = output_nc
         self.ngf = ngf
         self.gpu_ids = gpu_ids
+        # activation checkpointing: XingBlocks per checkpointed segment, and the down/up samplings
+        self.checkpoint_blocks = checkpoint_blocks
+        self.checkpoint_stems = checkpoint_stems
         if type(norm_layer) == functools.partial:
-            use_bias = norm_layer.func == nn.InstanceNorm2d
+            use_bias = issubclass(norm_layer.func, nn.InstanceNorm2d)
         else:
-            use_bias = norm_layer == nn.InstanceNorm2d
+            use_bias = isinstance(norm_layer, type) and issubclass(norm_layer, nn.InstanceNorm2d)
 
         # down_sample
         model_stream1_down = [nn.ReflectionPad2d(3),
@@ -210,11 +232,14 @@ class XingModel(nn.Module):
         image, x2 = input
         #print('x1',x1.size()) [32, 3, 128, 64]
         # down_sample
-        x1 = self.stream1_down(image)
-        x2 = self.stream2_down(x2)
+        if self.checkpoint_stems:
+            x1 = checkpointed(self.stream1_down, self.stream1_down, image)
+            x2 = checkpointed(self.stream2_down, self.stream2_down, x2)
+        else:
+            x1 = self.stream1_down(image)
+            x2 = self.stream2_down(x2)
         # att_block
-        for model in self.att:
-            x1, x2 = model(x1, x2)
+        x1, x2 = run_att_blocks(self.att, x1, x2, self.checkpoint_blocks)
 
         # print('x1', x1.size()) [32, 256, 32, 16]
         # print('x2', x2.size()) [32, 512, 32, 16]
@@ -229,8 +254,7 @@ class XingModel(nn.Module):
         attention = self.atte_relu1(attention)
         attention = self.atte_con2(attention)
 
-        softmax_ = torch.nn.Softmax(dim=1)
-        attention = softmax_(attention)
+        attention = channel_softmax(attention)
         attention1 = attention[:,0:1,:,:]
         attention2 = attention[:,1:2,:,:]
         attention3 = attention[:,2:3,:,:]
@@ -253,30 +277,33 @@ class XingModel(nn.Module):
         attention20 = attention[:,19:20,:,:]
         attention21 = attention[:,20:21,:,:]
 
-        attention1 = attention1.repeat(1,3,1,1)
-        attention2 = attention2.repeat(1,3,1,1)
-        attention3 = attention3.repeat(1,3,1,1)
-        attention4 = attention4.repeat(1,3,1,1)
-        attention5 = attention5.repeat(1,3,1,1)
-        attention6 = attention6.repeat(1,3,1,1)
-        attention7 = attention7.repeat(1,3,1,1)
-        attention8 = attention8.repeat(1,3,1,1)
-        attention9 = attention9.repeat(1,3,1,1)
-        attention10 = attention10.repeat(1,3,1,1)
-        attention11 = attention11.repeat(1,3,1,1)
-        attention12 = attention12.repeat(1,3,1,1)
-        attention13 = attention13.repeat(1,3,1,1)
-        attention14 = attention14.repeat(1,3,1,1)
-        attention15 = attention15.repeat(1,3,1,1)
-        attention16 = attention16.repeat(1,3,1,1)
-        attention17 = attention17.repeat(1,3,1,1)
-        attention18 = attention18.repeat(1,3,1,1)
-        attention19 = attention19.repeat(1,3,1,1)
-        attention20 = attention20.repeat(1,3,1,1)
-        attention21 = attention21.repeat(1,3,1,1)
+        attention1 = attention1.expand(-1,3,-1,-1)
+        attention2 = attention2.expand(-1,3,-1,-1)
+        attention3 = attention3.expand(-1,3,-1,-1)
+        attention4 = attention4.expand(-1,3,-1,-1)
+        attention5 = attention5.expand(-1,3,-1,-1)
+        attention6 = attention6.expand(-1,3,-1,-1)
+        attention7 = attention7.expand(-1,3,-1,-1)
+        attention8 = attention8.expand(-1,3,-1,-1)
+        attention9 = attention9.expand(-1,3,-1,-1)
+        attention10 = attention10.expand(-1,3,-1,-1)
+        attention11 = attention11.expand(-1,3,-1,-1)
+        attention12 = attention12.expand(-1,3,-1,-1)
+        attention13 = attention13.expand(-1,3,-1,-1)
+        attention14 = attention14.expand(-1,3,-1,-1)
+        attention15 = attention15.expand(-1,3,-1,-1)
+        attention16 = attention16.expand(-1,3,-1,-1)
+        attention17 = attention17.expand(-1,3,-1,-1)
+        attention18 = attention18.expand(-1,3,-1,-1)
+        attention19 = attention19.expand(-1,3,-1,-1)
+        attention20 = attention20.expand(-1,3,-1,-1)
+        attention21 = attention21.expand(-1,3,-1,-1)
 
         # up_sample
-        x1 = self.stream1_up(x1)
+        if self.checkpoint_stems:
+            x1 = checkpointed(self.stream1_up, self.stream1_up, x1)
+        else:
+            x1 = self.stream1_up(x1)
         image1 = x1[:, 0:3, :, :]
         image2 = x1[:, 3:6, :, :]
         image3 = x1[:, 6:9, :, :]
@@ -292,7 +319,10 @@ class XingModel(nn.Module):
         x2 = self.x2_con(x2)
         x2 = self.x2_norm(x2)
         x2 = self.x2_relu(x2)
-        x2 = self.stream2_up(x2)
+        if self.checkpoint_stems:
+            x2 = checkpointed(self.stream2_up, self.stream2_up, x2)
+        else:
+            x2 = self.stream2_up(x2)
 
         image11 = x2[:, 0:3, :, :]
         image12 = x2[:, 3:6, :, :]
@@ -332,11 +362,13 @@ class XingModel(nn.Module):
 
 
 class XingNetwork(nn.Module):
-    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, gpu_ids=[], padding_type='reflect', n_downsampling=2):
+    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, gpu_ids=[], padding_type='reflect', n_downsampling=2,
+                 checkpoint_blocks=0, checkpoint_stems=False):
         super(XingNetwork, self).__init__()
         assert type(input_nc) == list and len(input_nc) == 2, 'The AttModule take input_nc in format of list only!!'
         self.gpu_ids = gpu_ids
-        self.model = XingModel(input_nc, output_nc, ngf, norm_layer, use_dropout, n_blocks, gpu_ids, padding_type, n_downsampling=n_downsampling)
+        self.model = XingModel(input_nc, output_nc, ngf, norm_layer, use_dropout, n_blocks, gpu_ids, padding_type, n_downsampling=n_downsampling,
+                               checkpoint_blocks=checkpoint_blocks, checkpoint_stems=checkpoint_stems)
 
     def forward(self, input):
         if self.gpu_ids and isinstance(input[0].data, torch.cuda.FloatTensor):
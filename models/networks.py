@@ -2,13 +2,14 @@ import torch
 import torch.nn as nn
 from torch.nn import init
 import functools
+import json
 from torch.autograd import Variable
 from torch.optim import lr_scheduler
 import numpy as np
 import torch.nn.functional as F
 
 import sys
-from models.model_variants import PATNetwork
+from models.model_variants import PATNetwork, PATBlockLite
 from models.model_variants_xing import XingNetwork
 
 def weights_init_normal(m):
@@ -72,13 +73,24 @@ def init_weights(net, init_type='normal'):
         raise NotImplementedError('initialization method [%s] is not implemented' % init_type)
 
 
+class InstanceNorm2d(nn.InstanceNorm2d):
+    r""" nn.InstanceNorm2d that keeps channels_last inputs channels_last: without running statistics it is a
+    group norm of one channel per group, instance_norm itself goes through a contiguous batch_norm.
+    """
+    def forward(self, input):
+        if not self.track_running_stats and input.dim() == 4 and not input.is_contiguous() \
+                and input.is_contiguous(memory_format=torch.channels_last):
+            return F.group_norm(input, input.size(1), self.weight, self.bias, self.eps)
+        return super(InstanceNorm2d, self).forward(input)
+
+
 def get_norm_layer(norm_type='instance'):
     if norm_type == 'batch':
         norm_layer = functools.partial(nn.BatchNorm2d, affine=True)
     elif norm_type == 'batch_sync':
         norm_layer = BatchNorm2d
     elif norm_type == 'instance':
-        norm_layer = functools.partial(nn.InstanceNorm2d, affine=False)
+        norm_layer = functools.partial(InstanceNorm2d, affine=False)
     elif norm_type == 'none':
         norm_layer = None
     else:
@@ -102,11 +114,28 @@ def get_scheduler(optimizer, opt):
     return scheduler
 
 
+def load_widths(path):
+    r""" Width config of a pruned PATN generator, the json file written by tool/prune_G.py. """
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_widths(widths, path):
+    with open(path, 'w') as f:
+        json.dump(widths, f, indent=2)
+
+
 def define_G(input_nc, output_nc, ngf, which_model_netG, norm='batch', use_dropout=False, init_type='normal',
-             gpu_ids=[], n_blocks=9, n_downsampling=2):
+             gpu_ids=[], n_blocks=9, n_downsampling=2, checkpoint_blocks=0, checkpoint_stems=False, widths=None):
+    r"""
+    Args:
+        widths (dict or str, optional): channel widths of a pruned PATN generator, or the path of their json file
+    """
     netG = None
     use_gpu = len(gpu_ids) > 0
     norm_layer = get_norm_layer(norm_type=norm)
+    if isinstance(widths, str):
+        widths = load_widths(widths)
 
     if use_gpu:
         assert (torch.cuda.is_available())
@@ -114,11 +143,21 @@ def define_G(input_nc, output_nc, ngf, which_model_netG, norm='batch', use_dropo
     if which_model_netG == 'PATN':
         assert len(input_nc) == 2
         netG = PATNetwork(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout,
-                                           n_blocks=n_blocks, gpu_ids=gpu_ids, n_downsampling=n_downsampling)
+                                           n_blocks=n_blocks, gpu_ids=gpu_ids, n_downsampling=n_downsampling,
+                                           checkpoint_blocks=checkpoint_blocks, checkpoint_stems=checkpoint_stems,
+                                           widths=widths)
+    elif which_model_netG == 'PATN_lite':
+        assert len(input_nc) == 2
+        netG = PATNetwork(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout,
+                                           n_blocks=n_blocks, gpu_ids=gpu_ids, n_downsampling=n_downsampling,
+                                           checkpoint_blocks=checkpoint_blocks, checkpoint_stems=checkpoint_stems,
+                                           widths=widths, block=PATBlockLite)
     elif which_model_netG == 'Xing':
         assert len(input_nc) == 2
+        assert widths is None, 'width configs are only supported by PATN and PATN_lite'
         netG = XingNetwork(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout,
-                                           n_blocks=n_blocks, gpu_ids=gpu_ids, n_downsampling=n_downsampling)
+                                           n_blocks=n_blocks, gpu_ids=gpu_ids, n_downsampling=n_downsampling,
+                                           checkpoint_blocks=checkpoint_blocks, checkpoint_stems=checkpoint_stems)
     else:
         raise NotImplementedError('Generator model name [%s] is not recognized' % which_model_netG)
     if len(gpu_ids) > 0:
@@ -158,6 +197,57 @@ def print_network(net):
     print('Total number of parameters: %d' % num_params)
 
 
+def _tensor_shapes(x):
+    if isinstance(x, torch.Tensor):
+        return (tuple(x.shape),)
+    if isinstance(x, (list, tuple)):
+        return sum((_tensor_shapes(v) for v in x), ())
+    if isinstance(x, dict):
+        return sum((_tensor_shapes(v) for v in x.values()), ())
+    return ()
+
+
+def compile_network(net, mode='default'):
+    r""" Run net.forward through torch.compile, in place so that the state dict keys do not change.
+    The graphs are specialized to static shapes: the batch size and image resolution of the dataset, a short last
+    batch compiles one more graph. When compilation fails net falls back to eager execution and compile_failed
+    is set on it (on its inner model for networks with one). Errors are raised to that fallback locally, the
+    global dynamo config is left as it is.
+    Single device only: the wrapper is bound to the module, data_parallel replicas would run it on the first gpu.
+    """
+    assert len(getattr(net, 'gpu_ids', [])) <= 1, 'compile_network does not support data_parallel networks'
+    module = getattr(net, 'model', net)
+    eager = module.forward
+    compiled = torch.compile(eager, mode=mode, dynamic=False)
+    # input shapes already compiled, the calls with new ones compile a graph and may fail half way
+    compiled_shapes = set()
+
+    def forward(*inputs, **kwargs):
+        if not module.compile_failed:
+            shapes = _tensor_shapes((inputs, kwargs))
+            buffers = None
+            if shapes not in compiled_shapes:
+                # a failing call may have updated the BatchNorm statistics, the eager run starts over
+                with torch.no_grad():
+                    buffers = [b.clone() for b in module.buffers()]
+            try:
+                with torch._dynamo.config.patch(suppress_errors=False):
+                    output = compiled(*inputs, **kwargs)
+                compiled_shapes.add(shapes)
+                return output
+            except Exception as e:
+                module.compile_failed = True
+                if buffers is not None:
+                    with torch.no_grad():
+                        for b, saved in zip(module.buffers(), buffers):
+                            b.copy_(saved)
+                print('torch.compile of %s failed, running it eagerly: %s' % (module.__class__.__name__, e))
+        return eager(*inputs, **kwargs)
+    module.compile_failed = False
+    module.forward = forward
+    return net
+
+
 ##############################################################################
 # Classes
 ##############################################################################    
@@ -184,23 +274,27 @@ class GANLoss(nn.Module):
         target_tensor = None
         if target_is_real:
             create_label = ((self.real_label_var is None) or
-                            (self.real_label_var.numel() != input.numel()))
+                            (self.real_label_var.numel() != input.numel()) or
+                            (self.real_label_var.is_contiguous() != input.is_contiguous()))
             if create_label:
-                real_tensor = self.Tensor(input.size()).fill_(self.real_label)
+                # in the layout of the input, channels_last predictions get channels_last targets
+                real_tensor = torch.empty_like(input, dtype=torch.float32).fill_(self.real_label)
                 self.real_label_var = Variable(real_tensor, requires_grad=False)
             target_tensor = self.real_label_var
         else:
             create_label = ((self.fake_label_var is None) or
-                            (self.fake_label_var.numel() != input.numel()))
+                            (self.fake_label_var.numel() != input.numel()) or
+                            (self.fake_label_var.is_contiguous() != input.is_contiguous()))
             if create_label:
-                fake_tensor = self.Tensor(input.size()).fill_(self.fake_label)
+                # in the layout of the input, channels_last predictions get channels_last targets
+                fake_tensor = torch.empty_like(input, dtype=torch.float32).fill_(self.fake_label)
                 self.fake_label_var = Variable(fake_tensor, requires_grad=False)
             target_tensor = self.fake_label_var
         return target_tensor
 
     def __call__(self, input, target_is_real):
         target_tensor = self.get_target_tensor(input, target_is_real)
-        return self.loss(input, target_tensor)
+        return self.loss(input.float(), target_tensor)
 
 # Define a resnet block
 class ResnetBlock(nn.Module):
@@ -253,9 +347,9 @@ class ResnetDiscriminator(nn.Module):
         self.ngf = ngf
         self.gpu_ids = gpu_ids
         if type(norm_layer) == functools.partial:
-            use_bias = norm_layer.func == nn.InstanceNorm2d
+            use_bias = issubclass(norm_layer.func, nn.InstanceNorm2d)
         else:
-            use_bias = norm_layer == nn.InstanceNorm2d
+            use_bias = isinstance(norm_layer, type) and issubclass(norm_layer, nn.InstanceNorm2d)
 
         model = [nn.ReflectionPad2d(3),
                  nn.Conv2d(input_nc, ngf, kernel_size=7, padding=0,
@@ -21,7 +21,7 @@ class BaseOptions():
         self.parser.add_argument('--ngf', type=int, default=64, help='# of gen filters in first conv layer')
         self.parser.add_argument('--ndf', type=int, default=64, help='# of discrim filters in first conv layer')
         self.parser.add_argument('--which_model_netD', type=str, default='resnet', help='selects model to use for netD')
-        self.parser.add_argument('--which_model_netG', type=str, default='PATN', help='selects model to use for netG')
+        self.parser.add_argument('--which_model_netG', type=str, default='PATN', help='selects model to use for netG: PATN|PATN_lite|Xing')
         self.parser.add_argument('--n_layers_D', type=int, default=3, help='blocks used in D')
         self.parser.add_argument('--gpu_ids', type=str, default='0', help='gpu ids: e.g. 0  0,1,2, 0,2. use -1 for CPU')
         self.parser.add_argument('--name', type=str, default='experiment_name', help='name of the experiment. It decides where to store samples and models')
@@ -58,6 +58,14 @@ class BaseOptions():
         # down-sampling times
         self.parser.add_argument('--G_n_downsampling', type=int, default=2, help='down-sampling blocks for generator')
         self.parser.add_argument('--D_n_downsampling', type=int, default=2, help='down-sampling blocks for discriminator')
+        self.parser.add_argument('--checkpoint_blocks', type=int, default=0, help='recompute the generator attention blocks in the backward pass, in segments of this many blocks (0: off)')
+        self.parser.add_argument('--checkpoint_stems', action='store_true', help='also recompute the down and up sampling stems of the generator')
+        self.parser.add_argument('--compile', action='store_true', help='run the generator, discriminators and losses through torch.compile, falling back to eager execution on failure; single gpu only')
+        self.parser.add_argument('--compile_mode', type=str, default='default', choices=['default', 'reduce-overhead', 'max-autotune'], help='torch.compile mode')
+        self.parser.add_argument('--G_widths', type=str, default='', help='width config (json) of a pruned PATN generator, written by tool/prune_G.py')
+        self.parser.add_argument('--memory_format', type=str, default='contiguous', choices=['contiguous', 'channels_last'], help='memory layout of the networks and input batches')
+        self.parser.add_argument('--check_memory_format', action='store_true', help='raise when an op of a forward pass converts channels_last tensors back to NCHW')
+        self.parser.add_argument('--amp', type=str, default='off', choices=['off', 'fp16', 'bf16'], help='mixed precision autocast of the networks and losses, bf16 also runs on cpu')
 
         self.initialized = True
 
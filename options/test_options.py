@@ -10,6 +10,9 @@ class TestOptions(BaseOptions):
         self.parser.add_argument('--phase', type=str, default='test', help='train, val, test, etc')
         self.parser.add_argument('--which_epoch', type=str, default='latest', help='which epoch to load? set to latest to use latest cached model')
         self.parser.add_argument('--how_many', type=int, default=200, help='how many test images to run')
+        self.parser.add_argument('--backend', type=str, default='torch', choices=['torch', 'torchscript', 'onnxruntime'], help='run the generator from the checkpoint, or from the --exported_G artifact of tool/export_G.py (onnxruntime runs on the cpu)')
+        self.parser.add_argument('--exported_G', type=str, default='', help='TorchScript (.pt) or ONNX (.onnx) generator for --backend torchscript / onnxruntime')
+        self.parser.add_argument('--html_page_size', type=int, default=500, help='results per page of the html index')
 
         self.parser.add_argument('--pairLst', type=str, default='market-pairs-test.csv', help='market pairs')
         self.parser.add_argument('--annoLst', type=str, default='market-annotation-test.csv', help='market pairs')
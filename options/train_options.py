@@ -6,6 +6,8 @@ class TrainOptions(BaseOptions):
         BaseOptions.initialize(self)
         self.parser.add_argument('--display_freq', type=int, default=100, help='frequency of showing training results on screen')
         self.parser.add_argument('--display_single_pane_ncols', type=int, default=0, help='if positive, display all images in a single visdom web panel with certain number of images per row.')
+        self.parser.add_argument('--sync_display', action='store_true', help='render and log on the training process instead of a background worker')
+        self.parser.add_argument('--display_queue_size', type=int, default=2, help='results waiting for the background visualizer, newer ones are dropped when it is full')
         self.parser.add_argument('--update_html_freq', type=int, default=1000, help='frequency of saving training results to html')
         self.parser.add_argument('--print_freq', type=int, default=100, help='frequency of showing training results on console')
         self.parser.add_argument('--save_latest_freq', type=int, default=5000, help='frequency of saving the latest results')
@@ -27,6 +29,7 @@ class TrainOptions(BaseOptions):
         # self.parser.add_argument('--lambda_perssim', type=float, default=10.0, help='weight of style loss')
 
         self.parser.add_argument('--pool_size', type=int, default=50, help='the size of image buffer that stores previously generated images')
+        self.parser.add_argument('--pool_pin_memory', action='store_true', help='keep the image buffers in pinned host memory instead of on the gpu')
         self.parser.add_argument('--no_html', action='store_true', help='do not save intermediate training results to [opt.checkpoints_dir]/[opt.name]/web/')
         self.parser.add_argument('--lr_policy', type=str, default='lambda', help='learning rate policy: lambda|step|plateau')
         self.parser.add_argument('--lr_decay_iters', type=int, default=50, help='multiply by a gamma every lr_decay_iters iterations')
@@ -36,6 +39,19 @@ class TrainOptions(BaseOptions):
         self.parser.add_argument('--percep_is_l1', type=int, default=1, help='type of perceptual loss: l1 or l2')
         self.parser.add_argument('--no_dropout_D', action='store_true', help='no dropout for the discriminator')
         self.parser.add_argument('--DG_ratio', type=int, default=1, help='how many times for D training after training G once')
+        self.parser.add_argument('--fuse_D_batches', action='store_true', help='run real and fake through a discriminator as one batch (skipped with batch norm)')
+        self.parser.add_argument('--fuse_D_batchnorm', action='store_true', help='fuse the real and fake batches also with batch norm, which then normalizes them together')
+        self.parser.add_argument('--accum_steps', type=int, default=1, help='micro-batches of batchSize whose gradients are accumulated per optimizer step, the effective batch is batchSize * accum_steps')
+        self.parser.add_argument('--reuse_D_fake', action='store_true', help='query the image pool once per iteration and reuse the fake batch for the DG_ratio D updates')
+        self.parser.add_argument('--teacher_checkpoint', type=str, default='', help='netG checkpoint of a trained generator distilled into the (smaller) generator being trained')
+        self.parser.add_argument('--teacher_which_model_netG', type=str, default='', help='architecture of the teacher, PATN|PATN_lite|Xing, that of the student by default')
+        self.parser.add_argument('--teacher_ngf', type=int, default=64, help='# of gen filters of the teacher')
+        self.parser.add_argument('--teacher_n_blocks', type=int, default=9, help='# of attention blocks of the teacher')
+        self.parser.add_argument('--teacher_n_downsampling', type=int, default=2, help='down samplings of the teacher')
+        self.parser.add_argument('--teacher_no_dropout', action='store_true', help='the teacher was trained with --no_dropout')
+        self.parser.add_argument('--teacher_cache', type=str, default='', help='directory caching the teacher results of every pair, only for deterministic pairs (no --use_flip or random crops)')
+        self.parser.add_argument('--lambda_distill', type=float, default=10.0, help='weight of the L1 loss between the outputs of the generator and the teacher')
+        self.parser.add_argument('--lambda_distill_feat', type=float, default=1.0, help='weight of the L2 loss between the trunk features of the generator, mapped by a 1x1 conv, and the teacher; 0 disables it')
         self.parser.add_argument('--win_size', type=int, default=11, help='the window size of SSIM conputation')
         self.parser.add_argument('--win_sigma', type=float, default=1.5, help='the window size of SSIM conputation')
 
@@ -16,8 +16,8 @@ gen_imgs_dir=${results_dir}"/"${name}"/test_"${which_epoch}"/images"
 image_size=(256,176)
 
 
-echo "SSIM,IS,Mask-SSIM,Mask-IS..."
-CUDA_VISIBLE_DEVICES=${gpu_id} ~/anaconda3/envs/p37tf114/bin/python ${pro_dir}/tool/metrics_ssim_fashion.py --generated_images_dir ${gen_imgs_dir}\
+echo "SSIM,IS,Mask-SSIM,Mask-IS,FID,KID..."
+CUDA_VISIBLE_DEVICES=${gpu_id} ~/anaconda3/envs/p37tf114/bin/python ${pro_dir}/tool/metrics_ssim_fashion.py --generated_images_dir ${gen_imgs_dir} --fid_real_path=${fid_real_path}\
 | tee -a ${pro_dir}/records/fashion/r_ssim.txt
 
 echo "DS..."
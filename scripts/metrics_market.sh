@@ -16,8 +16,8 @@ gen_imgs_dir=${results_dir}"/"${name}"/test_"${which_epoch}"/images"
 image_size=(128,64)
 
 
-echo "SSIM,IS,Mask-SSIM,Mask-IS ..."
-CUDA_VISIBLE_DEVICES=${gpu_id} ~/anaconda3/envs/p37tf114/bin/python ${pro_dir}/tool/metrics_ssim_market.py --generated_images_dir=${gen_imgs_dir} --annotations_file_test=${anno_file_test}\
+echo "SSIM,IS,Mask-SSIM,Mask-IS,FID,KID ..."
+CUDA_VISIBLE_DEVICES=${gpu_id} ~/anaconda3/envs/p37tf114/bin/python ${pro_dir}/tool/metrics_ssim_market.py --generated_images_dir=${gen_imgs_dir} --annotations_file_test=${anno_file_test} --fid_real_path=${fid_real_path}\
 | tee -a ${pro_dir}/records/market/r_ssim.txt
 
 echo "DS ..."
@@ -0,0 +1,192 @@
+import os
+import numpy as np
+from tqdm import tqdm
+
+PERSON_CLASS = 15
+SSD_MEAN = np.array([104, 117, 123], dtype=np.float32)  # BGR mean pixel
+
+
+def _linear_weights(in_size, out_size, mode='constant'):
+    # source indexes and weights of a bilinear resize with pixel centers aligned, out of range taps either
+    # mirrored (skimage 'reflect') or zero weighted (skimage 'constant' with cval 0)
+    coords = (np.arange(out_size, dtype=np.float64) + 0.5) * in_size / out_size - 0.5
+    if mode == 'reflect':
+        if in_size > 1:
+            period = 2 * (in_size - 1)
+            coords = np.abs(np.mod(coords, period))
+            coords = np.where(coords > in_size - 1, period - coords, coords)
+        else:
+            coords = np.zeros_like(coords)
+    elif mode != 'constant':
+        raise ValueError('resize mode %s is not supported' % mode)
+    i0 = np.floor(coords).astype(np.int64)
+    w1 = coords - i0
+    w0 = np.where((i0 >= 0) & (i0 <= in_size - 1), 1 - w1, 0)
+    w1 = np.where(i0 + 1 <= in_size - 1, w1, 0)
+    i1 = np.clip(i0 + 1, 0, in_size - 1)
+    i0 = np.clip(i0, 0, in_size - 1)
+    return i0, i1, w0.astype(np.float32), w1.astype(np.float32)
+
+
+def resize_batch(images, out_size, mode='constant'):
+    r""" Bilinear resize of a (N,H,W,C) batch with two gathers, one per axis, following caffe.io.resize_image:
+    every image is min-max normalized, resized with skimage.transform.resize(order=1) and scaled back.
+    Args:
+        mode (str): 'constant', the default of skimage in the caffe era, which pads the normalized image with 0,
+            i.e. with the image minimum, or 'reflect', its default since skimage 0.15
+    """
+    images = images.astype(np.float32)
+    # the minimum plays the part of the 0 of the normalized image, the scale cancels out
+    low = images.reshape(len(images), -1).min(1)[:, None, None, None] if len(images) > 0 else 0
+    images = images - low
+    y0, y1, wy0, wy1 = _linear_weights(images.shape[1], out_size[0], mode)
+    x0, x1, wx0, wx1 = _linear_weights(images.shape[2], out_size[1], mode)
+    rows = images[:, y0] * wy0[:, None, None] + images[:, y1] * wy1[:, None, None]
+    return rows[:, :, x0] * wx0[:, None] + rows[:, :, x1] * wx1[:, None] + low
+
+
+def check_resize_parity(sizes=((128, 64), (256, 176)), img_side=300, n=4, seed=0):
+    r""" Largest difference in grey levels between resize_batch and caffe.io.resize_image, rebuilt on skimage, for
+    random [0,255] images of every size and both modes. A constant image is also checked.
+    Returns:
+        float: maximum absolute difference
+    """
+    from skimage.transform import resize
+
+    def resize_image(im, mode):
+        im_min, im_max = im.min(), im.max()
+        if im_max <= im_min:
+            return np.full((img_side, img_side, im.shape[-1]), im_min, dtype=np.float32)
+        im_std = (im - im_min) / (im_max - im_min)
+        resized = resize(im_std, (img_side, img_side), order=1, mode=mode, anti_aliasing=False)
+        return (resized * (im_max - im_min) + im_min).astype(np.float32)
+
+    rng = np.random.RandomState(seed)
+    error = 0.0
+    for h, w in sizes:
+        images = rng.randint(0, 256, (n, h, w, 3)).astype(np.uint8)
+        images[0] = 37
+        for mode in ('constant', 'reflect'):
+            expected = np.stack([resize_image(im.astype(np.float64), mode) for im in images])
+            error = max(error, np.abs(resize_batch(images, (img_side, img_side), mode) - expected).max())
+    return error
+
+
+def preprocess_batch(images, img_side=300, mean=SSD_MEAN):
+    r""" Batched version of the caffe.io.Transformer setup of the SSD scorer:
+    resize to img_side x img_side, RGB -> BGR, [0,255] range, mean subtraction, HWC -> CHW.
+    Args:
+        images (np.ndarray): (N,H,W,3) RGB images in [0, 255]
+    Returns:
+        np.ndarray: (N,3,img_side,img_side) float32 blob
+    """
+    batch = resize_batch(images, (img_side, img_side))
+    batch = batch[..., ::-1] - mean
+    return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+
+class Detector(object):
+    r""" Detection backend of SSDScorer.
+    detect takes a preprocessed (N,3,S,S) blob and returns the detections of the whole batch as a
+    (M,7) array of [image_id, label, confidence, xmin, ymin, xmax, ymax] rows, the detection_out layout of SSD.
+    """
+    img_side = 300
+
+    def detect(self, blob):
+        raise NotImplementedError
+
+
+class CaffeDetector(Detector):
+    def __init__(self, gpu_id=0, model_def='./ssd_score/deploy.prototxt', model_weights='./auxiliary_files/ssd_models/VGGNet/VOC0712/SSD_300x300/VGG_VOC0712_SSD_300x300_iter_120000.caffemodel'):
+        import caffe
+        if gpu_id is not None and gpu_id >= 0:
+            caffe.set_device(gpu_id)
+            caffe.set_mode_gpu()
+        else:
+            caffe.set_mode_cpu()
+        self.net = caffe.Net(model_def, model_weights, caffe.TEST)
+        self.batch_size = 0
+
+    def detect(self, blob):
+        if blob.shape[0] != self.batch_size:
+            self.batch_size = blob.shape[0]
+            self.net.blobs['data'].reshape(*blob.shape)
+            self.net.reshape()
+        self.net.blobs['data'].data[...] = blob
+        detections = self.net.forward()['detection_out']
+        return detections[0, 0]
+
+
+class StubDetector(Detector):
+    r""" Caffe free backend for tests: one detection per image of class `label`,
+    with the mean intensity of the blob mapped to [0, 1] as confidence.
+    """
+    def __init__(self, label=PERSON_CLASS):
+        self.label = label
+
+    def detect(self, blob):
+        n = blob.shape[0]
+        conf = (blob.reshape(n, -1).mean(1) + SSD_MEAN.mean()) / 255.0
+        detections = np.zeros((n, 7), dtype=np.float32)
+        detections[:, 0] = np.arange(n)
+        detections[:, 1] = self.label
+        detections[:, 2] = np.clip(conf, 0, 1)
+        detections[:, 5:] = 1
+        return detections
+
+
+def max_class_confidence(detections, n_images, image_class):
+    r""" Highest confidence of image_class for every image of the batch, 0 when it is not detected. """
+    scores = np.zeros(n_images, dtype=np.float64)
+    # SSD outputs a single row with image_id -1 when nothing is detected in the batch
+    keep = (detections[:, 0] >= 0) & (detections[:, 1] == image_class)
+    np.maximum.at(scores, detections[keep, 0].astype(np.int64), detections[keep, 2])
+    return scores
+
+
+class SSDScorer(object):
+    def __init__(self, detector=None, batch_size=64, gpu_id=0):
+        self.detector = CaffeDetector(gpu_id) if detector is None else detector
+        self.batch_size = batch_size
+
+    def get_score_batch(self, images, image_class=PERSON_CLASS):
+        images = np.asarray(images)
+        blob = preprocess_batch(images, self.detector.img_side)
+        detections = self.detector.detect(blob)
+        return max_class_confidence(detections, len(images), image_class)
+
+    def get_score(self, image, image_class=PERSON_CLASS):
+        return self.get_score_batch(image[np.newaxis], image_class)[0]
+
+    def get_score_list(self, imgs, image_class=PERSON_CLASS):
+        scores = []
+        batch = []
+        for img in tqdm(imgs):
+            batch.append(img)
+            if len(batch) == self.batch_size:
+                scores.append(self.get_score_batch(np.stack(batch), image_class))
+                batch = []
+        if len(batch) > 0:
+            scores.append(self.get_score_batch(np.stack(batch), image_class))
+        return np.concatenate(scores) if len(scores) > 0 else np.zeros(0)
+
+    def get_score_image_set(self, imgs, image_class=PERSON_CLASS):
+        #image_class=15 Only persons
+        return np.mean(self.get_score_list(imgs, image_class))
+
+
+def iterate_images(input_path, image_size, img_index=4, transform=None):
+    r""" Stream the generated images of a results folder, or of a packed (N,H,W,3) .npy container.
+    Results images are cropped to the img_index-th panel of width image_size[1].
+    """
+    if os.path.isfile(input_path):
+        for img in np.load(input_path, mmap_mode='r'):
+            img = np.asarray(img)
+            yield img if transform is None else transform(img)
+        return
+
+    from skimage.io import imread
+    for name in sorted(os.listdir(input_path)):
+        img = imread(os.path.join(input_path, name))
+        img = img[:, img_index * image_size[1]:(img_index + 1) * image_size[1]]
+        yield img if transform is None else transform(img)
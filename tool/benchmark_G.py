@@ -0,0 +1,218 @@
+import copy
+import sys
+import time
+
+import torch
+
+sys.path.append('.')
+from models import networks
+from losses.pytorch_msssim import SSIM
+from util.memory_format import to_memory_format, ChannelsLastCheck
+
+DATASETS = {
+    'market': dict(image_size=(128, 64)),
+    'fashion': dict(image_size=(256, 176)),
+}
+
+
+def build_G(which_model_netG='PATN', ngf=64, n_blocks=9, norm='batch', use_dropout=False, n_downsampling=2,
+            P_input_nc=3, BP_input_nc=18, device='cpu', **kwargs):
+    r""" Generator as the TransferModel builds it, on device. """
+    netG = networks.define_G([P_input_nc, BP_input_nc * 2], P_input_nc, ngf, which_model_netG, norm, use_dropout,
+                             'normal', [], n_blocks=n_blocks, n_downsampling=n_downsampling, **kwargs)
+    return netG.to(device)
+
+
+def random_inputs(batch_size, image_size, P_input_nc=3, BP_input_nc=18, device='cpu'):
+    P1 = torch.rand(batch_size, P_input_nc, *image_size, device=device) * 2 - 1
+    BP = torch.rand(batch_size, BP_input_nc * 2, *image_size, device=device)
+    return [P1, BP]
+
+
+def conv_flops(net, inputs):
+    r""" Floating point operations (2 per multiply-add) of the convolutions of a forward pass. """
+    flops = []
+
+    def count(module, input, output):
+        if isinstance(module, torch.nn.ConvTranspose2d):
+            macs = input[0].numel() * module.weight[0].numel()
+        else:
+            macs = output.numel() * module.weight[0].numel()
+        flops.append(2 * macs)
+
+    hooks = [m.register_forward_hook(count) for m in net.modules()
+             if isinstance(m, (torch.nn.Conv2d, torch.nn.ConvTranspose2d))]
+    with torch.no_grad():
+        net(inputs)
+    for hook in hooks:
+        hook.remove()
+    return sum(flops)
+
+
+def saved_activation_bytes(netG, inputs):
+    r""" Bytes of the tensors a forward pass keeps for the backward pass, parameters excluded.
+    Tensors saved inside checkpointed segments are not counted, the checkpoint recomputes them.
+    """
+    params = set(p.data_ptr() for p in netG.parameters())
+    storages = {}
+
+    def pack(tensor):
+        ptr = tensor.untyped_storage().data_ptr()
+        if ptr not in params:
+            storages[ptr] = tensor.untyped_storage().nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        out = netG(inputs)
+    out.mean().backward()
+    netG.zero_grad()
+    return sum(storages.values())
+
+
+def time_train_step(netG, inputs, n_iter=10, warmup=2, step=None):
+    r""" Seconds per forward + backward pass, and the peak cuda memory (None on cpu).
+    Args:
+        step: function of the inputs returning the loss, the mean of the output by default
+    """
+    step = step or (lambda inputs: netG(inputs).mean())
+    cuda = inputs[0].is_cuda
+    for i in range(warmup + n_iter):
+        if i == warmup:
+            if cuda:
+                torch.cuda.synchronize()
+                torch.cuda.reset_peak_memory_stats()
+            start = time.time()
+        step(inputs).backward()
+    if cuda:
+        torch.cuda.synchronize()
+    netG.zero_grad()
+    return (time.time() - start) / n_iter, torch.cuda.max_memory_allocated() if cuda else None
+
+
+def check_checkpointing(netG, inputs, checkpoint_blocks, checkpoint_stems, seed=0):
+    r""" Largest output, gradient and running statistics difference between a checkpointed pass and a plain one,
+    dropout included: the recomputation has to draw the same masks and must not update BatchNorm twice.
+    """
+    model = netG.model
+    results = []
+    for blocks, stems in [(0, False), (checkpoint_blocks, checkpoint_stems)]:
+        model.checkpoint_blocks, model.checkpoint_stems = blocks, stems
+        state = {k: v.clone() for k, v in netG.state_dict().items()}
+        torch.manual_seed(seed)
+        out = netG(inputs)
+        out.mean().backward()
+        results.append([out.detach()] + [p.grad.clone() for p in netG.parameters()] +
+                       [b.clone() for b in netG.buffers()])
+        netG.zero_grad()
+        netG.load_state_dict(state)
+    model.checkpoint_blocks, model.checkpoint_stems = 0, False
+    return max((a.double() - b.double()).abs().max().item() for a, b in zip(*results))
+
+
+def report_checkpointing(netG, inputs, n_iter=10):
+    r""" Saved activations, peak memory and step time of the activation checkpointing configurations. """
+    model = netG.model
+    n_blocks = len(model.att)
+    configs = [(0, False)] + [(s, False) for s in sorted(set([1, 2, 3, n_blocks])) if 0 < s <= n_blocks] + \
+              [(1, True)]
+    print('%-22s %14s %12s %10s' % ('checkpoint', 'saved MB', 'peak MB', 'ms/step'))
+    for blocks, stems in configs:
+        model.checkpoint_blocks, model.checkpoint_stems = blocks, stems
+        saved = saved_activation_bytes(netG, inputs)
+        seconds, peak = time_train_step(netG, inputs, n_iter)
+        name = 'off' if blocks == 0 else 'blocks=%d%s' % (blocks, ' + stems' if stems else '')
+        print('%-22s %14.1f %12s %10.1f' % (name, saved / 2 ** 20, '-' if peak is None else '%.1f' % (peak / 2 ** 20),
+                                            seconds * 1000))
+    model.checkpoint_blocks, model.checkpoint_stems = 0, False
+
+
+def report_compile(netG, inputs, n_iter=10, mode='default'):
+    r""" Step time of the generator with an L1 + SSIM loss, eager and through networks.compile_network. """
+    criterionSSIM = SSIM(data_range=1.0, size_average=True)
+    target = torch.rand_like(inputs[0]) * 2 - 1
+
+    def loss_step(net, criterion):
+        def step(inputs):
+            out = net(inputs)
+            loss = torch.nn.functional.l1_loss(out, target) + 1 - criterion(out, target)
+            return loss
+        return step
+
+    compiled_G = networks.compile_network(copy.deepcopy(netG), mode)
+    compiled_SSIM = networks.compile_network(SSIM(data_range=1.0, size_average=True), mode)
+    cuda = inputs[0].is_cuda
+    # outputs compared before any training step changes the running statistics of one of the copies
+    netG.eval()
+    compiled_G.eval()
+    with torch.no_grad():
+        diff = (netG(inputs) - compiled_G(inputs)).abs().max().item()
+    netG.train()
+    compiled_G.train()
+    start = time.time()
+    loss_step(compiled_G, compiled_SSIM)(inputs).backward()
+    if cuda:
+        torch.cuda.synchronize()
+    compile_seconds = time.time() - start
+
+    print('%-10s %10s %12s' % ('G + losses', 'ms/step', 'speedup'))
+    times = []
+    for name, net, criterion in [('eager', netG, criterionSSIM), ('compiled', compiled_G, compiled_SSIM)]:
+        step = loss_step(net, criterion)
+        seconds, _ = time_train_step(net, inputs, n_iter, step=step)
+        times.append(seconds)
+        print('%-10s %10.1f %11.2fx' % (name, seconds * 1000, times[0] / seconds))
+    print('compilation %.1f s, eval output max difference %g, fell back to eager: %s' %
+          (compile_seconds, diff, compiled_G.model.compile_failed))
+
+
+def report_memory_format(netG, inputs, n_iter=10):
+    r""" Step time of the generator with contiguous and channels_last weights and inputs. The channels_last
+    forward pass runs under ChannelsLastCheck, it fails on any op that converts back to NCHW.
+    """
+    cl_G = copy.deepcopy(netG).to(memory_format=torch.channels_last)
+    cl_inputs = to_memory_format(inputs, torch.channels_last)
+    netG.eval()
+    cl_G.eval()
+    with torch.no_grad():
+        with ChannelsLastCheck():
+            cl_out = cl_G(cl_inputs)
+        diff = (netG(inputs) - cl_out).abs().max().item()
+    netG.train()
+    cl_G.train()
+
+    print('%-14s %10s %12s' % ('layout', 'ms/step', 'speedup'))
+    times = []
+    for name, net, x in [('contiguous', netG, inputs), ('channels_last', cl_G, cl_inputs)]:
+        seconds, _ = time_train_step(net, x, n_iter)
+        times.append(seconds)
+        print('%-14s %10.1f %11.2fx' % (name, seconds * 1000, times[0] / seconds))
+    print('eval output max difference %g' % diff)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Generator training step memory and time")
+    parser.add_argument("--dataset", default='fashion', choices=sorted(DATASETS.keys()), help='Image size preset')
+    parser.add_argument("--which_model_netG", default='PATN', choices=['PATN', 'PATN_lite', 'Xing'])
+    parser.add_argument("--ngf", default=64, type=int)
+    parser.add_argument("--n_blocks", default=9, type=int)
+    parser.add_argument("--norm", default='batch', choices=['batch', 'instance'])
+    parser.add_argument("--dropout", action='store_true', help='Generator with dropout')
+    parser.add_argument("--batch_size", default=7, type=int)
+    parser.add_argument("--n_iter", default=10, type=int, help='Timed steps per configuration')
+    parser.add_argument("--device", default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument("--report", default='checkpointing', choices=['checkpointing', 'compile', 'memory_format'])
+    parser.add_argument("--compile_mode", default='default', choices=['default', 'reduce-overhead', 'max-autotune'])
+    args = parser.parse_args()
+
+    netG = build_G(args.which_model_netG, args.ngf, args.n_blocks, args.norm, args.dropout, device=args.device)
+    netG.train()
+    inputs = random_inputs(args.batch_size, DATASETS[args.dataset]['image_size'], device=args.device)
+    if args.report == 'checkpointing':
+        print('checkpointed pass max difference: %g' % check_checkpointing(netG, inputs, 1, True))
+        report_checkpointing(netG, inputs, args.n_iter)
+    elif args.report == 'compile':
+        report_compile(netG, inputs, args.n_iter, args.compile_mode)
+    elif args.report == 'memory_format':
+        report_memory_format(netG, inputs, args.n_iter)
@@ -0,0 +1,62 @@
+import sys
+
+import numpy as np
+import torch
+
+sys.path.append('.')
+from models.inference import optimize_generator
+from tool.benchmark_G import DATASETS, conv_flops, random_inputs
+from tool.optimize_G import load_G, seconds_per_image
+from tool.quantize_G import PAIRS, key_dataset, pair_batches, scores
+
+
+def describe(netG, image_size, n_iter=20):
+    r""" Parameters (M), convolution GFLOPs and per image cpu latency (ms) of the optimized generator. """
+    inputs = random_inputs(1, image_size)
+    generator = optimize_generator(netG)
+    return dict(params=sum(p.numel() for p in netG.parameters()) / 1e6, GFLOPs=conv_flops(netG, inputs) / 1e9,
+                ms=seconds_per_image(generator, inputs, n_iter) * 1000)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Size, FLOPs, cpu latency and quality of generator architectures, by default "
+                                        "PATN against its depthwise-separable PATN_lite variant")
+    parser.add_argument("--models", default=['PATN', 'PATN_lite'], nargs='+', choices=['PATN', 'PATN_lite', 'Xing'])
+    parser.add_argument("--datasets", default=['market', 'fashion'], nargs='+', choices=sorted(DATASETS.keys()))
+    parser.add_argument("--checkpoints", default=[], nargs='*', help='*_net_netG.pth of every dataset and model, '
+                        'dataset major (market PATN, market PATN_lite, fashion PATN, ...); quality is scored with them')
+    parser.add_argument("--ngf", default=64, type=int)
+    parser.add_argument("--n_blocks", default=9, type=int)
+    parser.add_argument("--n_downsampling", default=2, type=int)
+    parser.add_argument("--norm", default='batch', choices=['batch', 'instance'])
+    parser.add_argument("--dropout", action='store_true', help='Generators trained with dropout')
+    parser.add_argument("--dataroot", default='./datasets/')
+    parser.add_argument("--n_eval", default=256, type=int, help='Test pairs scored')
+    parser.add_argument("--batch_size", default=8, type=int)
+    parser.add_argument("--n_iter", default=20, type=int, help='Timed passes per generator')
+    parser.add_argument("--threads", default=0, type=int, help='torch cpu threads, 0 for the default')
+    args = parser.parse_args()
+    assert not args.checkpoints or len(args.checkpoints) == len(args.models) * len(args.datasets), \
+        'one checkpoint per dataset and model'
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    print('%-8s %-10s %10s %10s %10s %8s %8s' % ('dataset', 'netG', 'params M', 'GFLOPs', 'ms/image', 'SSIM', 'pSSIM'))
+    for d, dataset in enumerate(args.datasets):
+        image_size = DATASETS[dataset]['image_size']
+        checkpoints = args.checkpoints[d * len(args.models):(d + 1) * len(args.models)] or [''] * len(args.models)
+        if args.checkpoints:
+            pairs = key_dataset(args.dataroot, **PAIRS[dataset])
+            evaluation = np.arange(min(args.n_eval, len(pairs)))
+        for which_model_netG, checkpoint in zip(args.models, checkpoints):
+            netG = load_G(checkpoint, which_model_netG, ngf=args.ngf, n_blocks=args.n_blocks, norm=args.norm,
+                          use_dropout=args.dropout, n_downsampling=args.n_downsampling)
+            result = describe(netG, image_size, args.n_iter)
+            quality = '%8s %8s' % ('-', '-')
+            if checkpoint:
+                result.update(scores([optimize_generator(netG)], pair_batches(pairs, evaluation, args.batch_size))[0])
+                quality = '%8.4f %8.4f' % (result['SSIM'], result['pSSIM'])
+            print('%-8s %-10s %10.2f %10.2f %10.2f %s' % (dataset, which_model_netG, result['params'],
+                                                          result['GFLOPs'], result['ms'], quality))
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import torch
+
+sys.path.append('.')
+from models import inference
+from models.inference import EXPORT_FORMATS, ExportedGenerator, InferenceGenerator, export_generator, \
+    optimize_generator
+from tool.benchmark_G import DATASETS, random_inputs
+from tool.optimize_G import add_generator_arguments, load_G_from_args
+
+
+def check_export(netG, path, backend, image_size, batch_sizes=(1, 3)):
+    r""" Largest output difference between the generator and its exported artifact, over batch sizes other
+    than the one it was exported with.
+    """
+    exported = ExportedGenerator(path, backend)
+    diff = 0.
+    with torch.no_grad():
+        for n in batch_sizes:
+            inputs = random_inputs(n, image_size)
+            diff = max(diff, (netG(inputs) - exported(inputs)).abs().max().item())
+    return diff
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Export a generator to TorchScript and ONNX, for test.py --backend")
+    add_generator_arguments(parser)
+    parser.add_argument("--output", required=True, help='Artifact path without extension, .pt / .onnx are added')
+    parser.add_argument("--formats", default=['torchscript', 'onnx'], nargs='+', choices=sorted(EXPORT_FORMATS.keys()))
+    parser.add_argument("--no_optimize", action='store_true', help='Export the generator as it is, without '
+                        'folding norms, removing dropout and fusing the gates')
+    parser.add_argument("--opset_version", default=17, type=int)
+    parser.add_argument("--atol", default=1e-4, type=float, help='Largest accepted output difference')
+    args = parser.parse_args()
+
+    netG = load_G_from_args(args)
+    generator = InferenceGenerator(netG.model) if args.no_optimize else optimize_generator(netG)
+    image_size = DATASETS[args.dataset]['image_size']
+    config = dict(which_model_netG=args.which_model_netG, ngf=args.ngf, n_blocks=args.n_blocks,
+                  n_downsampling=args.n_downsampling, norm=args.norm, checkpoint=os.path.abspath(args.checkpoint)
+                  if args.checkpoint else '')
+    if os.path.dirname(args.output) and not os.path.exists(os.path.dirname(args.output)):
+        os.makedirs(os.path.dirname(args.output))
+    for format in args.formats:
+        path = args.output + EXPORT_FORMATS[format]
+        export_generator(generator, random_inputs(1, image_size), path, format, args.opset_version, **config)
+        backend = 'torchscript' if format == 'torchscript' else 'onnxruntime'
+        if backend == 'onnxruntime' and inference.onnxruntime is None:
+            print('saved %s, onnxruntime is not installed, not checked' % path)
+            continue
+        diff = check_export(netG, path, backend, image_size)
+        print('saved %s, max difference %g' % (path, diff))
+        assert diff <= args.atol, 'exported generator differs from the original by %g' % diff
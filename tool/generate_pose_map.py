@@ -0,0 +1,147 @@
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+MISSING_VALUE = -1
+
+DATASETS = {
+    'market': dict(image_size=(128, 64),
+                   annotations_file='./datasets/market_data/market-annotation-train.csv',
+                   save_path='./datasets/market_data/trainK'),
+    'fashion': dict(image_size=(256, 176),
+                    annotations_file='./datasets/fashion_data/fasion-resize-annotation-train.csv',
+                    save_path='./datasets/fashion_data/trainK'),
+}
+
+
+def cords_to_maps(kp_array, img_size, sigma=6, dtype='float32'):
+    r""" One gaussian heatmap per keypoint, built as the outer product of a row and a column gaussian.
+    Args:
+        kp_array (np.ndarray): (n_parts, 2) keypoints in (y, x), MISSING_VALUE for missing ones
+    Returns:
+        np.ndarray: (h, w, n_parts) maps, zero for missing keypoints
+    """
+    kp_array = np.asarray(kp_array, dtype=np.float64)
+    missing = np.logical_or(kp_array[:, 0] == MISSING_VALUE, kp_array[:, 1] == MISSING_VALUE)
+    gy = np.exp(-(np.arange(img_size[0])[np.newaxis, :] - kp_array[:, 0:1]) ** 2 / (2 * sigma ** 2))
+    gx = np.exp(-(np.arange(img_size[1])[np.newaxis, :] - kp_array[:, 1:2]) ** 2 / (2 * sigma ** 2))
+    gy[missing] = 0
+    return np.einsum('ph,pw->hwp', gy, gx).astype(dtype)
+
+
+def parse_cords(strings):
+    # '[y0, y1, ...]' strings of an annotation column --> (N, 18) array
+    values = ','.join(s.strip().strip('[]') for s in strings)
+    return np.array(values.split(','), dtype=np.float64).reshape(len(strings), -1)
+
+
+def store_paths(save_path):
+    # a packed store is <save_path>.npy with the entry names in <save_path>_names.txt
+    # and the rendered entries flagged in <save_path>_built.npy
+    return save_path + '.npy', save_path + '_names.txt', save_path + '_built.npy'
+
+
+def open_pose_store(save_path):
+    r""" Read-only view of a packed store.
+    Returns:
+        (dict, np.memmap): name -> row index, (N, h, w, n_parts) maps
+    """
+    maps_file, names_file, _ = store_paths(save_path)
+    with open(names_file) as f:
+        names = f.read().splitlines()
+    return {name: i for i, name in enumerate(names)}, np.load(maps_file, mmap_mode='r')
+
+
+def _render_files(job):
+    names, kp_arrays, save_path, img_size, sigma, dtype = job
+    for name, kp_array in zip(names, kp_arrays):
+        np.save(os.path.join(save_path, name + '.npy'), cords_to_maps(kp_array, img_size, sigma, dtype))
+    return len(names)
+
+
+def _render_packed(job):
+    rows, kp_arrays, maps_file, img_size, sigma, dtype = job
+    maps = np.load(maps_file, mmap_mode='r+')
+    for row, kp_array in zip(rows, kp_arrays):
+        maps[row] = cords_to_maps(kp_array, img_size, sigma, dtype)
+    maps.flush()
+    return rows
+
+
+def build_pose_maps(annotations_file, save_path, img_size, sigma=6, dtype='float32', packed=False,
+                    workers=4, chunk_size=256):
+    r""" Gaussian keypoint heatmaps of every annotated image, rendered in a process pool.
+    Per image maps go to <save_path>/<name>.npy, a packed store to <save_path>.npy.
+    Entries already built are skipped.
+    """
+    anno = pd.read_csv(annotations_file, sep=':').drop_duplicates('name')
+    names = list(anno['name'])
+    kp_arrays = np.stack([parse_cords(anno['keypoints_y']), parse_cords(anno['keypoints_x'])], -1)
+
+    if packed:
+        maps_file, names_file, built_file = store_paths(save_path)
+        shape = (len(names),) + tuple(img_size) + (kp_arrays.shape[1],)
+        if os.path.exists(maps_file):
+            maps = np.load(maps_file, mmap_mode='r')
+            assert maps.shape == shape and maps.dtype == np.dtype(dtype), \
+                'existing store %s has shape %s %s, expected %s %s' % (maps_file, maps.shape, maps.dtype, shape, dtype)
+            with open(names_file) as f:
+                assert f.read().splitlines() == names, 'existing store %s has other entries' % maps_file
+            built = np.load(built_file)
+        else:
+            if os.path.dirname(maps_file) and not os.path.exists(os.path.dirname(maps_file)):
+                os.makedirs(os.path.dirname(maps_file))
+            np.lib.format.open_memmap(maps_file, mode='w+', dtype=dtype, shape=shape).flush()
+            with open(names_file, 'w') as f:
+                f.writelines(name + '\n' for name in names)
+            built = np.zeros(len(names), dtype=bool)
+            np.save(built_file, built)
+        todo = np.nonzero(~built)[0]
+        jobs = [(todo[i:i + chunk_size], kp_arrays[todo[i:i + chunk_size]], maps_file, img_size, sigma, dtype)
+                for i in range(0, len(todo), chunk_size)]
+        render = _render_packed
+    else:
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        todo = [i for i, name in enumerate(names) if not os.path.exists(os.path.join(save_path, name + '.npy'))]
+        jobs = [([names[j] for j in todo[i:i + chunk_size]], kp_arrays[todo[i:i + chunk_size]], save_path, img_size,
+                 sigma, dtype) for i in range(0, len(todo), chunk_size)]
+        render = _render_files
+
+    print('%d of %d pose maps to build' % (len(todo), len(names)))
+    pool = Pool(workers) if workers > 0 else None
+    results = pool.imap_unordered(render, jobs) if pool is not None else map(render, jobs)
+    with tqdm(total=len(todo)) as progress:
+        for result in results:
+            if packed:
+                built[result] = True
+                np.save(built_file, built)
+            progress.update(len(result) if packed else result)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    split = lambda s: tuple(map(int, s.split(',')))
+    parser = ArgumentParser(description="Generate the keypoint heatmaps of a dataset")
+    parser.add_argument("--dataset", default='market', choices=sorted(DATASETS.keys()), help='Presets of the paths and image size')
+    parser.add_argument("--annotations_file", default=None, help='Pose annotation csv (default: train annotations of --dataset)')
+    parser.add_argument("--save_path", default=None, help='Folder of the per image maps, or path of the packed store without .npy')
+    parser.add_argument("--image_size", default=None, type=split, help='h,w of the maps (default: image size of --dataset)')
+    parser.add_argument("--sigma", default=6, type=float, help='Gaussian sigma in pixels')
+    parser.add_argument("--dtype", default='float32', choices=['float32', 'float16', 'float64'], help='dtype of the stored maps')
+    parser.add_argument("--packed", action='store_true', help='Write one memory mapped store instead of a file per image')
+    parser.add_argument("--workers", default=os.cpu_count(), type=int, help='Number of processes, 0 to render in the main process')
+    parser.add_argument("--chunk_size", default=256, type=int, help='Images per task')
+    args = parser.parse_args()
+
+    preset = DATASETS[args.dataset]
+    build_pose_maps(args.annotations_file or preset['annotations_file'], args.save_path or preset['save_path'],
+                    args.image_size or preset['image_size'], args.sigma, args.dtype, args.packed,
+                    args.workers, args.chunk_size)
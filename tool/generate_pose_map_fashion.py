@@ -15,7 +15,7 @@ def load_pose_cords_from_strings(y_str, x_str):
     return np.concatenate([np.expand_dims(y_cords, -1), np.expand_dims(x_cords, -1)], axis=1)
 
 def cords_to_map(cords, img_size, sigma=6):
-    result = np.zeros(img_size + cords.shape[0:1], dtype='uint8')
+    result = np.zeros(img_size + cords.shape[0:1], dtype='float32')
     for i, point in enumerate(cords):
         if point[0] == MISSING_VALUE or point[1] == MISSING_VALUE:
             continue
@@ -24,22 +24,12 @@ def cords_to_map(cords, img_size, sigma=6):
         # result[..., i] = np.where(((yy - point[0]) ** 2 + (xx - point[1]) ** 2) < (sigma ** 2), 1, 0)
     return result
 
-def compute_pose(image_dir, annotations_file, savePath):
-    annotations_file = pd.read_csv(annotations_file, sep=':')
-    annotations_file = annotations_file.set_index('name')
+def compute_pose(image_dir, annotations_file, savePath, workers=4):
+    # float32 maps written by the shared parallel builder, see generate_pose_map.py
+    from generate_pose_map import build_pose_maps
     image_size = (256, 176)
-    cnt = len(annotations_file)
-    for i in range(cnt):
-        print('processing %d / %d ...' %(i, cnt))
-        row = annotations_file.iloc[i]
-        name = row.name
-        print(savePath, name)
-        file_name = os.path.join(savePath, name + '.npy')
-        kp_array = load_pose_cords_from_strings(row.keypoints_y, row.keypoints_x)
-        pose = cords_to_map(kp_array, image_size)
-        np.save(file_name, pose)
-        # input()
-  
+    build_pose_maps(annotations_file, savePath, image_size, sigma=6, dtype='float32', workers=workers)
+
 compute_pose(img_dir, annotations_file, save_path)
 
 
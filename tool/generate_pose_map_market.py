@@ -160,20 +160,11 @@ def produce_ma_mask(kp_array, img_size, point_radius=1):
     mask = np.expand_dims(mask, -1).astype(np.uint8)
     return mask
 
-def compute_pose(image_dir, annotations_file, savePath):
-    annotations_file = pd.read_csv(annotations_file, sep=':')
-    annotations_file = annotations_file.set_index('name')
+def compute_pose(image_dir, annotations_file, savePath, workers=4):
+    # float32 maps written by the shared parallel builder, see generate_pose_map.py
+    from generate_pose_map import build_pose_maps
     image_size = (128, 64)
-    cnt = len(annotations_file)
-    for i in range(cnt):
-        print('processing %d / %d ...' %(i, cnt))
-        row = annotations_file.iloc[i]
-        name = row.name
-        print(savePath, name)
-        # file_name = os.path.join(savePath, name + '.npy')
-        kp_array = load_pose_cords_from_strings(row.keypoints_y, row.keypoints_x)
-        pose = cords_to_map(kp_array, image_size)
-        # np.save(file_name, pose)
+    build_pose_maps(annotations_file, savePath, image_size, sigma=6, dtype='float32', workers=workers)
 
 def save_pose_coor(annotations_file, save_name):
     annotations_file = pd.read_csv(annotations_file, sep=':')
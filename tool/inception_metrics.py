@@ -0,0 +1,325 @@
+import os
+import hashlib
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from scipy import linalg
+from torchvision.models.inception import Inception3, InceptionA, InceptionC, InceptionE
+
+# pytorch port of the 2015-12-05 TF inception graph used by inception_score.py,
+# e.g. pt_inception-2015-12-05-6726825d.pth from pytorch-fid
+INCEPTION_WEIGHTS = r'./auxiliary_files/Inception_models/pt_inception-2015-12-05.pth'
+STATS_CACHE_DIR = r'./auxiliary_files/Inception_stats'
+
+
+# the blocks of the TF graph average-pool without the padding, and Mixed_7c max-pools
+class FIDInceptionA(InceptionA):
+    def forward(self, x):
+        branch1x1 = self.branch1x1(x)
+        branch5x5 = self.branch5x5_2(self.branch5x5_1(x))
+        branch3x3dbl = self.branch3x3dbl_3(self.branch3x3dbl_2(self.branch3x3dbl_1(x)))
+        branch_pool = self.branch_pool(F.avg_pool2d(x, kernel_size=3, stride=1, padding=1, count_include_pad=False))
+        return torch.cat([branch1x1, branch5x5, branch3x3dbl, branch_pool], 1)
+
+
+class FIDInceptionC(InceptionC):
+    def forward(self, x):
+        branch1x1 = self.branch1x1(x)
+        branch7x7 = self.branch7x7_3(self.branch7x7_2(self.branch7x7_1(x)))
+        branch7x7dbl = self.branch7x7dbl_1(x)
+        for conv in [self.branch7x7dbl_2, self.branch7x7dbl_3, self.branch7x7dbl_4, self.branch7x7dbl_5]:
+            branch7x7dbl = conv(branch7x7dbl)
+        branch_pool = self.branch_pool(F.avg_pool2d(x, kernel_size=3, stride=1, padding=1, count_include_pad=False))
+        return torch.cat([branch1x1, branch7x7, branch7x7dbl, branch_pool], 1)
+
+
+class FIDInceptionE(InceptionE):
+    def __init__(self, in_channels, max_pool=False):
+        super(FIDInceptionE, self).__init__(in_channels)
+        self.max_pool = max_pool
+
+    def forward(self, x):
+        branch1x1 = self.branch1x1(x)
+        branch3x3 = self.branch3x3_1(x)
+        branch3x3 = torch.cat([self.branch3x3_2a(branch3x3), self.branch3x3_2b(branch3x3)], 1)
+        branch3x3dbl = self.branch3x3dbl_2(self.branch3x3dbl_1(x))
+        branch3x3dbl = torch.cat([self.branch3x3dbl_3a(branch3x3dbl), self.branch3x3dbl_3b(branch3x3dbl)], 1)
+        if self.max_pool:
+            branch_pool = F.max_pool2d(x, kernel_size=3, stride=1, padding=1)
+        else:
+            branch_pool = F.avg_pool2d(x, kernel_size=3, stride=1, padding=1, count_include_pad=False)
+        branch_pool = self.branch_pool(branch_pool)
+        return torch.cat([branch1x1, branch3x3, branch3x3dbl, branch_pool], 1)
+
+
+def fid_inception_v3(num_classes=1008):
+    r""" torchvision Inception3 with the blocks of the TF graph, the architecture of the pytorch-fid weights. """
+    net = Inception3(num_classes=num_classes, aux_logits=False, transform_input=False, init_weights=False)
+    net.Mixed_5b = FIDInceptionA(192, pool_features=32)
+    net.Mixed_5c = FIDInceptionA(256, pool_features=64)
+    net.Mixed_5d = FIDInceptionA(288, pool_features=64)
+    net.Mixed_6b = FIDInceptionC(768, channels_7x7=128)
+    net.Mixed_6c = FIDInceptionC(768, channels_7x7=160)
+    net.Mixed_6d = FIDInceptionC(768, channels_7x7=160)
+    net.Mixed_6e = FIDInceptionC(768, channels_7x7=192)
+    net.Mixed_7b = FIDInceptionE(1280)
+    net.Mixed_7c = FIDInceptionE(2048, max_pool=True)
+    return net
+
+
+class InceptionFeatures(nn.Module):
+    r""" Inception-v3 returning pool3 features and logits of a batch in one forward.
+    Weights are read from a local state dict, nothing is downloaded.
+    """
+    def __init__(self, weights_path=INCEPTION_WEIGHTS):
+        super(InceptionFeatures, self).__init__()
+        state_dict = torch.load(weights_path, map_location='cpu')
+        if 'state_dict' in state_dict:
+            state_dict = state_dict['state_dict']
+        state_dict = {k: v for k, v in state_dict.items() if not k.startswith('AuxLogits')}
+        num_classes = state_dict['fc.weight'].shape[0]
+
+        net = fid_inception_v3(num_classes)
+        net.load_state_dict(state_dict)
+        self.blocks = nn.ModuleList([net.Conv2d_1a_3x3, net.Conv2d_2a_3x3, net.Conv2d_2b_3x3, None,
+                                     net.Conv2d_3b_1x1, net.Conv2d_4a_3x3, None,
+                                     net.Mixed_5b, net.Mixed_5c, net.Mixed_5d, net.Mixed_6a,
+                                     net.Mixed_6b, net.Mixed_6c, net.Mixed_6d, net.Mixed_6e,
+                                     net.Mixed_7a, net.Mixed_7b, net.Mixed_7c])
+        self.fc = net.fc
+        self.eval()
+
+    def forward(self, x):
+        # x: (N,3,H,W) in [0, 255]
+        x = F.interpolate(x, size=(299, 299), mode='bilinear', align_corners=False)
+        x = x / 127.5 - 1
+        for block in self.blocks:
+            x = F.max_pool2d(x, kernel_size=3, stride=2) if block is None else block(x)
+        pool3 = F.adaptive_avg_pool2d(x, 1).flatten(1)
+        logits = self.fc(pool3)
+        return pool3, logits
+
+
+class RunningStats(object):
+    r""" Streaming mean and covariance of feature batches, accumulated in float64.
+    Optionally keeps a uniform reservoir sample of the features for KID.
+    """
+    def __init__(self, dim=2048, max_samples=0, seed=0):
+        self.n = 0
+        self.sum = np.zeros(dim, dtype=np.float64)
+        self.sum_sq = np.zeros((dim, dim), dtype=np.float64)
+        self.max_samples = max_samples
+        self.samples = np.zeros((max_samples, dim), dtype=np.float32)
+        self.rng = np.random.RandomState(seed)
+
+    def update(self, feats):
+        feats = np.asarray(feats, dtype=np.float64)
+        if self.max_samples > 0:
+            self._reservoir(feats)
+        self.n += len(feats)
+        self.sum += feats.sum(0)
+        self.sum_sq += feats.T.dot(feats)
+
+    def _reservoir(self, feats):
+        seen = self.n + np.arange(len(feats))
+        fill = seen < self.max_samples
+        self.samples[seen[fill]] = feats[fill]
+        slots = self.rng.randint(0, seen[~fill] + 1) if (~fill).any() else np.zeros(0, dtype=int)
+        for feat, slot in zip(feats[~fill], slots):
+            if slot < self.max_samples:
+                self.samples[slot] = feat
+
+    @property
+    def mean(self):
+        return self.sum / self.n
+
+    @property
+    def cov(self):
+        mu = self.mean
+        return (self.sum_sq - self.n * np.outer(mu, mu)) / (self.n - 1)
+
+    def sampled_features(self):
+        return self.samples[:min(self.n, self.max_samples)]
+
+
+def iterate_batches(images, batch_size):
+    r""" Group a sequence or generator of h,w,c images into n,h,w,c arrays. """
+    batch = []
+    for image in images:
+        batch.append(image)
+        if len(batch) == batch_size:
+            yield np.stack(batch, 0)
+            batch = []
+    if len(batch) > 0:
+        yield np.stack(batch, 0)
+
+
+def get_activations(model, images, batch_size=100, device=None, img_size=None):
+    r""" Yield (pool3, softmax) numpy arrays for every batch of images.
+    Args:
+        model (InceptionFeatures): feature extractor, already on `device`
+        images (iterable): h,w,c arrays with values in [0, 255]
+        batch_size (int, optional): images per forward
+        device (str, optional): torch device of the model
+        img_size (tuple, optional): (h, w) every image is resized to before the network
+    """
+    with torch.no_grad():
+        for batch in iterate_batches(images, batch_size):
+            x = torch.from_numpy(batch).to(device).float().permute(0, 3, 1, 2)
+            if img_size is not None and tuple(x.shape[2:]) != tuple(img_size):
+                x = F.interpolate(x, size=tuple(img_size), mode='bilinear', align_corners=False)
+            pool3, logits = model(x)
+            yield pool3.cpu().numpy(), F.softmax(logits, 1).cpu().numpy()
+
+
+def inception_score_from_preds(preds, splits=10):
+    # same split statistics as inception_score.get_inception_score
+    scores = []
+    for i in range(splits):
+        part = preds[(i * preds.shape[0] // splits):((i + 1) * preds.shape[0] // splits), :]
+        kl = part * (np.log(part) - np.log(np.expand_dims(np.mean(part, 0), 0)))
+        kl = np.mean(np.sum(kl, 1))
+        scores.append(np.exp(kl))
+    return np.mean(scores), np.std(scores)
+
+
+def frechet_distance(mu1, sigma1, mu2, sigma2, eps=1e-6):
+    diff = mu1 - mu2
+    covmean, _ = linalg.sqrtm(sigma1.dot(sigma2), disp=False)
+    if not np.isfinite(covmean).all():
+        offset = np.eye(sigma1.shape[0]) * eps
+        covmean = linalg.sqrtm((sigma1 + offset).dot(sigma2 + offset))
+    if np.iscomplexobj(covmean):
+        covmean = covmean.real
+    return diff.dot(diff) + np.trace(sigma1) + np.trace(sigma2) - 2 * np.trace(covmean)
+
+
+def kernel_inception_distance(feats1, feats2, n_subsets=100, subset_size=1000, seed=0):
+    r""" Unbiased MMD^2 with the cubic polynomial kernel, averaged over random subsets.
+    Returns:
+        (float, float): mean and std over the subsets
+    """
+    rng = np.random.RandomState(seed)
+    feats1 = np.asarray(feats1, dtype=np.float64)
+    feats2 = np.asarray(feats2, dtype=np.float64)
+    m = min(len(feats1), len(feats2), subset_size)
+    dim = feats1.shape[1]
+    mmds = []
+    for _ in range(n_subsets):
+        x = feats1[rng.choice(len(feats1), m, replace=False)]
+        y = feats2[rng.choice(len(feats2), m, replace=False)]
+        k_xx = (x.dot(x.T) / dim + 1) ** 3
+        k_yy = (y.dot(y.T) / dim + 1) ** 3
+        k_xy = (x.dot(y.T) / dim + 1) ** 3
+        mmd = (k_xx.sum() - np.trace(k_xx) + k_yy.sum() - np.trace(k_yy)) / (m * (m - 1)) - 2 * k_xy.mean()
+        mmds.append(mmd)
+    return np.mean(mmds), np.std(mmds)
+
+
+def load_image_dir(images_dir, transform=None):
+    from skimage.io import imread
+    for img_name in sorted(os.listdir(images_dir)):
+        img = imread(os.path.join(images_dir, img_name))
+        if img.ndim == 2:
+            img = np.stack([img] * 3, -1)
+        img = img[..., :3]
+        yield img if transform is None else transform(img)
+
+
+def weights_digest(weights_path, chunk_size=1 << 20):
+    r""" md5 of the size and contents of a weights file, the same file under any path gives the same digest. """
+    digest = hashlib.md5(str(os.path.getsize(weights_path)).encode())
+    with open(weights_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stats_cache_file(dataset, img_size, cache_dir=STATS_CACHE_DIR, weights_path=INCEPTION_WEIGHTS):
+    weights = weights_digest(weights_path)[:8]
+    # '_fid': statistics of the TF graph blocks, earlier files came from the stock torchvision blocks
+    return os.path.join(cache_dir, '%s_%dx%d_%s_fid.npz' % (dataset, img_size[0], img_size[1], weights))
+
+
+def real_statistics(model, real_images_dir, dataset, img_size, batch_size=100, device=None,
+                    cache_dir=STATS_CACHE_DIR, weights_path=INCEPTION_WEIGHTS, max_kid_samples=10000, transform=None):
+    r""" mu, sigma and a feature sample of the real images, cached on disk per dataset and resolution.
+    `transform` is applied to every real image before it is resized to img_size, e.g. the padding the
+    generated images went through.
+    """
+    cache_file = stats_cache_file(dataset, img_size, cache_dir, weights_path)
+    if os.path.exists(cache_file):
+        cached = np.load(cache_file)
+        return cached['mu'], cached['sigma'], cached['feats']
+
+    stats = RunningStats(max_samples=max_kid_samples)
+    for pool3, _ in get_activations(model, load_image_dir(real_images_dir, transform), batch_size, device, img_size):
+        stats.update(pool3)
+    mu, sigma, feats = stats.mean, stats.cov, stats.sampled_features()
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    np.savez(cache_file, mu=mu, sigma=sigma, feats=feats)
+    return mu, sigma, feats
+
+
+def compute_metrics(generated_images, real_images_dir=None, dataset=None, splits=10, batch_size=100, device=None,
+                    weights_path=INCEPTION_WEIGHTS, cache_dir=STATS_CACHE_DIR, model=None,
+                    kid_subsets=100, kid_subset_size=1000, real_transform=None):
+    r""" IS of the generated images, plus FID and KID against real_images_dir when it is given,
+    from a single inception pass over the generated images.
+    Returns:
+        dict: IS, IS_std and, with real images, FID, KID, KID_std
+    """
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    if model is None:
+        model = InceptionFeatures(weights_path).to(device)
+
+    img_size = generated_images[0].shape[:2]
+    stats = RunningStats(max_samples=len(generated_images))
+    preds = []
+    for pool3, pred in get_activations(model, generated_images, batch_size, device):
+        stats.update(pool3)
+        preds.append(pred)
+    preds = np.concatenate(preds, 0)
+
+    results = {}
+    results['IS'], results['IS_std'] = inception_score_from_preds(preds, splits)
+    if real_images_dir is not None:
+        if dataset is None:
+            dataset = os.path.basename(os.path.normpath(real_images_dir))
+        mu, sigma, real_feats = real_statistics(model, real_images_dir, dataset, img_size, batch_size, device,
+                                                cache_dir, weights_path, transform=real_transform)
+        results['FID'] = frechet_distance(stats.mean, stats.cov, mu, sigma)
+        results['KID'], results['KID_std'] = kernel_inception_distance(stats.sampled_features(), real_feats,
+                                                                       kid_subsets, kid_subset_size)
+    return results
+
+
+def get_inception_score(images, splits=10, batch_size=100, device=None, weights_path=INCEPTION_WEIGHTS, model=None):
+    # drop-in replacement of inception_score.get_inception_score
+    results = compute_metrics(images, splits=splits, batch_size=batch_size, device=device,
+                              weights_path=weights_path, model=model)
+    return results['IS'], results['IS_std']
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Computing IS, FID and KID")
+    parser.add_argument("--generated_images_dir", required=True, help='Folder with images')
+    parser.add_argument("--fid_real_path", default=None, help='Folder with real images for FID/KID')
+    parser.add_argument("--dataset", default=None, help='Name of the real set used as cache key (default: folder name)')
+    parser.add_argument("--inception_weights", default=INCEPTION_WEIGHTS, help='Local inception state dict')
+    parser.add_argument("--stats_cache_dir", default=STATS_CACHE_DIR, help='Folder for cached real statistics')
+    parser.add_argument("--batch_size", default=100, type=int)
+    parser.add_argument("--device", default=None)
+    args = parser.parse_args()
+
+    images = list(load_image_dir(args.generated_images_dir))
+    results = compute_metrics(images, args.fid_real_path, args.dataset, batch_size=args.batch_size,
+                              device=args.device, weights_path=args.inception_weights, cache_dir=args.stats_cache_dir)
+    print(' '.join('%s = %s' % (k, v) for k, v in sorted(results.items())))
@@ -1,8 +1,9 @@
 import os
-from inception_score import get_inception_score
+from inception_metrics import compute_metrics, INCEPTION_WEIGHTS, STATS_CACHE_DIR
+
+from ssim_metrics import ssim_score
 
 from skimage.io import imread, imsave
-from skimage.measure import compare_ssim
 
 import numpy as np
 import pandas as pd
@@ -20,16 +21,6 @@ def l1_score(generated_images, reference_images):
     return np.mean(score_list)
 
 
-def ssim_score(generated_images, reference_images):
-    ssim_score_list = []
-    for reference_image, generated_image in zip(reference_images, generated_images):
-        ssim = compare_ssim(reference_image, generated_image, gaussian_weights=True, sigma=1.5,
-                            use_sample_covariance=False, multichannel=True,
-                            data_range=generated_image.max() - generated_image.min())
-        ssim_score_list.append(ssim)
-    return np.mean(ssim_score_list)
-
-
 def save_images(input_images, target_images, generated_images, names, output_folder):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
@@ -38,17 +29,25 @@ def save_images(input_images, target_images, generated_images, names, output_fol
         imsave(os.path.join(output_folder, res_name), np.concatenate(images[:-1], axis=1))
 
 
-def create_masked_image(names, images, annotation_file):
+def create_masks(names, img_size, annotation_file):
+    # one mask per target name, shared by every pair with that target
     import pose_utils
+    df = pd.read_csv(annotation_file, sep=':').drop_duplicates('name').set_index('name')
+    targets = sorted(set(name[1] for name in names))
+    kp_to = [pose_utils.load_pose_cords_from_strings(df.at[to, 'keypoints_y'], df.at[to, 'keypoints_x'])
+             for to in targets]
+    if len(targets) == 0:
+        return {}
+    masks = pose_utils.produce_ma_masks(np.stack(kp_to), img_size)
+    return dict(zip(targets, masks))
+
+
+def create_masked_image(names, images, annotation_file, masks=None):
+    if masks is None:
+        masks = create_masks(names, images[0].shape[:2], annotation_file)
     masked_images = []
-    df = pd.read_csv(annotation_file, sep=':')
     for name, image in zip(names, images):
-        to = name[1]
-        ano_to = df[df['name'] == to].iloc[0]
-
-        kp_to = pose_utils.load_pose_cords_from_strings(ano_to['keypoints_y'], ano_to['keypoints_x'])
-
-        mask = pose_utils.produce_ma_mask(kp_to, image.shape[:2])
+        mask = masks[name[1]]
         masked_images.append(image * mask[..., np.newaxis])
 
     return masked_images
@@ -92,22 +91,31 @@ def load_generated_images(images_folder):
     return input_images, target_images, generated_images, names
 
 
-def test(generated_images_dir):
+def test(generated_images_dir, batch_size=256, device=None, fid_real_path=None, dataset='fashion',
+         inception_weights=INCEPTION_WEIGHTS, stats_cache_dir=STATS_CACHE_DIR):
     # load images
     print ("Loading images...")
 
     input_images, target_images, generated_images, names = load_generated_images(generated_images_dir)
 
     print ("Compute inception score...")
-    inception_score = get_inception_score(generated_images)
+    # real images get the same white bounding as the generated ones
+    inception_metrics = compute_metrics(generated_images, fid_real_path, dataset + '_bound40', device=device,
+                                        cache_dir=stats_cache_dir, weights_path=inception_weights,
+                                        real_transform=addBounding)
+    inception_score = (inception_metrics['IS'], inception_metrics['IS_std'])
     print ("Inception score %s" % inception_score[0])
+    if fid_real_path is not None:
+        print ("FID %s KID %s" % (inception_metrics['FID'], inception_metrics['KID']))
 
     print ("Compute structured similarity score (SSIM)...")
-    structured_score = ssim_score(generated_images, target_images)
+    structured_score = ssim_score(generated_images, target_images, batch_size, device)
     print ("SSIM score %s" % structured_score)
 
     print(generated_images_dir)
     print ("SSIM score = %s Inception score = %s" % (structured_score, inception_score))
+    if fid_real_path is not None:
+        print ("FID = %s KID = %s" % (inception_metrics['FID'], (inception_metrics['KID'], inception_metrics['KID_std'])))
 
 
 if __name__ == "__main__":
@@ -121,12 +129,19 @@ if __name__ == "__main__":
     parser.add_argument("--generated_images_dir",
                         default='./results/results_fashion/fasion_PATN_ganssimperl1/test_latest/images',
                         help='Folder with images')
+    parser.add_argument("--batch_size", default=256, type=int, help='Number of images per batched SSIM computation')
+    parser.add_argument("--device", default=None, help='Device for the SSIM and inception computation, e.g. cpu or cuda (default: cuda if available)')
+    parser.add_argument("--fid_real_path", default=None, help='Folder with real images, FID and KID are computed when given')
+    parser.add_argument("--dataset", default='fashion', help='Name of the real set, used as key of the cached real statistics')
+    parser.add_argument("--inception_weights", default=INCEPTION_WEIGHTS, help='Local state dict of the inception network')
+    parser.add_argument("--stats_cache_dir", default=STATS_CACHE_DIR, help='Folder of the cached real statistics')
 
     args = parser.parse_args()
     generated_images_dir = args.generated_images_dir
     # generated_images_dir = '/home/haoyue/codes/results/market_PATN/test_latest_SSIM/images'
 
-    test(generated_images_dir)
+    test(generated_images_dir, args.batch_size, args.device, args.fid_real_path, args.dataset,
+         args.inception_weights, args.stats_cache_dir)
 
 
 
@@ -0,0 +1,99 @@
+import sys
+import time
+
+import torch
+
+sys.path.append('.')
+from models.inference import optimize_generator, freeze_generator
+from tool.benchmark_G import DATASETS, build_G, random_inputs
+
+
+def load_G(checkpoint, which_model_netG='PATN', **kwargs):
+    r""" Generator of a *_net_netG.pth checkpoint, in eval mode on the cpu.
+    Without a checkpoint the weights are random and the BatchNorm running statistics are randomized as well,
+    so that folding them is not a no-op.
+    """
+    netG = build_G(which_model_netG, **kwargs)
+    if checkpoint:
+        netG.load_state_dict(torch.load(checkpoint, map_location='cpu'))
+    else:
+        for m in netG.modules():
+            if isinstance(m, torch.nn.BatchNorm2d):
+                m.running_mean.uniform_(-0.1, 0.1)
+                m.running_var.uniform_(0.5, 2)
+    return netG.eval()
+
+
+def add_generator_arguments(parser):
+    r""" Options of the generator of a checkpoint, as the training options define it. """
+    parser.add_argument("--checkpoint", default='', help='*_net_netG.pth, random weights when empty')
+    parser.add_argument("--dataset", default='market', choices=sorted(DATASETS.keys()), help='Image size preset')
+    parser.add_argument("--which_model_netG", default='PATN', choices=['PATN', 'PATN_lite', 'Xing'])
+    parser.add_argument("--ngf", default=64, type=int)
+    parser.add_argument("--n_blocks", default=9, type=int)
+    parser.add_argument("--n_downsampling", default=2, type=int)
+    parser.add_argument("--norm", default='batch', choices=['batch', 'instance'])
+    parser.add_argument("--dropout", action='store_true', help='Generator trained with dropout')
+    parser.add_argument("--widths", default='', help='Width config of a pruned PATN generator')
+
+
+def load_G_from_args(args):
+    return load_G(args.checkpoint, args.which_model_netG, ngf=args.ngf, n_blocks=args.n_blocks, norm=args.norm,
+                  use_dropout=args.dropout, n_downsampling=args.n_downsampling, widths=args.widths or None)
+
+
+def seconds_per_image(net, inputs, n_iter=20, warmup=3):
+    with torch.inference_mode():
+        for i in range(warmup + n_iter):
+            if i == warmup:
+                start = time.time()
+            net(*inputs)
+    return (time.time() - start) / n_iter / inputs[0].size(0)
+
+
+def report(netG, inputs, n_iter=20, atol=1e-4):
+    r""" Output difference and per image latency of the original generator, the optimized module and its
+    frozen TorchScript.
+    Returns:
+        the frozen TorchScript module
+    """
+    optimized = optimize_generator(netG)
+    frozen = freeze_generator(optimized, inputs)
+    count = lambda net, types: sum(isinstance(m, types) for m in net.modules())
+    print('BatchNorm2d %d -> %d, Dropout %d -> %d' % (
+        count(netG, torch.nn.BatchNorm2d), count(optimized, torch.nn.BatchNorm2d),
+        count(netG, torch.nn.Dropout), count(optimized, torch.nn.Dropout)))
+    original = lambda image, pose: netG([image, pose])
+    with torch.inference_mode():
+        expected = original(*inputs)
+        diffs = [(net(*inputs) - expected).abs().max().item() for net in (optimized, frozen)]
+
+    print('%-12s %12s %12s %10s' % ('generator', 'max diff', 'ms/image', 'speedup'))
+    times = []
+    for name, net, diff in [('original', original, 0.), ('optimized', optimized, diffs[0]), ('frozen', frozen, diffs[1])]:
+        times.append(seconds_per_image(net, inputs, n_iter))
+        print('%-12s %12.2g %12.2f %9.2fx' % (name, diff, times[-1] * 1000, times[0] / times[-1]))
+    assert max(diffs) <= atol, 'optimized generator differs from the original by %g' % max(diffs)
+    return frozen
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Eval-only generator: norms folded, dropout removed, gates fused, frozen")
+    add_generator_arguments(parser)
+    parser.add_argument("--output", default='', help='Where to save the frozen TorchScript module')
+    parser.add_argument("--batch_size", default=1, type=int)
+    parser.add_argument("--n_iter", default=20, type=int, help='Timed passes per generator')
+    parser.add_argument("--threads", default=0, type=int, help='torch cpu threads, 0 for the default')
+    parser.add_argument("--atol", default=1e-4, type=float, help='Largest accepted output difference')
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    netG = load_G_from_args(args)
+    inputs = random_inputs(args.batch_size, DATASETS[args.dataset]['image_size'])
+    frozen = report(netG, inputs, args.n_iter, args.atol)
+    if args.output:
+        torch.jit.save(frozen, args.output)
+        print('saved %s' % args.output)
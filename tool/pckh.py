@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+MISSING_VALUE = -1
+
+PARTS_SEL = [0, 1, 14, 15, 16, 17]
+
+
+def parse_cords(strings, n_parts=18):
+    r""" '[y0, y1, ...]' strings of an annotation column --> (N, n_parts) array, without a json.loads per row. """
+    strings = list(strings)
+    if len(strings) == 0:
+        return np.zeros((0, n_parts))
+    values = ','.join(s.strip().strip('[]') for s in strings)
+    return np.array(values.split(','), dtype=np.float64).reshape(len(strings), n_parts)
+
+
+def load_annotations(annotation_file):
+    r""" Keypoints of an annotation csv, indexed by name (first row wins for duplicated names).
+    Returns:
+        (pd.Index, np.ndarray, np.ndarray): names, (N,18) y and (N,18) x coordinates
+    """
+    df = pd.read_csv(annotation_file, sep=':')
+    df = df.drop_duplicates('name')
+    return pd.Index(df['name']), parse_cords(df['keypoints_y']), parse_cords(df['keypoints_x'])
+
+
+def target_names(pred_names):
+    r""" Target image name of every predicted crop name, 'fr___to_vis.jpg' or legacy 'fr.jpg_to.jpg'. """
+    names = pd.Series(pred_names, dtype=object)
+    names = pd.Series(np.where(names.str.contains('_vis'), names.str[:-8], names.str[:-4]), dtype=object)
+    pairs = names.str.contains('___')
+    return np.where(pairs, names.str.split('___').str[1], names.str.split('jpg_').str[1])
+
+
+def head_sizes(tx, ty):
+    r""" Width and height of the box around the visible head keypoints, -1 with fewer than 2 of them.
+    Args:
+        tx, ty (np.ndarray): (N,18) target coordinates
+    Returns:
+        (np.ndarray, np.ndarray): (N,) widths and heights
+    """
+    hx = tx[:, PARTS_SEL]
+    hy = ty[:, PARTS_SEL]
+    present = (hx != MISSING_VALUE) & (hy != MISSING_VALUE)
+    enough = present.sum(1) >= 2
+    w = np.where(present, hx, -np.inf).max(1) - np.where(present, hx, np.inf).min(1)
+    h = np.where(present, hy, -np.inf).max(1) - np.where(present, hy, np.inf).min(1)
+    return np.where(enough, w, -1), np.where(enough, h, -1)
+
+
+def pckh_counts(px, py, tx, ty, alphas=(0.5,)):
+    r""" Correct and valid keypoint counts for several alpha thresholds at once.
+    Args:
+        px, py, tx, ty (np.ndarray): (N,18) predicted and target coordinates of matched rows
+        alphas (list): thresholds, relative to the head size
+    Returns:
+        (np.ndarray, int): (len(alphas),) numbers of correct keypoints, number of valid target keypoints
+    """
+    w, h = head_sizes(tx, ty)
+    rows = (w != -1) & (h != -1)
+    px, py, tx, ty, w, h = px[rows], py[rows], tx[rows], ty[rows], w[rows], h[rows]
+
+    n_all = int((ty != MISSING_VALUE).sum())
+    valid = (px != MISSING_VALUE) & (py != MISSING_VALUE) & (tx != MISSING_VALUE) & (ty != MISSING_VALUE)
+    alphas = np.asarray(alphas, dtype=np.float64)[:, np.newaxis, np.newaxis]
+    hits = (valid & (np.abs(px - tx) < w[:, np.newaxis] * alphas) & (np.abs(py - ty) < h[:, np.newaxis] * alphas))
+    return hits.reshape(len(alphas), -1).sum(1), n_all
+
+
+def pckh(pred_annotation, target_annotation, alphas=(0.5,)):
+    r""" PCKh of a predicted keypoint csv against the target annotations.
+    Predictions are joined to their target through a hash index of the target names.
+    Returns:
+        list: (alpha, n_correct, n_all, score) for every alpha
+    """
+    t_names, ty_all, tx_all = load_annotations(target_annotation)
+    p_anno = pd.read_csv(pred_annotation, sep=':')
+    py = parse_cords(p_anno['keypoints_y'])
+    px = parse_cords(p_anno['keypoints_x'])
+
+    tnames = target_names(p_anno['name'])
+    index = t_names.get_indexer(tnames)
+    if (index < 0).any():
+        raise KeyError('no target annotation for %s' % tnames[index < 0][0])
+
+    n_correct, n_all = pckh_counts(px, py, tx_all[index], ty_all[index], alphas)
+    return [(alpha, int(n), n_all, n * 1.0 / n_all) for alpha, n in zip(alphas, n_correct)]
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Computing PCKh")
+    parser.add_argument("--target_annotation", default='./datasets/market_data/market-annotation-test.csv',
+                        help='Annotation csv of the target images')
+    parser.add_argument("--pred_annotation", default='./results/market_PATN_bpb_ssim_gan/test_latest/images_crop.csv',
+                        help='Keypoints csv of the generated images, as written by compute_coordinates.py')
+    parser.add_argument("--alpha", default=[0.5], type=float, nargs='+', help='Thresholds relative to the head size')
+    args = parser.parse_args()
+
+    for alpha, n_correct, n_all, score in pckh(args.pred_annotation, args.target_annotation, args.alpha):
+        print('alpha %g: %d/%d %f' % (alpha, n_correct, n_all, score))
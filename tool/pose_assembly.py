@@ -0,0 +1,387 @@
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+mapIdx = [[31,32], [39,40], [33,34], [35,36], [41,42], [43,44], [19,20], [21,22],
+          [23,24], [25,26], [27,28], [29,30], [47,48], [49,50], [53,54], [51,52],
+          [55,56], [37,38], [45,46]]
+
+limbSeq = [[2,3], [2,6], [3,4], [4,5], [6,7], [7,8], [2,9], [9,10],
+           [10,11], [2,12], [12,13], [13,14], [2,1], [1,15], [15,17],
+           [1,16], [16,18], [3,17], [6,18]]
+
+MID_NUM = 10
+
+
+def find_peaks(heatmap_avg, th1=0.1, n_parts=18):
+    r""" Non-max suppression of all part heatmaps at once.
+    Returns:
+        np.ndarray: (n_peaks, 5) candidates [x, y, score, id, part], ordered by part then row-major position
+    """
+    map_ori = heatmap_avg[:, :, :n_parts]
+    # sigma 0 on the part axis: every part is smoothed on its own
+    map = gaussian_filter(map_ori, sigma=(3, 3, 0))
+
+    # 4-neighbourhood maxima, zero outside the map
+    padded = np.zeros((map.shape[0] + 2, map.shape[1] + 2, n_parts))
+    padded[1:-1, 1:-1] = map
+    peaks_binary = np.logical_and.reduce((map >= padded[:-2, 1:-1], map >= padded[2:, 1:-1],
+                                          map >= padded[1:-1, :-2], map >= padded[1:-1, 2:], map > th1))
+
+    part, y, x = np.nonzero(peaks_binary.transpose(2, 0, 1))
+    candidate = np.zeros((len(part), 5))
+    candidate[:, 0] = x
+    candidate[:, 1] = y
+    candidate[:, 2] = map_ori[y, x, part]
+    candidate[:, 3] = np.arange(len(part))
+    candidate[:, 4] = part
+    return candidate
+
+
+def score_limb(candA, candB, score_mid, img_height, th2=0.05, mid_num=MID_NUM):
+    r""" PAF line integral of every (A, B) candidate pair of a limb, sampled as one gather.
+    Returns:
+        (np.ndarray, np.ndarray): (nA, nB) score with distance prior, (nA, nB) bool of the accepted pairs
+    """
+    vec = candB[np.newaxis, :, :2] - candA[:, np.newaxis, :2]
+    norm = np.sqrt(vec[..., 0] * vec[..., 0] + vec[..., 1] * vec[..., 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vec = vec / norm[..., np.newaxis]
+
+        start = np.broadcast_to(candA[:, np.newaxis, :2], vec.shape)
+        stop = np.broadcast_to(candB[np.newaxis, :, :2], vec.shape)
+        startend = np.linspace(start, stop, num=mid_num, axis=-2)  # (nA, nB, mid_num, 2)
+        xs = np.rint(startend[..., 0]).astype(np.int64)
+        ys = np.rint(startend[..., 1]).astype(np.int64)
+        vec_x = score_mid[ys, xs, 0]
+        vec_y = score_mid[ys, xs, 1]
+
+        score_midpts = vec_x * vec[..., 0:1] + vec_y * vec[..., 1:2]
+        # summed in sample order, as sum() over the samples
+        total = 0
+        for I in range(mid_num):
+            total = total + score_midpts[..., I]
+        score_with_dist_prior = total / mid_num + np.minimum(0.5 * img_height / norm - 1, 0)
+
+        criterion1 = (score_midpts > th2).sum(-1) > 0.8 * mid_num
+        criterion2 = score_with_dist_prior > 0
+    return score_with_dist_prior, criterion1 & criterion2
+
+
+def match_limb(candA, candB, score, valid):
+    r""" Greedy one-to-one matching of the accepted pairs, best score first.
+    Returns:
+        np.ndarray: (n_connections, 5) rows [idA, idB, score, i, j]
+    """
+    i, j = np.nonzero(valid)
+    s = score[i, j]
+    order = np.argsort(-s, kind='stable')
+    used_A = np.zeros(len(candA), dtype=bool)
+    used_B = np.zeros(len(candB), dtype=bool)
+    keep = []
+    max_connections = min(len(candA), len(candB))
+    for c in order:
+        if not used_A[i[c]] and not used_B[j[c]]:
+            used_A[i[c]] = True
+            used_B[j[c]] = True
+            keep.append(c)
+            if len(keep) >= max_connections:
+                break
+    keep = np.array(keep, dtype=np.int64)
+    connection = np.zeros((len(keep), 5))
+    connection[:, 0] = candA[i[keep], 3]
+    connection[:, 1] = candB[j[keep], 3]
+    connection[:, 2] = s[keep]
+    connection[:, 3] = i[keep]
+    connection[:, 4] = j[keep]
+    return connection
+
+
+def assemble_subsets(connection_all, candidate, n_parts=18):
+    r""" Group limb connections into persons.
+    last number in each row is the total parts number of that person,
+    the second last number in each row is the score of the overall configuration
+    """
+    n_rows_max = sum(len(connection) for connection in connection_all if connection is not None)
+    subset = -1 * np.ones((n_rows_max, n_parts + 2))
+    n = 0
+
+    for k in range(len(mapIdx)):
+        connection = connection_all[k]
+        if connection is None:
+            continue
+        partAs = connection[:, 0]
+        partBs = connection[:, 1]
+        indexA, indexB = np.array(limbSeq[k]) - 1
+
+        for i in range(len(connection)):
+            subset_idx = np.nonzero((subset[:n, indexA] == partAs[i]) | (subset[:n, indexB] == partBs[i]))[0]
+            found = len(subset_idx)
+
+            if found == 1:
+                j = subset_idx[0]
+                if subset[j][indexB] != partBs[i]:
+                    subset[j][indexB] = partBs[i]
+                    subset[j][-1] += 1
+                    subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection[i][2]
+            elif found == 2:  # if found 2 and disjoint, merge them
+                j1, j2 = subset_idx
+                membership = ((subset[j1] >= 0).astype(int) + (subset[j2] >= 0).astype(int))[:-2]
+                if len(np.nonzero(membership == 2)[0]) == 0:  # merge
+                    subset[j1][:-2] += (subset[j2][:-2] + 1)
+                    subset[j1][-2:] += subset[j2][-2:]
+                    subset[j1][-2] += connection[i][2]
+                    subset[j2:n - 1] = subset[j2 + 1:n]
+                    subset[n - 1] = -1
+                    n -= 1
+                else:  # as like found == 1
+                    subset[j1][indexB] = partBs[i]
+                    subset[j1][-1] += 1
+                    subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection[i][2]
+
+            # if find no partA in the subset, create a new subset
+            elif not found and k < 17:
+                row = subset[n]
+                row[indexA] = partAs[i]
+                row[indexB] = partBs[i]
+                row[-1] = 2
+                row[-2] = candidate[partAs[i].astype(int), 2] + candidate[partBs[i].astype(int), 2] + connection[i][2]
+                n += 1
+
+    subset = subset[:n]
+    # delete some rows of subset which has few parts occur
+    keep = ~np.logical_or(subset[:, -1] < 4, subset[:, -2] / subset[:, -1] < 0.4)
+    return subset[keep]
+
+
+def compute_cordinates(heatmap_avg, paf_avg, th1=0.1, th2=0.05):
+    r""" Keypoints (y, x) of the highest scoring person, -1 for missing parts.
+    Args:
+        heatmap_avg (np.ndarray): (h, w, 19) part heatmaps at image resolution
+        paf_avg (np.ndarray): (h, w, 38) part affinity fields at image resolution
+    Returns:
+        np.ndarray: (18, 2) int keypoints
+    """
+    candidate = find_peaks(heatmap_avg, th1)
+    parts = candidate[:, 4].astype(int)
+    img_height = heatmap_avg.shape[0]
+
+    connection_all = []
+    for k in range(len(mapIdx)):
+        score_mid = paf_avg[:, :, [x - 19 for x in mapIdx[k]]]
+        candA = candidate[parts == limbSeq[k][0] - 1]
+        candB = candidate[parts == limbSeq[k][1] - 1]
+        if len(candA) != 0 and len(candB) != 0:
+            score, valid = score_limb(candA, candB, score_mid, img_height, th2)
+            connection_all.append(match_limb(candA, candB, score, valid))
+        else:
+            connection_all.append(None)
+
+    subset = assemble_subsets(connection_all, candidate)
+    if len(subset) == 0:
+        return np.array([[-1, -1]] * 18).astype(int)
+
+    person = subset[np.argmax(subset[:, -2]), :18].astype(int)
+    cordinates = np.where(person[:, np.newaxis] == -1, -1, candidate[person][:, [1, 0]])
+    return cordinates.astype(int)
+
+
+def compute_cordinates_reference(heatmap_avg, paf_avg, th1=0.1, th2=0.05):
+    # loop implementation the vectorized one replaces, kept for check_parity
+    all_peaks = []
+    peak_counter = 0
+
+    for part in range(18):
+        map_ori = heatmap_avg[:,:,part]
+        map = gaussian_filter(map_ori, sigma=3)
+
+        map_left = np.zeros(map.shape)
+        map_left[1:,:] = map[:-1,:]
+        map_right = np.zeros(map.shape)
+        map_right[:-1,:] = map[1:,:]
+        map_up = np.zeros(map.shape)
+        map_up[:,1:] = map[:,:-1]
+        map_down = np.zeros(map.shape)
+        map_down[:,:-1] = map[:,1:]
+
+        peaks_binary = np.logical_and.reduce((map>=map_left, map>=map_right, map>=map_up, map>=map_down, map > th1))
+        peaks = list(zip(np.nonzero(peaks_binary)[1], np.nonzero(peaks_binary)[0])) # note reverse
+
+        peaks_with_score = [x + (map_ori[x[1],x[0]],) for x in peaks]
+        id = range(peak_counter, peak_counter + len(peaks))
+        peaks_with_score_and_id = [peaks_with_score[i] + (id[i],) for i in range(len(id))]
+
+        all_peaks.append(peaks_with_score_and_id)
+        peak_counter += len(peaks)
+
+    connection_all = []
+    special_k = []
+    mid_num = 10
+
+    for k in range(len(mapIdx)):
+        score_mid = paf_avg[:,:,[x-19 for x in mapIdx[k]]]
+        candA = all_peaks[limbSeq[k][0]-1]
+        candB = all_peaks[limbSeq[k][1]-1]
+        nA = len(candA)
+        nB = len(candB)
+        if(nA != 0 and nB != 0):
+            connection_candidate = []
+            for i in range(nA):
+                for j in range(nB):
+                    vec = np.subtract(candB[j][:2], candA[i][:2])
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        norm = np.sqrt(vec[0]*vec[0] + vec[1]*vec[1])
+                        vec = np.divide(vec, norm)
+
+                        startend = list(zip(np.linspace(candA[i][0], candB[j][0], num=mid_num),
+                                            np.linspace(candA[i][1], candB[j][1], num=mid_num)))
+                        vec_x = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 0]
+                                          for I in range(len(startend))])
+                        vec_y = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 1]
+                                          for I in range(len(startend))])
+
+                        score_midpts = np.multiply(vec_x, vec[0]) + np.multiply(vec_y, vec[1])
+                        score_with_dist_prior = sum(score_midpts)/len(score_midpts) + min(0.5*heatmap_avg.shape[0]/norm-1, 0)
+                    criterion1 = len(np.nonzero(score_midpts > th2)[0]) > 0.8 * len(score_midpts)
+                    criterion2 = score_with_dist_prior > 0
+                    if criterion1 and criterion2:
+                        connection_candidate.append([i, j, score_with_dist_prior, score_with_dist_prior+candA[i][2]+candB[j][2]])
+
+            connection_candidate = sorted(connection_candidate, key=lambda x: x[2], reverse=True)
+            connection = np.zeros((0,5))
+            for c in range(len(connection_candidate)):
+                i,j,s = connection_candidate[c][0:3]
+                if(i not in connection[:,3] and j not in connection[:,4]):
+                    connection = np.vstack([connection, [candA[i][3], candB[j][3], s, i, j]])
+                    if(len(connection) >= min(nA, nB)):
+                        break
+
+            connection_all.append(connection)
+        else:
+            special_k.append(k)
+            connection_all.append([])
+
+    subset = -1 * np.ones((0, 20))
+    candidate = np.array([item for sublist in all_peaks for item in sublist])
+
+    for k in range(len(mapIdx)):
+        if k not in special_k:
+            partAs = connection_all[k][:,0]
+            partBs = connection_all[k][:,1]
+            indexA, indexB = np.array(limbSeq[k]) - 1
+
+            for i in range(len(connection_all[k])):
+                found = 0
+                subset_idx = [-1, -1]
+                for j in range(len(subset)):
+                    if subset[j][indexA] == partAs[i] or subset[j][indexB] == partBs[i]:
+                        subset_idx[found] = j
+                        found += 1
+
+                if found == 1:
+                    j = subset_idx[0]
+                    if(subset[j][indexB] != partBs[i]):
+                        subset[j][indexB] = partBs[i]
+                        subset[j][-1] += 1
+                        subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+                elif found == 2:
+                    j1, j2 = subset_idx
+                    membership = ((subset[j1]>=0).astype(int) + (subset[j2]>=0).astype(int))[:-2]
+                    if len(np.nonzero(membership == 2)[0]) == 0:
+                        subset[j1][:-2] += (subset[j2][:-2] + 1)
+                        subset[j1][-2:] += subset[j2][-2:]
+                        subset[j1][-2] += connection_all[k][i][2]
+                        subset = np.delete(subset, j2, 0)
+                    else:
+                        subset[j1][indexB] = partBs[i]
+                        subset[j1][-1] += 1
+                        subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+                elif not found and k < 17:
+                    row = -1 * np.ones(20)
+                    row[indexA] = partAs[i]
+                    row[indexB] = partBs[i]
+                    row[-1] = 2
+                    row[-2] = sum(candidate[connection_all[k][i,:2].astype(int), 2]) + connection_all[k][i][2]
+                    subset = np.vstack([subset, row])
+
+    deleteIdx = []
+    for i in range(len(subset)):
+        if subset[i][-1] < 4 or subset[i][-2]/subset[i][-1] < 0.4:
+            deleteIdx.append(i)
+    subset = np.delete(subset, deleteIdx, axis=0)
+
+    if len(subset) == 0:
+        return np.array([[-1, -1]] * 18).astype(int)
+
+    cordinates = []
+    result_image_index = np.argmax(subset[:, -2])
+
+    for part in subset[result_image_index, :18]:
+        if part == -1:
+            cordinates.append([-1, -1])
+        else:
+            Y = candidate[part.astype(int), 0]
+            X = candidate[part.astype(int), 1]
+            cordinates.append([X, Y])
+    return np.array(cordinates).astype(int)
+
+
+def synthetic_maps(rng, img_size=(128, 64), n_persons=2, noise=0.02):
+    r""" Heatmaps and PAFs of random stick figures, with clutter, for check_parity. """
+    h, w = img_size
+    yy, xx = np.mgrid[:h, :w]
+    heatmap = np.zeros((h, w, 19))
+    paf = np.zeros((h, w, 38))
+    for _ in range(n_persons):
+        joints = np.stack([rng.uniform(2, w - 3, 18), rng.uniform(2, h - 3, 18)], -1)
+        visible = rng.rand(18) > 0.15
+        for part in range(18):
+            if visible[part]:
+                d2 = (xx - joints[part, 0]) ** 2 + (yy - joints[part, 1]) ** 2
+                heatmap[:, :, part] = np.maximum(heatmap[:, :, part], np.exp(-d2 / (2 * 2.0 ** 2)))
+        for k, (a, b) in enumerate(limbSeq):
+            a, b = a - 1, b - 1
+            if not (visible[a] and visible[b]):
+                continue
+            vec = joints[b] - joints[a]
+            length = np.linalg.norm(vec)
+            if length < 1e-3:
+                continue
+            vec = vec / length
+            rel = np.stack([xx - joints[a, 0], yy - joints[a, 1]], -1)
+            along = rel.dot(vec)
+            across = np.abs(rel.dot(np.array([-vec[1], vec[0]])))
+            on_limb = (along >= 0) & (along <= length) & (across <= 3)
+            ch = [x - 19 for x in mapIdx[k]]
+            paf[on_limb, ch[0]] = vec[0]
+            paf[on_limb, ch[1]] = vec[1]
+    heatmap[:, :, :18] += noise * rng.rand(h, w, 18)
+    heatmap[:, :, 18] = 1 - heatmap[:, :, :18].max(-1)
+    paf += noise * rng.randn(h, w, 38)
+    return heatmap, paf
+
+
+def check_parity(n_fixtures=50, seed=0):
+    r""" Compare compute_cordinates with the loop implementation on synthetic fixtures,
+    return the number of fixtures with different keypoints.
+    """
+    rng = np.random.RandomState(seed)
+    n_diff = 0
+    for f in range(n_fixtures):
+        img_size = (128, 64) if f % 2 else (96, 96)
+        heatmap, paf = synthetic_maps(rng, img_size, n_persons=1 + f % 3)
+        expected = compute_cordinates_reference(heatmap, paf)
+        actual = compute_cordinates(heatmap, paf)
+        n_diff += int(not np.array_equal(expected, actual))
+    return n_diff
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Check the vectorized compute_cordinates against the loop implementation")
+    parser.add_argument("--n_fixtures", default=50, type=int, help='number of synthetic heatmap/PAF fixtures')
+    args = parser.parse_args()
+
+    n_diff = check_parity(args.n_fixtures)
+    print('%d of %d fixtures differ' % (n_diff, args.n_fixtures))
+    assert n_diff == 0, 'vectorized compute_cordinates does not match the loop implementation'
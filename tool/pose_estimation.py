@@ -0,0 +1,231 @@
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+from skimage.io import imread
+from skimage.transform import resize
+from tqdm import tqdm
+
+from pose_assembly import compute_cordinates
+
+BOXSIZE = 128
+SCALE_SEARCH = [0.5, 1, 1.5, 2]
+
+
+class PoseEstimator(object):
+    r""" Heatmap/PAF network of the PCKh pipeline.
+    predict takes a (N,h,w,3) batch of BGR images scaled to [-0.5, 0.5] and returns
+    (paf, heatmap) of shape (N,h',w',38) and (N,h',w',19).
+    """
+    def predict(self, batch):
+        raise NotImplementedError
+
+
+class KerasEstimator(PoseEstimator):
+    def __init__(self, model_path, batch_size=32):
+        from keras.models import load_model
+        self.model = load_model(model_path)
+        self.batch_size = batch_size
+
+    def predict(self, batch):
+        output1, output2 = self.model.predict(batch, batch_size=self.batch_size)
+        return output1, output2
+
+
+class FakeEstimator(PoseEstimator):
+    r""" Keras free estimator for tests: a fixed random projection of the 8x8 average pooled input,
+    with the output stride of the pose network.
+    """
+    def __init__(self, stride=8, seed=0):
+        rng = np.random.RandomState(seed)
+        self.stride = stride
+        self.weight = rng.randn(3, 57)
+
+    def predict(self, batch):
+        n, h, w, c = batch.shape
+        s = self.stride
+        h_out, w_out = h // s, w // s
+        pooled = batch[:, :h_out * s, :w_out * s].reshape(n, h_out, s, w_out, s, c).mean((2, 4))
+        out = 1 / (1 + np.exp(-4 * pooled.dot(self.weight)))
+        return out[..., 19:], out[..., :19]
+
+
+def _mirror_linear_weights(in_size, out_size):
+    # source indexes and weights of skimage order 1 resize in the default 'reflect' mode
+    coords = (np.arange(out_size, dtype=np.float64) + 0.5) * in_size / out_size - 0.5
+    if in_size > 1:
+        period = 2 * (in_size - 1)
+        coords = np.abs(np.mod(coords, period))
+        coords = np.where(coords > in_size - 1, period - coords, coords)
+    else:
+        coords = np.zeros_like(coords)
+    i0 = np.clip(np.floor(coords).astype(np.int64), 0, in_size - 1)
+    i1 = np.minimum(i0 + 1, in_size - 1)
+    w1 = coords - i0
+    return i0, i1, 1 - w1, w1
+
+
+def upsample_maps(maps, out_size):
+    r""" Batched equivalent of skimage.transform.resize(map, out_size, order=1, preserve_range=True)
+    for (N,h,w,C) maps upsampled to out_size along both axes.
+    """
+    y0, y1, wy0, wy1 = _mirror_linear_weights(maps.shape[1], out_size[0])
+    x0, x1, wx0, wx1 = _mirror_linear_weights(maps.shape[2], out_size[1])
+    maps = maps.astype(np.float64)
+    rows = maps[:, y0] * wy0[:, None, None] + maps[:, y1] * wy1[:, None, None]
+    return rows[:, :, x0] * wx0[:, None] + rows[:, :, x1] * wx1[:, None]
+
+
+def resize_maps(maps, out_size):
+    if maps.shape[1] <= out_size[0] and maps.shape[2] <= out_size[1]:
+        return upsample_maps(maps, out_size)
+    # shrinking goes through skimage for its anti-aliasing
+    return np.stack([resize(m, out_size, preserve_range=True, order=1) for m in maps])
+
+
+def load_bgr(path):
+    return imread(path)[:, :, ::-1]  # B,G,R order
+
+
+def scaled_inputs(images, scale_search=SCALE_SEARCH, boxsize=BOXSIZE):
+    r""" Network inputs of same-shape images, one (N,h,w,3) batch per scale. """
+    shape = np.array(images[0].shape[:2])
+    multiplier = [x * boxsize / shape[0] for x in scale_search]
+    for scale in multiplier:
+        new_size = (shape * scale).astype(np.int32)
+        yield np.stack([resize(img, new_size, order=3, preserve_range=True) for img in images]) / 255 - 0.5
+
+
+def estimate_maps(estimator, images, scale_search=SCALE_SEARCH, boxsize=BOXSIZE):
+    r""" Multi-scale heatmaps and PAFs of a list of same-shape BGR images, one predict call per scale.
+    Returns:
+        (np.ndarray, np.ndarray): (N,H,W,19) averaged heatmaps, (N,H,W,38) summed PAFs
+    """
+    shape = images[0].shape[:2]
+    heatmap_avg = np.zeros((len(images),) + shape + (19,))
+    paf_avg = np.zeros((len(images),) + shape + (38,))
+    for batch in scaled_inputs(images, scale_search, boxsize):
+        paf, heatmap = estimator.predict(batch)
+        heatmap_avg += resize_maps(heatmap, shape)
+        paf_avg += resize_maps(paf, shape)
+    heatmap_avg /= len(scale_search)
+    return heatmap_avg, paf_avg
+
+
+def _compute_cordinates(maps):
+    return compute_cordinates(*maps)
+
+
+def _shape_batches(input_folder, names, batch_size):
+    # consecutive images of the same shape are predicted together
+    batch_names, batch_images = [], []
+    for name in names:
+        img = load_bgr(os.path.join(input_folder, name))
+        if len(batch_images) == batch_size or (batch_images and img.shape != batch_images[0].shape):
+            yield batch_names, batch_images
+            batch_names, batch_images = [], []
+        batch_names.append(name)
+        batch_images.append(img)
+    if batch_images:
+        yield batch_names, batch_images
+
+
+def compute_folder_cordinates(estimator, input_folder, output_path, batch_size=32, workers=4,
+                              scale_search=SCALE_SEARCH, boxsize=BOXSIZE):
+    r""" Keypoints of every image of input_folder appended to the output_path csv.
+    Images already listed in output_path are skipped, so an interrupted run can be resumed.
+    compute_cordinates of a batch runs in a process pool while the next batch is on the estimator.
+    """
+    img_list = os.listdir(input_folder)
+
+    if os.path.exists(output_path):
+        processed_names = set(pd.read_csv(output_path, sep=':')['name'])
+        result_file = open(output_path, 'a')
+    else:
+        result_file = open(output_path, 'w')
+        processed_names = set()
+        result_file.writelines('name:keypoints_y:keypoints_x\n')
+
+    names = [name for name in img_list if name not in processed_names]
+    pool = Pool(workers) if workers > 0 else None
+
+    def write(batch_names, pose_cords_list):
+        for image_name, pose_cords in zip(batch_names, pose_cords_list):
+            result_file.writelines("%s: %s: %s\n" % (image_name, str(list(pose_cords[:, 0])), str(list(pose_cords[:, 1]))))
+        result_file.flush()
+
+    pending = None
+    with tqdm(total=len(names)) as progress:
+        for batch_names, batch_images in _shape_batches(input_folder, names, batch_size):
+            heatmap_avg, paf_avg = estimate_maps(estimator, batch_images, scale_search, boxsize)
+            if pending is not None:
+                write(pending[0], pending[1].get())
+                progress.update(len(pending[0]))
+            maps = list(zip(heatmap_avg, paf_avg))
+            if pool is not None:
+                pending = (batch_names, pool.map_async(_compute_cordinates, maps))
+            else:
+                write(batch_names, [_compute_cordinates(m) for m in maps])
+                progress.update(len(batch_names))
+        if pending is not None:
+            write(pending[0], pending[1].get())
+            progress.update(len(pending[0]))
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    result_file.close()
+
+
+def compute_cordinates_single(estimator, oriImg, scale_search=SCALE_SEARCH, boxsize=BOXSIZE):
+    # per image loop of the original scripts, kept for check_parity
+    multiplier = [x * boxsize / oriImg.shape[0] for x in scale_search]
+
+    heatmap_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 19))
+    paf_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 38))
+
+    for m in range(len(multiplier)):
+        scale = multiplier[m]
+
+        new_size = (np.array(oriImg.shape[:2]) * scale).astype(np.int32)
+        imageToTest = resize(oriImg, new_size, order=3, preserve_range=True)
+        imageToTest_padded = imageToTest[np.newaxis, :, :, :]/255 - 0.5
+
+        output1, output2 = estimator.predict(imageToTest_padded)
+
+        heatmap = resize(output2[0], oriImg.shape[:2], preserve_range=True, order=1)
+        paf = resize(output1[0], oriImg.shape[:2], preserve_range=True, order=1)
+        heatmap_avg += heatmap
+        paf_avg += paf
+
+    heatmap_avg /= len(multiplier)
+    return heatmap_avg, paf_avg
+
+
+def check_parity(n_images=8, img_size=(128, 64), seed=0):
+    r""" Compare the batched maps with the per image loop on a FakeEstimator,
+    return the max absolute difference of the heatmaps and PAFs.
+    """
+    rng = np.random.RandomState(seed)
+    images = [rng.randint(0, 256, img_size + (3,)).astype(np.uint8) for _ in range(n_images)]
+    estimator = FakeEstimator()
+    heatmaps, pafs = estimate_maps(estimator, images)
+    diff = 0
+    for img, heatmap, paf in zip(images, heatmaps, pafs):
+        expected_heatmap, expected_paf = compute_cordinates_single(estimator, img)
+        diff = max(diff, np.abs(heatmap - expected_heatmap).max(), np.abs(paf - expected_paf).max())
+    return diff
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Check the batched multi-scale maps against the per image loop")
+    parser.add_argument("--n_images", default=8, type=int, help='number of random images')
+    args = parser.parse_args()
+
+    for img_size in [(128, 64), (256, 176)]:
+        diff = check_parity(args.n_images, img_size)
+        print('%s max abs diff %g' % (str(img_size), diff))
+        assert diff < 1e-10, 'batched maps do not match the per image loop'
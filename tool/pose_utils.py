@@ -1,6 +1,5 @@
 import numpy as np
 from scipy.ndimage.filters import gaussian_filter
-from skimage.draw import circle, line_aa, polygon
 import json
 
 import matplotlib
@@ -9,8 +8,13 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from collections import defaultdict
 import skimage.measure, skimage.transform
+import os
 import sys
 
+# repo root, wherever the process runs from
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util.rasterize import draw_poses, polygon_masks, circle_masks
+
 LIMB_SEQ = [[1,2], [1,5], [2,3], [3,4], [5,6], [6,7], [1,8], [8,9],
            [9,10], [1,11], [11,12], [12,13], [1,0], [0,14], [14,16],
            [0,15], [15,17], [2,16], [5,17]]
@@ -102,27 +106,7 @@ def make_limb_masks(limbs, joints, img_width, img_height):
     return mask
 
 def draw_pose_from_cords(pose_joints, img_size, radius=2, draw_joints=True):
-    colors = np.zeros(shape=img_size + (3, ), dtype=np.uint8)
-    mask = np.zeros(shape=img_size, dtype=bool)
-
-    if draw_joints:
-        for f, t in LIMB_SEQ:
-            from_missing = pose_joints[f][0] == MISSING_VALUE or pose_joints[f][1] == MISSING_VALUE
-            to_missing = pose_joints[t][0] == MISSING_VALUE or pose_joints[t][1] == MISSING_VALUE
-            if from_missing or to_missing:
-                continue
-            yy, xx, val = line_aa(pose_joints[f][0], pose_joints[f][1], pose_joints[t][0], pose_joints[t][1])
-            colors[yy, xx] = np.expand_dims(val, 1) * 255
-            mask[yy, xx] = True
-
-    for i, joint in enumerate(pose_joints):
-        if pose_joints[i][0] == MISSING_VALUE or pose_joints[i][1] == MISSING_VALUE:
-            continue
-        yy, xx = circle(joint[0], joint[1], radius=radius, shape=img_size)
-        colors[yy, xx] = COLORS[i]
-        mask[yy, xx] = True
-
-    return colors, mask
+    return draw_poses(pose_joints, img_size, LIMB_SEQ, COLORS, radius, draw_joints, MISSING_VALUE)
 
 
 def draw_pose_from_map(pose_map, threshold=0.1, **kwargs):
@@ -147,42 +131,43 @@ def draw_legend():
     handles = [mpatches.Patch(color=np.array(color) / 255.0, label=name) for color, name in zip(COLORS, LABELS)]
     plt.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
 
-def produce_ma_mask(kp_array, img_size, point_radius=4):
-    from skimage.morphology import dilation, erosion, square
-    mask = np.zeros(shape=img_size, dtype=bool)
-    limbs = [[2,3], [2,6], [3,4], [4,5], [6,7], [7,8], [2,9], [9,10],
-              [10,11], [2,12], [12,13], [13,14], [2,1], [1,15], [15,17],
-               [1,16], [16,18], [2,17], [2,18], [9,12], [12,6], [9,3], [17,18]]
-    limbs = np.array(limbs) - 1
-    for f, t in limbs:
-        from_missing = kp_array[f][0] == MISSING_VALUE or kp_array[f][1] == MISSING_VALUE
-        to_missing = kp_array[t][0] == MISSING_VALUE or kp_array[t][1] == MISSING_VALUE
-        if from_missing or to_missing:
-            continue
-
-        norm_vec = kp_array[f] - kp_array[t]
-        norm_vec = np.array([-norm_vec[1], norm_vec[0]])
-        norm_vec = point_radius * norm_vec / np.linalg.norm(norm_vec)
+MA_MASK_LIMBS = np.array([[2,3], [2,6], [3,4], [4,5], [6,7], [7,8], [2,9], [9,10],
+                          [10,11], [2,12], [12,13], [13,14], [2,1], [1,15], [15,17],
+                          [1,16], [16,18], [2,17], [2,18], [9,12], [12,6], [9,3], [17,18]]) - 1
+
+
+def produce_ma_masks(kp_arrays, img_size, point_radius=4, chunk_size=64):
+    # batched produce_ma_mask: (n, 18, 2) keypoints --> (n, h, w) bool masks
+    from scipy.ndimage import grey_dilation, grey_erosion
+    kp_arrays = np.asarray(kp_arrays)
+    img_size = tuple(img_size)
+    masks = np.zeros((len(kp_arrays),) + img_size, dtype=bool)
+    for start in range(0, len(kp_arrays), chunk_size):
+        kp = kp_arrays[start:start + chunk_size]
+        kp_missing = np.logical_or(kp[..., 0] == MISSING_VALUE, kp[..., 1] == MISSING_VALUE)
+
+        fr = kp[:, MA_MASK_LIMBS[:, 0]]
+        to = kp[:, MA_MASK_LIMBS[:, 1]]
+        limb_valid = ~np.logical_or(kp_missing[:, MA_MASK_LIMBS[:, 0]], kp_missing[:, MA_MASK_LIMBS[:, 1]])
+
+        norm_vec = fr - to
+        norm_vec = np.stack([-norm_vec[..., 1], norm_vec[..., 0]], axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            norm_vec = point_radius * norm_vec / np.linalg.norm(norm_vec, axis=-1, keepdims=True)
+        vetexes = np.stack([fr + norm_vec, fr - norm_vec, to - norm_vec, to + norm_vec], axis=-2)
+
+        limbs = polygon_masks(vetexes, img_size) & limb_valid[..., np.newaxis, np.newaxis]
+        joints = circle_masks(kp, point_radius, img_size) & ~kp_missing[..., np.newaxis, np.newaxis]
+        masks[start:start + len(kp)] = np.logical_or(limbs.any(axis=1), joints.any(axis=1))
+
+    # 5x5 closing, one image at a time along the first axis
+    footprint = np.ones((1, 5, 5), dtype=bool)
+    masks = grey_dilation(masks, footprint=footprint)
+    masks = grey_erosion(masks, footprint=footprint)
+    return masks
 
-
-        vetexes = np.array([
-            kp_array[f] + norm_vec,
-            kp_array[f] - norm_vec,
-            kp_array[t] - norm_vec,
-            kp_array[t] + norm_vec
-        ])
-        yy, xx = polygon(vetexes[:, 0], vetexes[:, 1], shape=img_size)
-        mask[yy, xx] = True
-
-    for i, joint in enumerate(kp_array):
-        if kp_array[i][0] == MISSING_VALUE or kp_array[i][1] == MISSING_VALUE:
-            continue
-        yy, xx = circle(joint[0], joint[1], radius=point_radius, shape=img_size)
-        mask[yy, xx] = True
-
-    mask = dilation(mask, square(5))
-    mask = erosion(mask, square(5))
-    return mask
+def produce_ma_mask(kp_array, img_size, point_radius=4):
+    return produce_ma_masks(np.asarray(kp_array)[np.newaxis], img_size, point_radius=point_radius)[0]
 
 def make_gaussian_map(img_width, img_height, center, var_x, var_y, theta):
     yv, xv = np.meshgrid(np.array(range(img_width)), np.array(range(img_height)),
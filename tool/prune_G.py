@@ -0,0 +1,196 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+sys.path.append('.')
+from models.inference import optimize_generator
+from models.networks import save_widths
+from tool.benchmark_G import DATASETS, build_G, conv_flops, random_inputs
+from tool.optimize_G import add_generator_arguments, load_G_from_args, seconds_per_image
+from tool.quantize_G import PAIRS, key_dataset, pair_batches, random_batches, scores
+
+
+def _layers(sequential, types):
+    return [m for m in sequential if isinstance(m, types)]
+
+
+def conv_norms(model):
+    r""" (conv, norm or None, input group, output group) of every convolution of a PATNModel. Channel groups are
+    pruned together: 'trunk' is shared by the residual stream 1, the gates and both halves of the concatenated
+    stream 2; 'input', 'pose' and 'output' are never pruned.
+    """
+    norm_types = (nn.BatchNorm2d, nn.InstanceNorm2d)
+    n_down = len(model.widths['stream1_up'])
+    layers = []
+    for stream, input_group in [('stream1_down', 'input'), ('stream2_down', 'pose')]:
+        convs, norms = _layers(getattr(model, stream), nn.Conv2d), _layers(getattr(model, stream), norm_types)
+        groups = [input_group] + [(stream, i) for i in range(n_down + 1)]
+        if stream == 'stream1_down':
+            groups[-1] = 'trunk'
+        layers += [(conv, norm, groups[i], groups[i + 1]) for i, (conv, norm) in enumerate(zip(convs, norms))]
+    for b, block in enumerate(model.att):
+        convs = _layers(block.conv_block_stream1, nn.Conv2d)
+        norms = _layers(block.conv_block_stream1, norm_types)
+        layers += [(convs[0], norms[0], 'trunk', ('stream1', b)), (convs[1], norms[1], ('stream1', b), 'trunk')]
+        convs = _layers(block.conv_block_stream2, nn.Conv2d)
+        norms = _layers(block.conv_block_stream2, norm_types)
+        stream2_in = ('stream2_down', n_down) if b == 0 else 'stream2_cat'
+        layers += [(convs[0], norms[0], stream2_in, ('stream2', b)), (convs[1], None, ('stream2', b), 'trunk')]
+    convs = _layers(model.stream1_up, (nn.Conv2d, nn.ConvTranspose2d))
+    norms = _layers(model.stream1_up, norm_types) + [None]
+    groups = ['trunk'] + [('stream1_up', i) for i in range(n_down)] + ['output']
+    layers += [(conv, norm, groups[i], groups[i + 1]) for i, (conv, norm) in enumerate(zip(convs, norms))]
+    return layers
+
+
+def _out_weight(conv):
+    # output channels first
+    return conv.weight.transpose(0, 1) if isinstance(conv, nn.ConvTranspose2d) else conv.weight
+
+
+def channel_scores(model):
+    r""" Importance of the output channels of every prunable group: the BatchNorm scale |gamma| of a convolution
+    followed by an affine BatchNorm, the L1 norm of its filters otherwise. Each producer's scores are normalized
+    to a mean of 1 and summed over the producers of a group.
+    """
+    scores = {}
+    with torch.no_grad():
+        for conv, norm, _, group in conv_norms(model):
+            if group == 'output':
+                continue
+            if isinstance(norm, nn.BatchNorm2d) and norm.affine:
+                score = norm.weight.abs()
+            else:
+                score = _out_weight(conv).abs().flatten(1).sum(1)
+            score = score.double() / score.double().mean().clamp(min=1e-12)
+            scores[group] = scores.get(group, 0) + score
+    return scores
+
+
+def prune_indices(model, ratio, divisor=8):
+    r""" Kept channels of every group: the (1 - ratio) highest scores, rounded to a multiple of divisor. """
+    keep = {}
+    for group, score in channel_scores(model).items():
+        n = score.numel()
+        k = min(n, max(divisor, int(round(n * (1 - ratio) / divisor)) * divisor)) if n > divisor else n
+        keep[group] = score.topk(k).indices.sort().values
+    trunk = model.widths['trunk']
+    keep['stream2_cat'] = torch.cat((keep['trunk'], keep['trunk'] + trunk))
+    return keep
+
+
+def pruned_widths(model, keep):
+    n_down = len(model.widths['stream1_up'])
+    return dict(stream1_down=[len(keep[('stream1_down', i)]) for i in range(n_down)],
+                stream2_down=[len(keep[('stream2_down', i)]) for i in range(n_down + 1)],
+                trunk=len(keep['trunk']),
+                blocks=[dict(stream1=len(keep[('stream1', b)]), stream2=len(keep[('stream2', b)]))
+                        for b in range(len(model.att))],
+                stream1_up=[len(keep[('stream1_up', i)]) for i in range(n_down)])
+
+
+def copy_pruned(model, pruned, keep):
+    r""" Weights of model's kept channels into pruned, a PATNModel of the pruned widths. """
+    with torch.no_grad():
+        for (conv, norm, group_in, group_out), (new_conv, new_norm, _, _) in zip(conv_norms(model), conv_norms(pruned)):
+            # weights are (out, in, k, k), (in, out, k, k) for transposed convolutions
+            dim_out, dim_in = (1, 0) if isinstance(conv, nn.ConvTranspose2d) else (0, 1)
+            idx_in = keep.get(group_in, torch.arange(conv.weight.size(dim_in)))
+            idx_out = keep.get(group_out, torch.arange(conv.weight.size(dim_out)))
+            new_conv.weight.copy_(conv.weight.index_select(dim_out, idx_out).index_select(dim_in, idx_in))
+            if conv.bias is not None:
+                new_conv.bias.copy_(conv.bias[idx_out])
+            if norm is not None:
+                for name, tensor in list(norm.named_parameters()) + list(norm.named_buffers()):
+                    if tensor.dim() == 1:
+                        getattr(new_norm, name).copy_(tensor[idx_out])
+                    else:
+                        getattr(new_norm, name).copy_(tensor)
+
+
+def prune_G(netG, ratio, divisor=8, **kwargs):
+    r""" PATN generator with the (ratio) least important channels of every group removed.
+    Args:
+        kwargs: define_G options of netG (ngf, n_blocks, norm, use_dropout, n_downsampling)
+    Returns:
+        (PATNetwork, dict): pruned generator, its width config
+    """
+    keep = prune_indices(netG.model, ratio, divisor)
+    widths = pruned_widths(netG.model, keep)
+    pruned = build_G('PATN', widths=widths, **kwargs)
+    copy_pruned(netG.model, pruned.model, keep)
+    return pruned.train(netG.training), widths
+
+
+def check_pruning(netG, **kwargs):
+    r""" Largest output difference of a generator 'pruned' with ratio 0, that keeps every channel. """
+    pruned, _ = prune_G(netG, 0., **kwargs)
+    inputs = random_inputs(2, (64, 32))
+    with torch.no_grad():
+        return (netG(inputs) - pruned(inputs)).abs().max().item()
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Structured channel pruning of a PATN generator, with a FLOPs / latency / "
+                                        "pSSIM report per pruning level")
+    add_generator_arguments(parser)
+    parser.add_argument("--ratios", default=[0.25, 0.5, 0.75], type=float, nargs='+',
+                        help='Fractions of the channels removed from every group, 0 reports the generator as it is')
+    parser.add_argument("--divisor", default=8, type=int, help='Kept channels are a multiple of it')
+    parser.add_argument("--save_dir", default='', help='Checkpoints dir of the fine-tuning experiments, one '
+                        '<name>_p<percent> experiment per level with the discriminators of --checkpoint')
+    parser.add_argument("--name", default='pruned')
+    parser.add_argument("--dataroot", default='./datasets/')
+    parser.add_argument("--calibration", default='dataset', choices=['dataset', 'random'],
+                        help='Score KeyDataset test pairs, or random inputs (no dataset needed)')
+    parser.add_argument("--n_eval", default=256, type=int, help='Test pairs scored')
+    parser.add_argument("--batch_size", default=8, type=int)
+    parser.add_argument("--n_iter", default=20, type=int, help='Timed passes per generator')
+    args = parser.parse_args()
+    assert args.which_model_netG == 'PATN', 'only PATN generators can be pruned'
+
+    netG = load_G_from_args(args)
+    kwargs = dict(ngf=args.ngf, n_blocks=args.n_blocks, norm=args.norm, use_dropout=args.dropout,
+                  n_downsampling=args.n_downsampling)
+    print('pruning with ratio 0 max difference: %g' % check_pruning(netG, **kwargs))
+    image_size = DATASETS[args.dataset]['image_size']
+    if args.calibration == 'dataset':
+        dataset = key_dataset(args.dataroot, **PAIRS[args.dataset])
+        evaluation = np.arange(min(args.n_eval, len(dataset)))
+        batches = lambda: pair_batches(dataset, evaluation, args.batch_size)
+    else:
+        batches = lambda: random_batches(-(-args.n_eval // args.batch_size), args.batch_size, image_size)
+
+    inputs = random_inputs(1, image_size)
+    print('%-8s %10s %10s %10s %8s %8s' % ('pruned', 'params M', 'GFLOPs', 'ms/image', 'SSIM', 'pSSIM'))
+    for ratio in args.ratios:
+        pruned, widths = prune_G(netG, ratio, args.divisor, **kwargs) if ratio > 0 else (netG, netG.model.widths)
+        generator = optimize_generator(pruned)
+        torch.manual_seed(0)
+        result = scores([generator], batches())[0]
+        print('%-8s %10.2f %10.2f %10.2f %8.4f %8.4f' % (
+            '%d%%' % round(ratio * 100), sum(p.numel() for p in pruned.parameters()) / 1e6,
+            conv_flops(pruned, inputs) / 1e9, seconds_per_image(generator, inputs, args.n_iter) * 1000,
+            result['SSIM'], result['pSSIM']))
+
+        if args.save_dir and ratio > 0:
+            name = '%s_p%d' % (args.name, round(ratio * 100))
+            expr_dir = os.path.join(args.save_dir, name)
+            if not os.path.exists(expr_dir):
+                os.makedirs(expr_dir)
+            torch.save(pruned.state_dict(), os.path.join(expr_dir, 'latest_net_netG.pth'))
+            save_widths(widths, os.path.join(expr_dir, 'G_widths.json'))
+            for D in ['netD_PB', 'netD_PP']:
+                path = args.checkpoint.replace('_net_netG.pth', '_net_%s.pth' % D)
+                if args.checkpoint and os.path.exists(path):
+                    shutil.copy(path, os.path.join(expr_dir, 'latest_net_%s.pth' % D))
+            print('  fine-tune: python train.py --checkpoints_dir %s --name %s --continue_train --which_epoch latest '
+                  '--G_widths %s --ngf %d --n_blocks %d --norm %s%s' % (
+                      args.save_dir, name, os.path.join(expr_dir, 'G_widths.json'), args.ngf, args.n_blocks,
+                      args.norm, '' if args.dropout else ' --no_dropout'))
@@ -0,0 +1,116 @@
+import os
+import sys
+from argparse import Namespace
+
+import numpy as np
+import torch
+
+sys.path.append('.')
+from data.keypoint import KeyDataset
+from losses.pytorch_msssim import FPart_BSSIM
+from models.inference import export_generator, optimize_generator, quantize_generator
+from tool.benchmark_G import DATASETS, random_inputs
+from tool.optimize_G import add_generator_arguments, load_G_from_args, seconds_per_image
+from tool.ssim_metrics import ssim_score_list
+
+# test pairs of the datasets, as the test options define them
+PAIRS = {
+    'market': dict(dataset='market_data', pairLst='market-pairs-test.csv', annoLst='market-annotation-test.csv'),
+    'fashion': dict(dataset='fashion_data', pairLst='fasion-resize-pairs-test.csv',
+                    annoLst='fasion-resize-annotation-test.csv'),
+}
+
+
+def key_dataset(dataroot, dataset, pairLst, annoLst, phase='test'):
+    r""" KeyDataset of the test pairs, without random crops or flips. """
+    dataset_ = KeyDataset()
+    dataset_.initialize(Namespace(dataroot=dataroot, dataset=dataset, phase=phase, pairLst=pairLst, annoLst=annoLst,
+                                  resize_or_crop='no'))
+    return dataset_
+
+
+def pair_batches(dataset, indexes, batch_size):
+    r""" Batches of the pairs at indexes: ((image, pose) generator inputs, target image, target limb masks). """
+    loader = torch.utils.data.DataLoader(torch.utils.data.Subset(dataset, indexes), batch_size=batch_size)
+    for data in loader:
+        yield (data['P1'], torch.cat((data['BP1'], data['BP2']), 1)), data['P2'], data['BP2_mask']
+
+
+def random_batches(n_batches, batch_size, image_size, n_limbs=11):
+    r""" Random pairs of the same shapes, for runs without the dataset. """
+    for _ in range(n_batches):
+        inputs = random_inputs(batch_size, image_size)
+        yield inputs, torch.rand_like(inputs[0]) * 2 - 1, torch.rand(batch_size, n_limbs, *image_size)
+
+
+def to_uint8(images):
+    # [-1, 1] (N,C,H,W) --> list of h,w,c uint8 arrays, as util.tensor2im saves them
+    return list(((images.permute(0, 2, 3, 1).cpu().float().numpy() + 1) / 2.0 * 255.0).astype(np.uint8))
+
+
+def scores(generators, batches):
+    r""" Mean SSIM (tool/ssim_metrics on the saved uint8 images) and pSSIM (FPart_BSSIM as in tool/getPartSSIM)
+    of every generator against the targets, and the SSIM of every generator against the first one.
+    """
+    criterion = FPart_BSSIM(data_range=1.0, size_average=False, win_size=7, win_sigma=0.8)
+    results = [dict(SSIM=[], pSSIM=[], SSIM_vs_fp32=[]) for _ in generators]
+    with torch.no_grad():
+        for inputs, target, mask in batches:
+            outputs = [generator(*inputs).float().clamp(-1, 1) for generator in generators]
+            for result, output in zip(results, outputs):
+                result['SSIM'].append(ssim_score_list(to_uint8(output), to_uint8(target), device='cpu'))
+                result['pSSIM'].append(criterion(output, target, mask).numpy())
+                result['SSIM_vs_fp32'].append(ssim_score_list(to_uint8(output), to_uint8(outputs[0]), device='cpu'))
+    return [{k: float(np.mean(np.concatenate(v))) for k, v in result.items()} for result in results]
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Post-training int8 quantization of a PATN generator for cpu inference")
+    add_generator_arguments(parser)
+    parser.add_argument("--dataroot", default='./datasets/')
+    parser.add_argument("--calibration", default='dataset', choices=['dataset', 'random'],
+                        help='Calibrate and score on KeyDataset test pairs, or on random inputs (no dataset needed)')
+    parser.add_argument("--n_calibration", default=128, type=int, help='Pairs observed for calibration')
+    parser.add_argument("--n_eval", default=256, type=int, help='Other pairs scored against the fp32 generator')
+    parser.add_argument("--batch_size", default=8, type=int)
+    parser.add_argument("--backend", default='x86', choices=['x86', 'fbgemm', 'qnnpack', 'onednn'])
+    parser.add_argument("--n_iter", default=20, type=int, help='Timed passes per generator')
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--output", default='', help='Where to save the int8 TorchScript module, for test.py '
+                        '--backend torchscript')
+    args = parser.parse_args()
+    assert args.which_model_netG == 'PATN', 'only PATN generators can be traced for FX quantization'
+
+    torch.manual_seed(args.seed)
+    image_size = DATASETS[args.dataset]['image_size']
+    if args.calibration == 'dataset':
+        dataset = key_dataset(args.dataroot, **PAIRS[args.dataset])
+        order = np.random.RandomState(args.seed).permutation(len(dataset))
+        calibration = order[:args.n_calibration]
+        evaluation = order[args.n_calibration:args.n_calibration + args.n_eval]
+        batches = lambda indexes: pair_batches(dataset, indexes, args.batch_size)
+    else:
+        calibration = -(-args.n_calibration // args.batch_size)
+        evaluation = -(-args.n_eval // args.batch_size)
+        batches = lambda n_batches: random_batches(n_batches, args.batch_size, image_size)
+
+    netG = load_G_from_args(args)
+    fp32 = optimize_generator(netG)
+    int8 = quantize_generator(fp32, (inputs for inputs, _, _ in batches(calibration)), args.backend)
+
+    results = scores([fp32, int8], batches(evaluation))
+    inputs = random_inputs(1, image_size)
+    print('%-6s %8s %8s %14s %10s' % ('', 'SSIM', 'pSSIM', 'SSIM vs fp32', 'ms/image'))
+    for name, generator, result in [('fp32', fp32, results[0]), ('int8', int8, results[1])]:
+        print('%-6s %8.4f %8.4f %14.4f %10.2f' % (name, result['SSIM'], result['pSSIM'], result['SSIM_vs_fp32'],
+                                                  seconds_per_image(generator, inputs, args.n_iter) * 1000))
+    print('delta  %8.4f %8.4f' % (results[1]['SSIM'] - results[0]['SSIM'], results[1]['pSSIM'] - results[0]['pSSIM']))
+
+    if args.output:
+        if os.path.dirname(args.output) and not os.path.exists(os.path.dirname(args.output)):
+            os.makedirs(os.path.dirname(args.output))
+        export_generator(int8, inputs, args.output, 'torchscript', which_model_netG=args.which_model_netG,
+                         quantized=args.backend, checkpoint=os.path.abspath(args.checkpoint) if args.checkpoint else '')
+        print('saved %s' % args.output)
@@ -0,0 +1,175 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def _gaussian_win(sigma, truncate=3.5, dtype=torch.float64):
+    r"""1-D gaussian kernel with the same support and weights as
+    scipy.ndimage.gaussian_filter, which compare_ssim uses internally.
+    """
+    radius = int(truncate * float(sigma) + 0.5)
+    coords = torch.arange(-radius, radius + 1, dtype=dtype)
+    g = torch.exp(-0.5 * (coords / sigma) ** 2)
+    g /= g.sum()
+    return g
+
+
+def _symmetric_index(n, pad):
+    # scipy 'reflect' mode: d c b a | a b c d | d c b a
+    idx = np.arange(-pad, n + pad)
+    period = 2 * n
+    idx = np.mod(idx, period)
+    idx = np.where(idx >= n, period - 1 - idx, idx)
+    return torch.from_numpy(idx)
+
+
+def _filter(input, win, crop):
+    r""" Separable gaussian filtering of (N,C,H,W) maps, cropped by `crop` pixels on every side.
+    Pixels inside the crop never see the image border when the kernel radius is <= crop,
+    so no padding is needed in that case.
+    """
+    C = input.shape[1]
+    radius = (win.numel() - 1) // 2
+    if radius > crop:
+        pad = radius - crop
+        input = input.index_select(2, _symmetric_index(input.shape[2], pad).to(input.device))
+        input = input.index_select(3, _symmetric_index(input.shape[3], pad).to(input.device))
+        crop = radius
+    win = win.to(input.device, dtype=input.dtype)
+    win_h = win.view(1, 1, -1, 1).repeat(C, 1, 1, 1)
+    win_w = win.view(1, 1, 1, -1).repeat(C, 1, 1, 1)
+    out = F.conv2d(input, win_h, groups=C)
+    out = F.conv2d(out, win_w, groups=C)
+    extra = crop - radius
+    if extra > 0:
+        out = out[:, :, extra:-extra, extra:-extra]
+    return out
+
+
+def ssim_batch(X, Y, data_range, win_size=11, sigma=1.5, K=(0.01, 0.03), use_sample_covariance=False):
+    r""" Batched equivalent of skimage.measure.compare_ssim(X[i], Y[i], gaussian_weights=True,
+    multichannel=True, data_range=data_range[i])
+    Args:
+        X (torch.Tensor): a batch of images, (N,C,H,W)
+        Y (torch.Tensor): a batch of images, (N,C,H,W)
+        data_range (torch.Tensor or float): per image value range, (N,) or scalar
+        win_size (int, optional): size of the border ignored by compare_ssim, (win_size-1)//2 on each side
+        sigma (float, optional): sigma of the gaussian weights
+        K (list or tuple, optional): scalar constants (K1, K2)
+        use_sample_covariance (bool, optional): normalize covariances by NP/(NP-1) as compare_ssim does
+
+    Returns:
+        torch.Tensor: mean ssim of every image, (N,)
+    """
+    if not X.shape == Y.shape:
+        raise ValueError('Input images must have the same dimensions.')
+    N, C, H, W = X.shape
+    K1, K2 = K
+    crop = (win_size - 1) // 2
+
+    # compare_ssim filters every channel of a multichannel image as a 2-D image
+    NP = win_size ** 2
+    cov_norm = NP / (NP - 1) if use_sample_covariance else 1.0
+
+    if not torch.is_tensor(data_range):
+        data_range = torch.tensor(data_range, dtype=X.dtype)
+    R = data_range.to(X.device, dtype=X.dtype).reshape(-1, 1, 1, 1)
+    C1 = (K1 * R) ** 2
+    C2 = (K2 * R) ** 2
+
+    # filter the five statistics maps with one grouped convolution
+    maps = torch.cat((X, Y, X * X, Y * Y, X * Y), 1)
+    maps = _filter(maps, _gaussian_win(sigma, dtype=X.dtype), crop)
+    ux, uy, uxx, uyy, uxy = torch.split(maps, C, 1)
+
+    vx = cov_norm * (uxx - ux * ux)
+    vy = cov_norm * (uyy - uy * uy)
+    vxy = cov_norm * (uxy - ux * uy)
+
+    A1, A2, B1, B2 = (2 * ux * uy + C1,
+                      2 * vxy + C2,
+                      ux ** 2 + uy ** 2 + C1,
+                      vx + vy + C2)
+    S = (A1 * A2) / (B1 * B2)
+
+    return S.reshape(N, -1).mean(1)
+
+
+def _to_tensor(images, device, dtype):
+    # list of h,w,c arrays --> n,c,h,w tensor
+    batch = torch.from_numpy(np.stack(images, 0))
+    return batch.to(device).to(dtype).permute(0, 3, 1, 2)
+
+
+def ssim_score_list(generated_images, reference_images, batch_size=256, device=None, dtype=torch.float64,
+                    use_sample_covariance=False):
+    r""" Per image SSIM as computed by metrics_ssim_*.ssim_score, evaluated in chunks of batch_size images.
+    Every chunk runs as one batched computation on `device` (multithreaded on cpu, or gpu).
+    data_range is taken from each generated image, as in the original per image loop.
+    """
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    scores = []
+    with torch.no_grad():
+        for i in range(0, len(generated_images), batch_size):
+            gen = _to_tensor(generated_images[i:i + batch_size], device, dtype)
+            ref = _to_tensor(reference_images[i:i + batch_size], device, dtype)
+            flat = gen.reshape(gen.shape[0], -1)
+            data_range = flat.max(1)[0] - flat.min(1)[0]
+            ssim = ssim_batch(ref, gen, data_range, sigma=1.5, use_sample_covariance=use_sample_covariance)
+            scores.append(ssim.cpu().numpy())
+    if len(scores) == 0:
+        return np.zeros(0)
+    return np.concatenate(scores, 0)
+
+
+def ssim_score(generated_images, reference_images, batch_size=256, device=None):
+    return np.mean(ssim_score_list(generated_images, reference_images, batch_size=batch_size, device=device))
+
+
+def check_parity(n_images=16, img_size=(128, 64), seed=0, use_sample_covariance=False):
+    r""" Compare ssim_score_list with skimage on random uint8 images, return the max absolute difference.
+    """
+    try:
+        from skimage.measure import compare_ssim
+
+        def reference_ssim(ref, gen):
+            return compare_ssim(ref, gen, gaussian_weights=True, sigma=1.5,
+                                use_sample_covariance=use_sample_covariance, multichannel=True,
+                                data_range=gen.max() - gen.min())
+    except ImportError:
+        from skimage.metrics import structural_similarity
+
+        def reference_ssim(ref, gen):
+            return structural_similarity(ref, gen, gaussian_weights=True, sigma=1.5,
+                                         use_sample_covariance=use_sample_covariance, channel_axis=-1,
+                                         data_range=gen.max() - gen.min())
+
+    rng = np.random.RandomState(seed)
+    reference_images = [rng.randint(0, 256, img_size + (3,)).astype(np.uint8) for _ in range(n_images)]
+    # correlated generated images, some with a reduced value range
+    generated_images = []
+    for i, ref in enumerate(reference_images):
+        noise = rng.randint(-40, 41, ref.shape)
+        gen = np.clip(ref.astype(int) + noise, 0, 255)
+        if i % 2:
+            gen = gen // 2 + 30
+        generated_images.append(gen.astype(np.uint8))
+
+    expected = np.array([reference_ssim(ref, gen) for ref, gen in zip(reference_images, generated_images)])
+    actual = ssim_score_list(generated_images, reference_images, batch_size=5, device='cpu',
+                             use_sample_covariance=use_sample_covariance)
+    return np.abs(expected - actual).max()
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Check the batched SSIM against skimage")
+    parser.add_argument("--n_images", default=16, type=int, help='number of random image pairs')
+    args = parser.parse_args()
+
+    for sample_cov in [False, True]:
+        diff = check_parity(args.n_images, use_sample_covariance=sample_cov)
+        print('use_sample_covariance=%s max abs diff %g' % (sample_cov, diff))
+        assert diff < 1e-8, 'batched SSIM does not match skimage'
@@ -2,18 +2,29 @@ import time
 from options.train_options import TrainOptions
 from data.data_loader import CreateDataLoader
 from models.models import create_model
-from util.visualizer import Visualizer
+from util.visualizer import Visualizer, AsyncVisualizer
 
 opt = TrainOptions().parse()
+# the background visualizer is forked before any data loader worker or CUDA context exists
+if opt.sync_display:
+    visualizer = Visualizer(opt)
+else:
+    visualizer = AsyncVisualizer(opt, queue_size=opt.display_queue_size)
 data_loader = CreateDataLoader(opt)
 dataset = data_loader.load_data()
 dataset_size = len(data_loader)
 print('#training images = %d' % dataset_size)
 
 model = create_model(opt)
-visualizer = Visualizer(opt)
+print('effective batch size = %d' % (opt.batchSize * opt.accum_steps))
+# counted in samples, a frequency is reached when a batch crosses one of its multiples
 total_steps = 0
 
+
+def reached(freq, n):
+    return total_steps // freq != (total_steps - n) // freq
+
+
 for epoch in range(opt.epoch_count, opt.niter + opt.niter_decay + 1):
     epoch_start_time = time.time()
     epoch_iter = 0
@@ -22,23 +33,24 @@ for epoch in range(opt.epoch_count, opt.niter + opt.niter_decay + 1):
         # print(i)
         iter_start_time = time.time()
         visualizer.reset()
-        total_steps += opt.batchSize
-        epoch_iter += opt.batchSize
+        n = data['P1'].size(0)
+        total_steps += n
+        epoch_iter += n
         model.set_input(data)
         model.optimize_parameters()
 
-        if total_steps % opt.display_freq == 0:
-            save_result = total_steps % opt.update_html_freq == 0
-            visualizer.display_current_results(model.get_current_visuals(), epoch, save_result)
+        if reached(opt.display_freq, n):
+            save_result = reached(opt.update_html_freq, n)
+            visualizer.display_current_snapshot(model.get_current_snapshot(), epoch, save_result)
 
-        if total_steps % opt.print_freq == 0:
+        if reached(opt.print_freq, n):
             errors = model.get_current_errors()
-            t = (time.time() - iter_start_time) / opt.batchSize
+            t = (time.time() - iter_start_time) / n
             visualizer.print_current_errors(epoch, epoch_iter, errors, t)
             if opt.display_id > 0:
                 visualizer.plot_current_errors(epoch, float(epoch_iter)/dataset_size, opt, errors)
 
-        if total_steps % opt.save_latest_freq == 0:
+        if reached(opt.save_latest_freq, n):
             print('saving the latest model (epoch %d, total_steps %d)' %
                   (epoch, total_steps))
             model.save('latest')
@@ -52,3 +64,5 @@ for epoch in range(opt.epoch_count, opt.niter + opt.niter_decay + 1):
     print('End of epoch %d / %d \t Time Taken: %d sec' %
           (epoch, opt.niter + opt.niter_decay, time.time() - epoch_start_time))
     model.update_learning_rate()
+
+visualizer.close()
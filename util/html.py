@@ -32,15 +32,7 @@ class HTML:
 
     def add_images(self, ims, txts, links, width=400):
         self.add_table()
-        with self.t:
-            with tr():
-                for im, txt, link in zip(ims, txts, links):
-                    with td(style="word-wrap: break-word;", halign="center", valign="top"):
-                        with p():
-                            with a(href=os.path.join('images', link)):
-                                img(style="width:%dpx" % width, src=os.path.join('images', im))
-                            br()
-                            p(txt)
+        fill_images_table(self.t, ims, txts, links, width)
 
     def save(self):
         html_file = '%s/index.html' % self.web_dir
@@ -49,6 +41,113 @@ class HTML:
         f.close()
 
 
+def fill_images_table(t, ims, txts, links, width=400):
+    with t:
+        with tr():
+            for im, txt, link in zip(ims, txts, links):
+                with td(style="word-wrap: break-word;", halign="center", valign="top"):
+                    with p():
+                        with a(href=os.path.join('images', link)):
+                            img(style="width:%dpx" % width, src=os.path.join('images', im))
+                        br()
+                        p(txt)
+    return t
+
+
+class StreamingHTML:
+    r""" Same interface as HTML, for result sets too large to hold in one document.
+    Every header starts an entry, entries are appended to page_XXXX.html files of entries_per_page
+    entries each and flushed as they come, so the pages can be browsed while they are written.
+    index.html links the pages and is rewritten when a page is opened. save() closes the last page.
+    """
+    def __init__(self, web_dir, title, reflesh=0, entries_per_page=500):
+        self.title = title
+        self.web_dir = web_dir
+        self.img_dir = os.path.join(self.web_dir, 'images')
+        self.reflesh = reflesh
+        self.entries_per_page = entries_per_page
+        if not os.path.exists(self.web_dir):
+            os.makedirs(self.web_dir)
+        if not os.path.exists(self.img_dir):
+            os.makedirs(self.img_dir)
+
+        self.pages = []  # (file name, first header) of every page
+        self.page_entries = 0
+        self.file = None
+
+    def get_image_dir(self):
+        return self.img_dir
+
+    def page_name(self, n):
+        return 'page_%04d.html' % n
+
+    def head(self, title):
+        doc = dominate.document(title=title)
+        if self.reflesh > 0:
+            with doc.head:
+                meta(http_equiv="refresh", content=str(self.reflesh))
+        # the document is streamed: everything up to the (still empty) body, closed by close_page
+        return doc.render().split('<body>')[0] + '<body>\n'
+
+    # links of page n, 'next' only once the following page is opened
+    def navigation(self, n, next=False):
+        nav = p()
+        with nav:
+            if n > 1:
+                a('previous', href=self.page_name(n - 1))
+            a('index', href='index.html')
+            if next:
+                a('next', href=self.page_name(n + 1))
+        return nav.render() + '\n'
+
+    def open_page(self, header):
+        self.close_page(last=False)
+        n = len(self.pages) + 1
+        self.pages.append((self.page_name(n), header))
+        self.file = open(os.path.join(self.web_dir, self.page_name(n)), 'wt')
+        self.file.write(self.head('%s [%d]' % (self.title, n)))
+        self.file.write(self.navigation(n))
+        self.page_entries = 0
+        self.write_index()
+
+    def close_page(self, last=True):
+        if self.file is None:
+            return
+        self.file.write(self.navigation(len(self.pages), next=not last))
+        self.file.write('</body>\n</html>')
+        self.file.close()
+        self.file = None
+
+    def write(self, html):
+        if self.file is None:
+            self.open_page('')
+        self.file.write(html + '\n')
+        self.file.flush()
+
+    def add_header(self, str):
+        if self.file is None or self.page_entries == self.entries_per_page:
+            self.open_page(str)
+        self.page_entries += 1
+        self.write(h3(str).render())
+
+    def add_images(self, ims, txts, links, width=400):
+        self.write(fill_images_table(table(border=1, style="table-layout: fixed;"), ims, txts, links, width).render())
+
+    def write_index(self):
+        index = ul()
+        with index:
+            for n, (name, header) in enumerate(self.pages):
+                with li():
+                    a('page %d' % (n + 1), href=name)
+                    span(' from %s' % header)
+        with open(os.path.join(self.web_dir, 'index.html'), 'wt') as f:
+            f.write(self.head(self.title) + h3(self.title).render() + index.render() + '\n</body>\n</html>')
+
+    def save(self):
+        self.close_page()
+        self.write_index()
+
+
 if __name__ == '__main__':
     html = HTML('web/', 'test_html')
     html.add_header('hello world')
@@ -1,34 +1,64 @@
-import random
-import numpy as np
 import torch
-from torch.autograd import Variable
 
 
 class ImagePool():
-    def __init__(self, pool_size):
+    r""" History of generated images shown to the discriminators.
+    While the pool is not full every image is stored and returned as is. Then each image is, with probability
+    0.5, swapped with a random stored image that is returned instead, or returned as is.
+
+    The pool is one preallocated (pool_size, C, H, W) tensor on the device of the images, or in pinned host
+    memory with pin_memory. A batch is handled with one gather and one scatter, with the outcome of handling
+    its images one after the other: an image swapped into a slot written earlier in the same batch gets the
+    image written there.
+    """
+    def __init__(self, pool_size, pin_memory=False):
         self.pool_size = pool_size
+        self.pin_memory = pin_memory
         if self.pool_size > 0:
             self.num_imgs = 0
-            self.images = []
+            self.images = None
+
+    def allocate(self, images):
+        shape = (self.pool_size,) + tuple(images.shape[1:])
+        # same layout as the images, channels_last batches stay channels_last
+        channels_last = images.dim() == 4 and images.is_contiguous(memory_format=torch.channels_last) \
+            and not images.is_contiguous()
+        memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        if self.pin_memory:
+            self.images = torch.empty(shape, dtype=images.dtype, memory_format=memory_format)
+            if torch.cuda.is_available():
+                self.images = self.images.pin_memory()
+        else:
+            self.images = torch.empty(shape, dtype=images.dtype, device=images.device, memory_format=memory_format)
 
     def query(self, images):
         if self.pool_size == 0:
-            return Variable(images)
-        return_images = []
-        for image in images:
-            image = torch.unsqueeze(image, 0)
-            if self.num_imgs < self.pool_size:
-                self.num_imgs = self.num_imgs + 1
-                self.images.append(image)
-                return_images.append(image)
-            else:
-                p = random.uniform(0, 1)
-                if p > 0.5:
-                    random_id = random.randint(0, self.pool_size-1)
-                    tmp = self.images[random_id].clone()
-                    self.images[random_id] = image
-                    return_images.append(tmp)
-                else:
-                    return_images.append(image)
-        return_images = Variable(torch.cat(return_images, 0))
+            return images
+        images = images.detach()
+        if self.images is None:
+            self.allocate(images)
+        device = images.device
+        n = images.size(0)
+        order = torch.arange(n, device=device)
+
+        # slot of every image: the next free ones first, then random ones for the images that are swapped
+        n_fill = min(self.pool_size - self.num_imgs, n)
+        fill = order < n_fill
+        swap = (torch.rand(n, device=device) > 0.5) & ~fill
+        slots = torch.where(fill, order + self.num_imgs, torch.randint(0, self.pool_size, (n,), device=device))
+        write = fill | swap
+
+        same_slot = (slots[:, None] == slots[None, :]) & write[None, :]
+        earlier = same_slot & (order[None, :] < order[:, None])
+        later = same_slot & (order[None, :] > order[:, None])
+        prev = torch.where(earlier, order[None, :], torch.full_like(earlier, -1, dtype=order.dtype)).max(1)[0]
+
+        stored = self.images[slots.to(self.images.device)].to(device, non_blocking=True)
+        swapped = torch.where((prev >= 0).view(-1, 1, 1, 1), images[prev.clamp(min=0)], stored)
+        return_images = torch.where(swap.view(-1, 1, 1, 1), swapped, images)
+
+        # only the last image written to a slot stays in it
+        kept = torch.nonzero(write & ~later.any(1)).view(-1)
+        self.images.index_copy_(0, slots[kept].to(self.images.device), images[kept].to(self.images.device))
+        self.num_imgs += n_fill
         return return_images
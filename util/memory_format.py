@@ -0,0 +1,52 @@
+import torch
+from torch.utils import _pytree as pytree
+from torch.utils._python_dispatch import TorchDispatchMode
+
+MEMORY_FORMATS = {'contiguous': torch.contiguous_format, 'channels_last': torch.channels_last}
+
+
+def is_channels_last(t):
+    return isinstance(t, torch.Tensor) and t.dim() == 4 and t.is_contiguous(memory_format=torch.channels_last)
+
+
+def is_nchw(t):
+    # dense NCHW, views like slices or expanded tensors have no layout of their own
+    return isinstance(t, torch.Tensor) and t.dim() == 4 and t.is_contiguous() and not is_channels_last(t)
+
+
+def to_memory_format(x, memory_format):
+    r""" 4-D tensors of x (a tensor, or a list / tuple / dict of them) in memory_format, other values as they are. """
+    if isinstance(x, torch.Tensor):
+        return x.contiguous(memory_format=memory_format) if x.dim() == 4 else x
+    if isinstance(x, (list, tuple)):
+        return type(x)(to_memory_format(v, memory_format) for v in x)
+    if isinstance(x, dict):
+        return type(x)((k, to_memory_format(v, memory_format)) for k, v in x.items())
+    return x
+
+
+class ChannelsLastCheck(TorchDispatchMode):
+    r""" Layout assertion mode: raises when an op takes channels_last 4-D tensors and also a dense NCHW one, or
+    returns one, so that a silent conversion back to NCHW is caught where it happens.
+    Tensors for which both layouts coincide (one channel, or a single pixel) count as channels_last.
+    """
+    def __init__(self, allowed=()):
+        super(ChannelsLastCheck, self).__init__()
+        # op names (e.g. 'aten.bmm') not checked
+        self.allowed = set(allowed)
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        out = func(*args, **(kwargs or {}))
+        name = str(func.overloadpacket)
+        # views (permute, slices, ...) alias their input and copy nothing
+        if name in self.allowed or any(r.alias_info is not None for r in func._schema.returns):
+            return out
+        inputs = pytree.tree_leaves((args, kwargs))
+        if any(is_channels_last(t) for t in inputs):
+            nchw_inputs = [tuple(t.shape) for t in inputs if is_nchw(t)]
+            if nchw_inputs:
+                raise AssertionError('%s mixes channels_last and NCHW inputs %s' % (name, nchw_inputs))
+            nchw_outputs = [tuple(t.shape) for t in pytree.tree_leaves(out) if is_nchw(t)]
+            if nchw_outputs:
+                raise AssertionError('%s returns %s out of channels_last' % (name, nchw_outputs))
+        return out
@@ -0,0 +1,257 @@
+import functools
+
+import numpy as np
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+# Every primitive is evaluated for all pixels at once on a cached pixel grid, with any number of leading
+# batch dimensions (poses, limbs, ...). Coordinates are (y, x). Inputs may be numpy arrays or torch tensors,
+# the result lives on the same backend and device.
+
+def _is_torch(x):
+    return torch is not None and isinstance(x, torch.Tensor)
+
+
+@functools.lru_cache(maxsize=32)
+def _pixel_grid(img_size, device):
+    if device is None:
+        yy = np.arange(img_size[0], dtype=np.float64)[:, np.newaxis]
+        xx = np.arange(img_size[1], dtype=np.float64)[np.newaxis, :]
+        yy.setflags(write=False)
+        xx.setflags(write=False)
+        return yy, xx
+    yy = torch.arange(img_size[0], dtype=torch.float64, device=device)[:, None]
+    xx = torch.arange(img_size[1], dtype=torch.float64, device=device)[None, :]
+    return yy, xx
+
+
+def pixel_grid(img_size, like=None):
+    r""" (h,1) row and (1,w) column coordinates, cached per image size and device.
+    Args:
+        like: a torch tensor to get the grid on its device, numpy otherwise
+    """
+    device = str(like.device) if _is_torch(like) else None
+    return _pixel_grid(tuple(int(s) for s in img_size), device)
+
+
+def _as_float(x):
+    if _is_torch(x):
+        return x.to(torch.float64)
+    return np.asarray(x, dtype=np.float64)
+
+
+def _zeros(shape, like, dtype=bool):
+    if _is_torch(like):
+        return torch.zeros(shape, dtype=torch.bool if dtype is bool else dtype, device=like.device)
+    return np.zeros(shape, dtype=dtype)
+
+
+def _xp(x):
+    return torch if _is_torch(x) else np
+
+
+def polygon_masks(vertexes, img_size, edges=False):
+    r""" Pixels inside polygons, the test of skimage.draw.polygon (pixels on the boundary count as inside).
+    Args:
+        vertexes: (..., n_vertexes, 2) in (y, x)
+        edges (bool): also count every pixel lying on an edge, as skimage.measure.grid_points_in_poly does;
+            this only changes self-intersecting polygons
+    Returns:
+        (..., h, w) bool masks
+    """
+    vertexes = _as_float(vertexes)
+    yy, xx = pixel_grid(img_size, vertexes)
+    yp = vertexes[..., 0][..., None, None]
+    xp = vertexes[..., 1][..., None, None]
+    shape = tuple(vertexes.shape[:-2]) + tuple(img_size)
+    on_vertex = _zeros(shape, vertexes)
+    on_edge = _zeros(shape, vertexes)
+    r_cross = _zeros(shape, vertexes)
+    l_cross = _zeros(shape, vertexes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(vertexes.shape[-2]):
+            j = i - 1
+            # vertexes relative to the tested pixel
+            x0, y0 = xp[..., i, :, :] - xx, yp[..., i, :, :] - yy
+            x1, y1 = xp[..., j, :, :] - xx, yp[..., j, :, :] - yy
+            on_vertex |= (x0 == 0) & (y0 == 0)
+            cross = x0 * y1 - x1 * y0
+            if edges:
+                on_edge |= (cross == 0) & (x0 * x1 <= 0) & (y0 * y1 <= 0)
+            x_inter = cross / (y1 - y0)
+            r_cross ^= ((y0 > 0) != (y1 > 0)) & (x_inter > 0)
+            l_cross ^= ((y0 < 0) != (y1 < 0)) & (x_inter < 0)
+    return on_vertex | on_edge | r_cross | l_cross
+
+
+def circle_masks(centers, radius, img_size):
+    r""" Pixels strictly inside circles, the test of skimage.draw.circle / disk.
+    Args:
+        centers: (..., 2) in (y, x)
+    Returns:
+        (..., h, w) bool masks
+    """
+    centers = _as_float(centers)
+    yy, xx = pixel_grid(img_size, centers)
+    dy = (yy - centers[..., 0][..., None, None]) / radius
+    dx = (xx - centers[..., 1][..., None, None]) / radius
+    return dy ** 2 + dx ** 2 < 1
+
+
+def line_aa_maps(fr, to, img_size):
+    r""" Anti-aliased segments between integer end points, the pixels and values of skimage.draw.line_aa:
+    the pixels of the segment's bounding box closer than 1 to its line, valued 1 - distance.
+    Pixels outside the image are dropped.
+    Args:
+        fr, to: (..., 2) end points in (y, x)
+    Returns:
+        ((..., h, w) bool, (..., h, w) float64): drawn pixels, their values (0 elsewhere)
+    """
+    fr, to = _as_float(fr), _as_float(to)
+    xp = _xp(fr)
+    yy, xx = pixel_grid(img_size, fr)
+    r0, c0 = fr[..., 0][..., None, None], fr[..., 1][..., None, None]
+    r1, c1 = to[..., 0][..., None, None], to[..., 1][..., None, None]
+    dr, dc = r1 - r0, c1 - c0
+    length = xp.sqrt(dr ** 2 + dc ** 2)
+    length = xp.where(length == 0, xp.ones_like(length), length)
+    dist = xp.abs((yy - r0) * dc - (xx - c0) * dr) / length
+    in_box = ((yy >= xp.minimum(r0, r1)) & (yy <= xp.maximum(r0, r1)) &
+              (xx >= xp.minimum(c0, c1)) & (xx <= xp.maximum(c0, c1)))
+    drawn = in_box & (dist < 1)
+    return drawn, xp.where(drawn, 1 - dist, xp.zeros_like(dist))
+
+
+def _last_drawn(masks):
+    # index along axis -3 of the last mask covering each pixel, the one painted on top
+    n = masks.shape[-3]
+    if _is_torch(masks):
+        return n - 1 - torch.argmax(torch.flip(masks, (-3,)).to(torch.uint8), -3)
+    return n - 1 - np.argmax(masks[..., ::-1, :, :], -3)
+
+
+def draw_poses(pose_joints, img_size, limb_seq, colors, radius=2, draw_joints=True, missing_value=-1):
+    r""" Stick figures of one or many poses, as drawn by draw_pose_from_cords: anti-aliased white limbs in
+    limb_seq order, then a colored circle per joint, later primitives painted over earlier ones.
+    Args:
+        pose_joints: (..., n_joints, 2) integer keypoints in (y, x)
+        limb_seq (list): (from, to) joint indexes of the limbs
+        colors (list): RGB color of every joint
+    Returns:
+        ((..., h, w, 3) uint8, (..., h, w) bool): drawings, drawn pixels
+    """
+    is_torch = _is_torch(pose_joints)
+    xp = _xp(pose_joints)
+    if not is_torch:
+        pose_joints = np.asarray(pose_joints)
+    img_size = tuple(img_size)
+    missing = (pose_joints[..., 0] == missing_value) | (pose_joints[..., 1] == missing_value)
+    shape = tuple(pose_joints.shape[:-2]) + img_size
+    value = _zeros(shape, pose_joints, np.float64 if not is_torch else torch.float64)
+    mask = _zeros(shape, pose_joints)
+
+    if draw_joints and len(limb_seq):
+        limb_seq = np.asarray(limb_seq)
+        drawn, values = line_aa_maps(pose_joints[..., limb_seq[:, 0], :], pose_joints[..., limb_seq[:, 1], :],
+                                     img_size)
+        valid = ~(missing[..., limb_seq[:, 0]] | missing[..., limb_seq[:, 1]])
+        drawn = drawn & valid[..., None, None]
+        top = _last_drawn(drawn)[..., None, :, :]
+        if is_torch:
+            value = torch.gather(values, -3, top)[..., 0, :, :]
+        else:
+            value = np.take_along_axis(values, top, -3)[..., 0, :, :]
+        mask = drawn.any(-3)
+        value = xp.where(mask, value, xp.zeros_like(value))
+
+    if is_torch:
+        image = (value * 255).to(torch.uint8)[..., None].expand(shape + (3,)).clone()
+        palette = torch.as_tensor(np.asarray(colors, dtype=np.uint8), device=pose_joints.device)
+    else:
+        image = np.repeat((value * 255).astype(np.uint8)[..., np.newaxis], 3, -1)
+        palette = np.asarray(colors, dtype=np.uint8)
+
+    joints = circle_masks(pose_joints, radius, img_size) & ~missing[..., None, None]
+    on_joint = joints.any(-3)
+    image[on_joint] = palette[_last_drawn(joints)[on_joint]]
+    return image, mask | on_joint
+
+
+def check_parity(n_poses=200, img_size=(128, 64), seed=0):
+    r""" Compare the primitives with skimage.draw / skimage.measure on random shapes,
+    return the number of pixels that differ for every primitive.
+    """
+    import skimage.draw
+    import skimage.measure
+    rng = np.random.RandomState(seed)
+    h, w = img_size
+    diff = dict(polygon=0, grid_points_in_poly=0, circle=0, line_aa=0, pose=0)
+
+    def disk(center, radius):
+        if hasattr(skimage.draw, 'disk'):
+            return skimage.draw.disk(center, radius, shape=img_size)
+        return skimage.draw.circle(center[0], center[1], radius, shape=img_size)
+
+    def draw_pose_reference(pose_joints, limb_seq, colors, radius):
+        # one primitive at a time, as draw_pose_from_cords used to
+        image = np.zeros(img_size + (3,), dtype=np.uint8)
+        mask = np.zeros(img_size, dtype=bool)
+        for f, t in limb_seq:
+            if (pose_joints[[f, t]] == -1).any():
+                continue
+            yy, xx, val = skimage.draw.line_aa(pose_joints[f][0], pose_joints[f][1], pose_joints[t][0], pose_joints[t][1])
+            image[yy, xx] = np.expand_dims(val, 1) * 255
+            mask[yy, xx] = True
+        for i, joint in enumerate(pose_joints):
+            if (joint == -1).any():
+                continue
+            yy, xx = disk(joint, radius)
+            image[yy, xx] = colors[i]
+            mask[yy, xx] = True
+        return image, mask
+
+    limb_seq = rng.randint(0, 18, (19, 2))
+    colors = rng.randint(0, 256, (18, 3))
+    poses = rng.randint(1, [h - 1, w - 1], (n_poses, 18, 2))
+    poses[rng.rand(n_poses, 18) < 0.2] = -1
+    for start in range(0, n_poses, 16):
+        images, masks = draw_poses(poses[start:start + 16], img_size, limb_seq, colors)
+        for pose_joints, image, mask in zip(poses[start:start + 16], images, masks):
+            expected_image, expected_mask = draw_pose_reference(pose_joints, limb_seq, colors, 2)
+            diff['pose'] += int((image != expected_image).any(-1).sum() + (mask != expected_mask).sum())
+
+    for _ in range(n_poses):
+        vertexes = rng.uniform(-5, max(h, w) + 5, (rng.randint(3, 7), 2))
+        if rng.rand() < 0.5:
+            vertexes = np.round(vertexes)
+        expected = np.zeros(img_size, dtype=bool)
+        expected[skimage.draw.polygon(vertexes[:, 0], vertexes[:, 1], shape=img_size)] = True
+        diff['polygon'] += int((polygon_masks(vertexes, img_size) != expected).sum())
+        expected = skimage.measure.grid_points_in_poly(img_size, vertexes)
+        diff['grid_points_in_poly'] += int((polygon_masks(vertexes, img_size, edges=True) != expected).sum())
+
+        center, radius = rng.uniform(0, h, 2), rng.randint(1, 6)
+        expected = np.zeros(img_size, dtype=bool)
+        expected[disk(center, radius)] = True
+        diff['circle'] += int((circle_masks(center, radius, img_size) != expected).sum())
+
+        # end points away from the border, skimage would index outside the image
+        fr = rng.randint(1, [h - 1, w - 1])
+        to = fr if rng.rand() < 0.05 else rng.randint(1, [h - 1, w - 1])
+        expected_value = np.zeros(img_size)
+        rr, cc, val = skimage.draw.line_aa(fr[0], fr[1], to[0], to[1])
+        expected_value[rr, cc] = val
+        drawn, value = line_aa_maps(fr, to, img_size)
+        diff['line_aa'] += int((np.abs(value - expected_value) > 1e-12).sum() + (drawn != (expected_value > 0)).sum())
+    return diff
+
+
+if __name__ == '__main__':
+    for img_size in [(128, 64), (256, 176)]:
+        diff = check_parity(img_size=img_size)
+        print('%s differing pixels %s' % (str(img_size), diff))
+        assert sum(diff.values()) == 0, 'rasterization does not match skimage'
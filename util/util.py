@@ -7,7 +7,7 @@ import numpy as np
 import os
 import collections
 
-from skimage.draw import circle, line_aa, polygon
+from util.rasterize import draw_poses
 
 # Converts a Tensor into a Numpy array
 # |imtype|: the desired type of the converted numpy array
@@ -64,29 +64,21 @@ def draw_pose_from_map(pose_map, threshold=0.1, **kwargs):
     return draw_pose_from_cords(cords, pose_map.shape[:2], **kwargs)
 
 
+def pose_transfer_visuals(input_P1, input_BP1, input_P2, input_BP2, fake_p2):
+    # source image, source pose, target image, target pose and generated image side by side
+    height, width = input_P1.size(2), input_P1.size(3)
+    vis = np.zeros((height, width*5, 3)).astype(np.uint8) #h, w, c
+    vis[:, :width, :] = tensor2im(input_P1)
+    vis[:, width:width*2, :] = draw_pose_from_map(input_BP1)[0]
+    vis[:, width*2:width*3, :] = tensor2im(input_P2)
+    vis[:, width*3:width*4, :] = draw_pose_from_map(input_BP2)[0]
+    vis[:, width*4:, :] = tensor2im(fake_p2)
+    return collections.OrderedDict([('vis', vis)])
+
+
 # draw pose from map
 def draw_pose_from_cords(pose_joints, img_size, radius=2, draw_joints=True):
-    colors = np.zeros(shape=img_size + (3, ), dtype=np.uint8)
-    mask = np.zeros(shape=img_size, dtype=bool)
-
-    if draw_joints:
-        for f, t in LIMB_SEQ:
-            from_missing = pose_joints[f][0] == MISSING_VALUE or pose_joints[f][1] == MISSING_VALUE
-            to_missing = pose_joints[t][0] == MISSING_VALUE or pose_joints[t][1] == MISSING_VALUE
-            if from_missing or to_missing:
-                continue
-            yy, xx, val = line_aa(pose_joints[f][0], pose_joints[f][1], pose_joints[t][0], pose_joints[t][1])
-            colors[yy, xx] = np.expand_dims(val, 1) * 255
-            mask[yy, xx] = True
-
-    for i, joint in enumerate(pose_joints):
-        if pose_joints[i][0] == MISSING_VALUE or pose_joints[i][1] == MISSING_VALUE:
-            continue
-        yy, xx = circle(joint[0], joint[1], radius=radius, shape=img_size)
-        colors[yy, xx] = COLORS[i]
-        mask[yy, xx] = True
-
-    return colors, mask
+    return draw_poses(pose_joints, img_size, LIMB_SEQ, COLORS, radius, draw_joints, MISSING_VALUE)
 
 
 def diagnose_network(net, name='network'):
@@ -2,12 +2,24 @@ import numpy as np
 import os
 import ntpath
 import time
+import queue
+import traceback
+import multiprocessing
 from . import util
 from . import html
 
 
+def format_errors(epoch, i, errors, t):
+    message = '(epoch: %d, iters: %d, time: %.3f) ' % (epoch, i, t)
+    for k, v in errors.items():
+        message += '%s: %.3f ' % (k, v)
+    return message
+
+
 class Visualizer():
-    def __init__(self, opt):
+    # |render|: turns a model snapshot into a dictionary of images
+    # |flush_log|: flush loss_log.txt after every line, otherwise it is flushed by flush_log()
+    def __init__(self, opt, render=util.pose_transfer_visuals, flush_log=True):
         # self.opt = opt
         self.display_id = opt.display_id
         self.use_html = opt.isTrain and not opt.no_html
@@ -15,6 +27,8 @@ class Visualizer():
         self.name = opt.name
         self.opt = opt
         self.saved = False
+        self.render = render
+        self.flush_each_line = flush_log
         if self.display_id > 0:
             import visdom
             self.vis = visdom.Visdom(port=opt.display_port)
@@ -25,13 +39,17 @@ class Visualizer():
             print('create web directory %s...' % self.web_dir)
             util.mkdirs([self.web_dir, self.img_dir])
         self.log_name = os.path.join(opt.checkpoints_dir, opt.name, 'loss_log.txt')
-        with open(self.log_name, "a") as log_file:
-            now = time.strftime("%c")
-            log_file.write('================ Training Loss (%s) ================\n' % now)
+        self.log_file = open(self.log_name, "a")
+        now = time.strftime("%c")
+        self.log_file.write('================ Training Loss (%s) ================\n' % now)
+        self.log_file.flush()
 
     def reset(self):
         self.saved = False
 
+    def display_current_snapshot(self, snapshot, epoch, save_result):
+        self.display_current_results(self.render(**snapshot), epoch, save_result)
+
     # |visuals|: dictionary of images to display or save
     def display_current_results(self, visuals, epoch, save_result):
         if self.display_id > 0:  # show images in the browser
@@ -114,13 +132,20 @@ class Visualizer():
 
     # errors: same format as |errors| of plotCurrentErrors
     def print_current_errors(self, epoch, i, errors, t):
-        message = '(epoch: %d, iters: %d, time: %.3f) ' % (epoch, i, t)
-        for k, v in errors.items():
-            message += '%s: %.3f ' % (k, v)
-
+        message = format_errors(epoch, i, errors, t)
         print(message)
-        with open(self.log_name, "a") as log_file:
-            log_file.write('%s\n' % message)
+        self.log_message(message)
+
+    def log_message(self, message):
+        self.log_file.write('%s\n' % message)
+        if self.flush_each_line:
+            self.log_file.flush()
+
+    def flush_log(self):
+        self.log_file.flush()
+
+    def close(self):
+        self.log_file.close()
 
     # save image to the disk
     def save_images(self, webpage, visuals, image_path):
@@ -143,3 +168,80 @@ class Visualizer():
             txts.append(label)
             links.append(image_name)
         webpage.add_images(ims, txts, links, width=self.win_size)
+
+
+def _visualizer_worker(opt, render, frames, messages):
+    visualizer = Visualizer(opt, render, flush_log=False)
+    running = True
+    while running:
+        # log lines and plots are never dropped, they go first
+        while True:
+            try:
+                message = messages.get_nowait()
+            except queue.Empty:
+                break
+            if message is None:
+                running = False
+                break
+            kind, args = message
+            if kind == 'log':
+                visualizer.log_message(args)
+            elif kind == 'plot':
+                try:
+                    visualizer.plot_current_errors(*args)
+                except Exception:
+                    traceback.print_exc()
+        if not running:
+            break
+        try:
+            snapshot, epoch, save_result = frames.get(timeout=0.5)
+        except queue.Empty:
+            visualizer.flush_log()
+            continue
+        try:
+            visualizer.reset()
+            visualizer.display_current_snapshot(snapshot, epoch, save_result)
+        except Exception:
+            traceback.print_exc()
+    visualizer.close()
+
+
+class AsyncVisualizer():
+    r""" Visualizer running in a background process, so that training steps never wait for it.
+    Snapshots (detached cpu tensors of the model, see get_current_snapshot) go through a bounded queue
+    and are dropped when the worker is still busy with earlier ones. The rendering, the visdom traffic,
+    the html pages and the buffered writes of loss_log.txt all happen in the worker.
+    Create it before the model and the data loader, so that the forked worker holds no CUDA context.
+    """
+    def __init__(self, opt, render=util.pose_transfer_visuals, queue_size=2):
+        self.opt = opt
+        self.dropped = 0
+        context = multiprocessing.get_context('fork')
+        self.frames = context.Queue(queue_size)
+        self.messages = context.Queue()
+        self.process = context.Process(target=_visualizer_worker, args=(opt, render, self.frames, self.messages),
+                                       daemon=True)
+        self.process.start()
+
+    def reset(self):
+        pass
+
+    def display_current_snapshot(self, snapshot, epoch, save_result):
+        try:
+            self.frames.put_nowait((snapshot, epoch, save_result))
+        except queue.Full:
+            self.dropped += 1
+
+    def plot_current_errors(self, epoch, counter_ratio, opt, errors):
+        self.messages.put(('plot', (epoch, counter_ratio, opt, dict(errors))))
+
+    def print_current_errors(self, epoch, i, errors, t):
+        message = format_errors(epoch, i, errors, t)
+        print(message)
+        self.messages.put(('log', message))
+
+    def close(self):
+        self.messages.put(None)
+        self.process.join()
+        if self.dropped > 0:
+            print('visualizer dropped %d of the displayed results' % self.dropped)